@@ -31,97 +31,107 @@ u_1 = u_0 + 2*dv
 #u = u_0 + dv
 
 
-dA = pi*(r + dr)**2 - pi*r**2
-m_dot = rho*u*dA
-print simplify(m_dot)
-print expand(dA, dr)
-#m_dot = 2*pi*r*dr*rho*u
+def derive(verbose=False):
+    show = print if verbose else (lambda *args: None)
+    show_pretty = pprint if verbose else (lambda *args: None)
+    dA = pi*(r + dr)**2 - pi*r**2
+    m_dot = rho*u*dA
+    show(simplify(m_dot))
+    show(expand(dA, dr))
+    #m_dot = 2*pi*r*dr*rho*u
 
 
-dT = m_dot * (u_1 - u_0)
+    dT = m_dot * (u_1 - u_0)
 
 
-a_prime = Symbol('a_prime', real=True)
-omega = Symbol('omega', real=True)
+    a_prime = Symbol('a_prime', real=True)
+    omega = Symbol('omega', real=True)
 
-v = Symbol('v', real=True)
+    v = Symbol('v', real=True)
 
-dT = simplify(dT)
-print("dT = {}".format(dT))  # Equivalent to 8.4
+    dT = simplify(dT)
+    show("dT = {}".format(dT))  # Equivalent to 8.4
 
 
-C_theta = 2*omega*r*a_prime # rotational wake velocity
+    C_theta = 2*omega*r*a_prime # rotational wake velocity
 
-dM = m_dot * r * C_theta
-dM = simplify(dM)
+    dM = m_dot * r * C_theta
+    dM = simplify(dM)
 
-print("dM = {}".format(dM))  # Equivalent to 8.5
+    show("dM = {}".format(dM))  # Equivalent to 8.5
+    dM_momentum = dM
 
 
 
-#phi = atan(u/v_radial)
-#phi = phi.subs(u_subs)
-#print("phi = {}".format(phi))  # Equivalent to 8.7
-phi = Symbol('phi')
+    #phi = atan(u/v_radial)
+    #phi = phi.subs(u_subs)
+    #print("phi = {}".format(phi))  # Equivalent to 8.7
+    phi = Symbol('phi')
 
-## Now get Lift and Drag
+    ## Now get Lift and Drag
 
-c = Symbol('c', real=True)  # Chord of element airfoil
-V_rel = Symbol('V_rel', real=True) # sqrt(u**2 + v_radial**2)
+    c = Symbol('c', real=True)  # Chord of element airfoil
+    V_rel = Symbol('V_rel', real=True) # sqrt(u**2 + v_radial**2)
 
-norm = rho*V_rel**2*c/2
-alpha = theta - phi
+    norm = rho*V_rel**2*c/2
+    alpha = theta - phi
 
-L = norm*C_L    # Lift Force per unit length of prop
-D = norm*C_D    # Drag Force per unit length of prop
+    L = norm*C_L    # Lift Force per unit length of prop
+    D = norm*C_D    # Drag Force per unit length of prop
 
-F_N = L*cos(phi) - D*sin(phi)
-F_T = L*sin(phi) + D*cos(phi)
+    F_N = L*cos(phi) - D*sin(phi)
+    F_T = L*sin(phi) + D*cos(phi)
 
-C_n = F_N / norm
-C_t = F_T / norm
+    C_n = F_N / norm
+    C_t = F_T / norm
 
 
-B = Symbol('B', real=True)  # Number of blades
+    B = Symbol('B', real=True)  # Number of blades
 
-# Expressions for Thrust & Torque
-dT_2 = B*F_N*dr
-dM_2 = B*F_T*r*dr
+    # Expressions for Thrust & Torque
+    dT_2 = B*F_N*dr
+    dM_2 = B*F_T*r*dr
 
 
-#dT_2 = dT_2.subs(sin(phi), u/V_rel)
-#dT_2 = dT_2.subs(cos(phi), v/V_rel)
+    #dT_2 = dT_2.subs(sin(phi), u/V_rel)
+    #dT_2 = dT_2.subs(cos(phi), v/V_rel)
 
-dT_2 = dT_2.subs(V_rel, u / sin(phi))
-dT_2 = simplify(dT_2)
+    dT_2 = dT_2.subs(V_rel, u / sin(phi))
+    dT_2 = simplify(dT_2)
 
-dM = dM.subs(u, V_rel * sin(phi))
-dM = dM.subs(V_rel, v / cos(phi))
-dM = dM.subs(v, omega*r*(1 - a_prime))
-dM = simplify(dM)
-print("Element Torque: dM")
-print python(dM)
+    dM = dM.subs(u, V_rel * sin(phi))
+    dM = dM.subs(V_rel, v / cos(phi))
+    dM = dM.subs(v, omega*r*(1 - a_prime))
+    dM = simplify(dM)
+    show("Element Torque: dM")
+    show(python(dM))
 
-print("Element Thrust: dT")
-print python(dT)
+    show("Element Thrust: dT")
+    show(python(dT))
 
-dM_2 = dM_2.subs(u, V_rel * sin(phi))
-dM_2 = dM_2.subs(V_rel, v / cos(phi))
-dM_2 = dM_2.subs(v, omega*r*(1 - a_prime))
-dM_2 = simplify(dM_2)
+    dM_2 = dM_2.subs(u, V_rel * sin(phi))
+    dM_2 = dM_2.subs(V_rel, v / cos(phi))
+    dM_2 = dM_2.subs(v, omega*r*(1 - a_prime))
+    dM_2 = simplify(dM_2)
 
-print("dT = {}".format(dT))  # Equivalent to 8.4
-print("dT_2 = {}".format(dT_2))  # Equivalent to 8.4
+    show("dT = {}".format(dT))  # Equivalent to 8.4
+    show("dT_2 = {}".format(dT_2))  # Equivalent to 8.4
 
-solnT = simplify(solve([Eq(dT, dT_2)], dv))
-pprint(solnT)
-print python(solnT)
+    solnT = [simplify(s) for s in solve(Eq(dT, dT_2), dv)]
+    show_pretty(solnT)
+    show(python(solnT))
 
-dm_calc = dM.subs([(tan(phi), u/v), (v, omega*r*(1 - a_prime))])
-print("dM = {}".format(simplify(dm_calc)))  # Equivalent to 8.4
-print("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
+    dm_calc = dM.subs([(tan(phi), u/v), (v, omega*r*(1 - a_prime))])
+    show("dM = {}".format(simplify(dm_calc)))  # Equivalent to 8.4
+    show("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
 
-solnM = simplify(solve([Eq(dM, dM_2)], a_prime))[1][0]
-pprint(solnM)
+    solnM = [simplify(s) for s in solve(Eq(dM, dM_2), a_prime)]
+    show_pretty(solnM)
 
-print python(solnM)
+    show(python(solnM))
+
+    return {'dT': dT, 'dM': dM_momentum}
+
+
+if __name__ == "__main__":
+    derive(verbose=True)
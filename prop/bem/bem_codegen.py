@@ -0,0 +1,150 @@
+'''
+    Generate ../bem_kernels.py from the BEM derivations
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    The induction, lsq (with its gradients) and element thrust and torque
+    expressions of bem_sym_converge.py and bem.sym.py are reduced with
+    common subexpression elimination and printed as NumPy functions, so
+    they work on scalars and on arrays of blade elements alike.
+
+        python3 bem_codegen.py            # Write ../bem_kernels.py
+        python3 bem_codegen.py --check    # Compare it with the expressions
+
+    optimize.py uses the generated kernels. Run this again after changing a
+    derivation (sympy is only needed here, not by the design code).
+'''
+import os
+import sys
+import importlib.util
+
+import numpy as np
+from sympy import cse, numbered_symbols, lambdify, Symbol
+from sympy.printing.numpy import NumPyPrinter
+from sympy.printing.precedence import PRECEDENCE
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+OUTPUT = os.path.join(HERE, '..', 'bem_kernels.py')
+
+
+def load(filename, name):
+    ''' A derivation script as a module (bem.sym.py isn't a valid module name) '''
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def symbols(*names):
+    return [Symbol(n, positive=True) if n == 'r' else Symbol(n, real=True) for n in names]
+
+ELEMENT = ['C_L', 'C_D', 'c', 'dv', 'a_prime', 'omega', 'r', 'dr', 'u_0', 'B']
+
+def kernels():
+    ''' (name, arguments, docstring, expressions) of every kernel '''
+    converge = load('bem_sym_converge.py', 'bem_sym_converge').derive()
+    momentum = load('bem.sym.py', 'bem_sym').derive()
+    u, u_0, dv = symbols('u', 'u_0', 'dv')
+    dT = momentum['dT'].subs(u, u_0 + dv)
+    dM = momentum['dM'].subs(u, u_0 + dv)
+    return [
+        ('induction', ELEMENT, "The dv and a_prime that C_L and C_D would induce",
+         [converge['dv'], converge['a_prime']]),
+        ('lsq', ELEMENT, "The relative squared change of (dv, a_prime) in one induction step",
+         [converge['minfun']]),
+        ('lsq_jac', ELEMENT, "Gradient of lsq with respect to (dv, a_prime), C_L and C_D held fixed",
+         [converge['dmindv'], converge['dminda']]),
+        ('lsq_coeffs', ELEMENT, "Derivatives of lsq with respect to C_L and C_D",
+         [converge['dmindcl'], converge['dmindcd']]),
+        ('lsq_all', ELEMENT, "lsq, lsq_jac and lsq_coeffs together",
+         [converge['minfun'], converge['dmindv'], converge['dminda'], converge['dmindcl'], converge['dmindcd']]),
+        ('dT', ['dv', 'r', 'dr', 'u_0', 'rho'], "Thrust of an element", [dT]),
+        ('dM', ['dv', 'a_prime', 'r', 'dr', 'omega', 'u_0', 'rho'], "Torque of an element", [dM]),
+    ]
+
+
+class KernelPrinter(NumPyPrinter):
+    ''' Integer powers as products and divisions. numpy.power is slow with a
+        float exponent, and (with libm) for cubes of negative numbers.
+    '''
+    def _print_Pow(self, expr, rational=False):
+        if expr.exp.is_Integer and expr.exp not in (0, 1, 2):
+            base = self.parenthesize(expr.base, PRECEDENCE['Mul'])
+            n = abs(int(expr.exp))
+            power = base + '**2' if n == 2 else '*'.join([base]*n)
+            return "(1/({}))".format(power) if expr.exp < 0 else "({})".format(power)
+        return super()._print_Pow(expr, rational)
+
+
+def generate(kernel):
+    name, args, doc, exprs = kernel
+    printer = KernelPrinter({'fully_qualified_modules': False, 'inline': True})
+    lines = ["def {}({}):".format(name, ', '.join(args)),
+             "    ''' {} '''".format(doc)]
+    # Written in terms of b = 1 - a_prime, (1 - a_prime)**2 and (a_prime - 1)**2
+    # are the same subexpression.
+    if 'a_prime' in args:
+        a_prime, b = symbols('a_prime', 'b')
+        exprs = [e.subs(a_prime, 1 - b) for e in exprs]
+        lines.append("    b = 1 - a_prime")
+    replacements, reduced = cse(exprs, symbols=numbered_symbols('x'), optimizations='basic')
+    for sym, expr in replacements:
+        lines.append("    {} = {}".format(sym, printer.doprint(expr)))
+    result = ', '.join(printer.doprint(e) for e in reduced)
+    lines.append("    return {}".format(result))
+    return '\n'.join(lines)
+
+
+HEADER = """'''
+    BEM kernels. Generated by bem/bem_codegen.py from bem/bem_sym_converge.py
+    and bem/bem.sym.py, don't edit.
+
+    Every argument can be a scalar or an array (of blade elements).
+'''
+from numpy import pi, sqrt
+
+"""
+
+def write(kernel_list, filename=OUTPUT):
+    with open(filename, 'w') as f:
+        f.write(HEADER)
+        f.write('\n\n'.join(generate(k) for k in kernel_list))
+        f.write('\n')
+
+
+def check(kernel_list, n=10000, seed=0):
+    ''' Largest relative difference between each generated kernel and its expressions,
+        over n random blade elements. Returns True if they all agree.
+    '''
+    sys.path.insert(0, os.path.join(HERE, '..'))
+    import bem_kernels
+    rng = np.random.RandomState(seed)
+    values = {'C_L': rng.uniform(-0.5, 1.5, n), 'C_D': rng.uniform(0.005, 0.2, n), 'c': rng.uniform(0.005, 0.03, n),
+              'dv': rng.uniform(0.5, 15, n), 'a_prime': rng.uniform(0.0, 0.3, n), 'omega': rng.uniform(300, 1500, n),
+              'r': rng.uniform(0.01, 0.15, n), 'dr': rng.uniform(0.001, 0.005, n), 'u_0': rng.uniform(0, 20, n),
+              'B': rng.choice([2.0, 3.0, 4.0], n), 'rho': np.full(n, 1.225)}
+    ok = True
+    for name, args, doc, exprs in kernel_list:
+        generated = getattr(bem_kernels, name)(*[values[a] for a in args])
+        generated = generated if isinstance(generated, tuple) else (generated,)
+        for e, g in zip(exprs, generated):
+            expected = lambdify(symbols(*args), e, 'numpy')(*[values[a] for a in args])
+            err = np.max(np.abs(g - expected)/np.maximum(np.abs(expected), 1e-300))
+            ok = ok and err < 1e-9
+            print("{:>12s} max relative difference {:.1e}".format(name, err))
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate the BEM kernels from the sympy derivations.')
+    parser.add_argument('--check', action='store_true', help="Compare the generated kernels with the expressions.")
+    args = parser.parse_args()
+
+    kernel_list = kernels()
+    if args.check:
+        sys.exit(0 if check(kernel_list) else 1)
+    write(kernel_list)
+    print("Wrote {}".format(os.path.realpath(OUTPUT)))
@@ -2,17 +2,20 @@ from sympy import *
 
 r = Symbol('r', real=True, positive=True)    # Radius
 theta = Symbol('theta', real=True)           # Element twist
-u_1 = Symbol('u_1', real=True)               # Downstream Velocity 
+u_1 = Symbol('u_1', real=True)               # Downstream Velocity
 u = Symbol('u', real=True)                   #  Velocity at prop
-u_0 = Symbol('u_0', real=True)               # Upstream Velocity 
+u_0 = Symbol('u_0', real=True)               # Upstream Velocity
 C_L = Symbol('C_L', real=True)               # Coefficient of Lift for the element
 C_D = Symbol('C_D', real=True)               # Coefficient of Drag for the element
 
 '''
   Derive expressions for the blade element momentum theory
   for a propeller blade element.
-  
+
   Reference. Hanson, Wind Turbine Aerodynamics
+
+  derive() returns the expressions that bem_codegen.py turns into the
+  kernels in ../bem_kernels.py. Run this file to print them.
 '''
 
 # Flow tube is annular at a radius r from the axis of the propeller.
@@ -20,7 +23,7 @@ rho = Symbol('rho', real=True)
 dr = Symbol('dr', real=True)
 
 '''
-    Velocity at the disk is average of u_0 and u_1. We create a dv factor that 
+    Velocity at the disk is average of u_0 and u_1. We create a dv factor that
     Expresses the blade velocity (u) and the wake velocity (u_1) in terms of the
     upstream velocity (u_0) and dv, where
     Wake velocity u_1 = u_0 + 2*dv
@@ -30,152 +33,157 @@ dv = Symbol('dv', real=True)
 u_1 = u_0 + 2*dv
 #u = u_0 + dv
 
-
-dA = pi*(r + dr)**2 - pi*r**2
-m_dot = rho*u*dA
-print simplify(m_dot)
-print expand(dA, dr)
-#m_dot = 2*pi*r*dr*rho*u
-
-
-dT = m_dot * (u_1 - u_0)
-
-
 a_prime = Symbol('a_prime', real=True)
 omega = Symbol('omega', real=True)
 
 v = Symbol('v', real=True)
 
-dT = simplify(dT)
-print("dT = {}".format(dT))  # Equivalent to 8.4
+#phi = atan(u/v_radial)
+#phi = phi.subs(u_subs)
+#print("phi = {}".format(phi))  # Equivalent to 8.7
+phi = Symbol('phi')
 
+c = Symbol('c', real=True)  # Chord of element airfoil
+V_rel = Symbol('V_rel', real=True) # sqrt(u**2 + v_radial**2)
 
-C_theta = 2*omega*r*a_prime # rotational wake velocity
+B = Symbol('B', real=True)  # Number of blades
 
-dM = m_dot * r * C_theta
-dM = simplify(dM)
 
-print("dM = {}".format(dM))  # Equivalent to 8.5
+def derive(verbose=False):
+    show = print if verbose else (lambda *args: None)
+    show_pretty = pprint if verbose else (lambda *args: None)
 
+    dA = pi*(r + dr)**2 - pi*r**2
+    m_dot = rho*u*dA
+    show(simplify(m_dot))
+    show(expand(dA, dr))
+    #m_dot = 2*pi*r*dr*rho*u
 
+    dT = m_dot * (u_1 - u_0)
+    dT = simplify(dT)
+    show("dT = {}".format(dT))  # Equivalent to 8.4
 
-#phi = atan(u/v_radial)
-#phi = phi.subs(u_subs)
-#print("phi = {}".format(phi))  # Equivalent to 8.7
-phi = Symbol('phi')
+    C_theta = 2*omega*r*a_prime # rotational wake velocity
 
-## Now get Lift and Drag
+    dM = m_dot * r * C_theta
+    dM = simplify(dM)
 
-c = Symbol('c', real=True)  # Chord of element airfoil
-V_rel = Symbol('V_rel', real=True) # sqrt(u**2 + v_radial**2)
+    show("dM = {}".format(dM))  # Equivalent to 8.5
 
-norm = rho*V_rel**2*c/2
-alpha = theta - phi
+    ## Now get Lift and Drag
 
-L = norm*C_L    # Lift Force per unit length of prop
-D = norm*C_D    # Drag Force per unit length of prop
+    norm = rho*V_rel**2*c/2
+    alpha = theta - phi
 
-F_N = L*cos(phi) - D*sin(phi)
-F_T = L*sin(phi) + D*cos(phi)
+    L = norm*C_L    # Lift Force per unit length of prop
+    D = norm*C_D    # Drag Force per unit length of prop
 
-C_n = F_N / norm
-C_t = F_T / norm
+    F_N = L*cos(phi) - D*sin(phi)
+    F_T = L*sin(phi) + D*cos(phi)
 
+    C_n = F_N / norm
+    C_t = F_T / norm
 
-B = Symbol('B', real=True)  # Number of blades
+    # Expressions for Thrust & Torque
+    dT_2 = B*F_N*dr
+    dM_2 = B*F_T*r*dr
 
-# Expressions for Thrust & Torque
-dT_2 = B*F_N*dr
-dM_2 = B*F_T*r*dr
+    #dT_2 = dT_2.subs(sin(phi), u/V_rel)
+    #dT_2 = dT_2.subs(cos(phi), v/V_rel)
 
+    #dT_2 = dT_2.subs(V_rel, u / sin(phi))
+    #dT_2 = simplify(dT_2)
 
-#dT_2 = dT_2.subs(sin(phi), u/V_rel)
-#dT_2 = dT_2.subs(cos(phi), v/V_rel)
+    #dM = dM.subs(u, V_rel * sin(phi))
+    #dM = dM.subs(V_rel, v / cos(phi))
+    #dM = dM.subs(v, omega*r*(1 - a_prime))
+    #dM = simplify(dM)
 
-#dT_2 = dT_2.subs(V_rel, u / sin(phi))
-#dT_2 = simplify(dT_2)
+    #dM_2 = dM_2.subs(u, V_rel * sin(phi))
+    #dM_2 = dM_2.subs(V_rel, v / cos(phi))
+    #dM_2 = dM_2.subs(v, omega*r*(1 - a_prime))
+    #dM_2 = simplify(dM_2)
 
-#dM = dM.subs(u, V_rel * sin(phi))
-#dM = dM.subs(V_rel, v / cos(phi))
-#dM = dM.subs(v, omega*r*(1 - a_prime))
-#dM = simplify(dM)
+    show("dT = {}".format(dT))  # Equivalent to 8.4
+    show("dT_2 = {}".format(dT_2))  # Equivalent to 8.4
 
-#dM_2 = dM_2.subs(u, V_rel * sin(phi))
-#dM_2 = dM_2.subs(V_rel, v / cos(phi))
-#dM_2 = dM_2.subs(v, omega*r*(1 - a_prime))
-#dM_2 = simplify(dM_2)
+    solnT = simplify(solveset(dT - dT_2, dv))
+    show_pretty(solnT)
 
-print("dT = {}".format(dT))  # Equivalent to 8.4
-print("dT_2 = {}".format(dT_2))  # Equivalent to 8.4
+    show("dv #########################################")
+    dv_soln = next(iter(solnT))
+    dv_soln = simplify(dv_soln.subs(V_rel, u/sin(phi)))
+    dv_soln = simplify(dv_soln.subs(tan(phi), u/v))
+    dv_soln = simplify(dv_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
+    dv_soln = dv_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
+    show(python(simplify(dv_soln)))
 
-solnT = simplify(solveset(dT - dT_2, dv))
-pprint(solnT)
+    # Now calcluate the derivative of dv wrt a_prime and dv.
 
-print("dv #########################################")
-dv_soln = next(iter(solnT))
-dv_soln = simplify(dv_soln.subs(V_rel, u/sin(phi)))
-dv_soln = simplify(dv_soln.subs(tan(phi), u/v))
-dv_soln = simplify(dv_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
-dv_soln = dv_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
-print python(simplify(dv_soln))
+    show("a_prime #########################################")
+    show("dM = {}".format(dM))  # Equivalent to 8.4
+    show("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
 
-# Now calcluate the derivative of dv wrt a_prime and dv.
+    solnM = simplify(solveset(dM - dM_2, a_prime))
+    show_pretty(solnM)
 
-print("a_prime #########################################")
-print("dM = {}".format(dM))  # Equivalent to 8.4
-print("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
+    aprime_soln = next(iter(solnM))
+    aprime_soln = simplify(aprime_soln.subs(V_rel, u/sin(phi)))
+    aprime_soln = simplify(aprime_soln.subs(tan(phi), u/v))
+    aprime_soln = simplify(aprime_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
+    aprime_soln = aprime_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
 
-solnM = simplify(solveset(dM - dM_2, a_prime))
-pprint(solnM)
+    show(simplify(aprime_soln))
 
-aprime_soln = next(iter(solnM))
-aprime_soln = simplify(aprime_soln.subs(V_rel, u/sin(phi)))
-aprime_soln = simplify(aprime_soln.subs(tan(phi), u/v))
-aprime_soln = simplify(aprime_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
-aprime_soln = aprime_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
+    show("Iterative Solution in 2 DOF")
 
-print simplify(aprime_soln)
+    minfun = ((dv - dv_soln)/dv)**2 + ((a_prime - aprime_soln)/(a_prime+0.01))**2
+    show("minfun={}".format(minfun))
 
-print("Iterative Solution in 2 DOF")
+    dmindv= (diff(minfun, dv))
+    show("dmindv={}".format(dmindv))
+    dminda= (diff(minfun, a_prime))
+    show("dminda={}".format(dminda))
 
-minfun = ((dv - dv_soln)/dv)**2 + ((a_prime - aprime_soln)/(a_prime+0.01))**2
-print "minfun={}".format(minfun)
+    # And with respect to the coefficients, for the chain rule through the polar
+    dmindcl = diff(minfun, C_L)
+    dmindcd = diff(minfun, C_D)
 
-dmindv= (diff(minfun, dv))
-print "dmindv={}".format(dmindv)
-dminda= (diff(minfun, a_prime))
-print "dminda={}".format(dminda)
+    show("Iterative Solution in 2 DOF - Fixed dv")
 
+    solnTh = simplify(solveset(dT - dT_2, c))
+    show_pretty(solnTh)
 
-print("Iterative Solution in 2 DOF - Fixed dv")
+    c_soln = next(iter(solnTh))
+    c_soln = simplify(c_soln.subs(V_rel, u/sin(phi)))
+    c_soln = simplify(c_soln.subs(tan(phi), u/v))
+    #dv_soln = simplify(dv_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
+    #dv_soln = dv_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
+    show_pretty(simplify(c_soln))
 
-solnTh = simplify(solveset(dT - dT_2, c))
-pprint(solnTh)
+    #dv_goal = Symbol('dv_goal', real=True)
 
-c_soln = next(iter(solnTh))
-c_soln = simplify(c_soln.subs(V_rel, u/sin(phi)))
-c_soln = simplify(c_soln.subs(tan(phi), u/v))
-#dv_soln = simplify(dv_soln.subs(sin(phi), u/sqrt(v**2 + u**2)))
-#dv_soln = dv_soln.subs([(u, u_0 + dv), (v, omega*r*(1 - a_prime))])
-pprint(simplify(c_soln))
+    #minfun = (dv - dv_goal)**2 + (dv - dv_soln)**2 + (a_prime - aprime_soln)**2
+    #print "minfun={}".format(minfun)
 
-#dv_goal = Symbol('dv_goal', real=True)
+    #dmindv= diff(minfun, dv)
+    #print "dmindv={}".format(dmindv)
+    #dminda= diff(minfun, a_prime)
+    #print "dminda={}".format(dminda)
+    #dmindtheta= diff(minfun, theta)
+    #print "dmindtheta={}".format(dmindtheta)
 
-#minfun = (dv - dv_goal)**2 + (dv - dv_soln)**2 + (a_prime - aprime_soln)**2
-#print "minfun={}".format(minfun)
 
-#dmindv= diff(minfun, dv)
-#print "dmindv={}".format(dmindv)
-#dminda= diff(minfun, a_prime)
-#print "dminda={}".format(dminda)
-#dmindtheta= diff(minfun, theta)
-#print "dmindtheta={}".format(dmindtheta)
+    #dm_calc = dM.subs([(tan(phi), u/v), (v, omega*r*(1 - a_prime))])
+    #print("dM = {}".format(simplify(dm_calc)))  # Equivalent to 8.4
+    #print("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
 
+    #solnM = simplify(solve([Eq(dM, dM_2)], a_prime))
+    #pprint(solnM)
 
-#dm_calc = dM.subs([(tan(phi), u/v), (v, omega*r*(1 - a_prime))])
-#print("dM = {}".format(simplify(dm_calc)))  # Equivalent to 8.4
-#print("dM_2 = {}".format(dM_2))  # Equivalent to 8.4
+    return {'dv': dv_soln, 'a_prime': aprime_soln, 'minfun': minfun,
+            'dmindv': dmindv, 'dminda': dminda, 'dmindcl': dmindcl, 'dmindcd': dmindcd}
 
-#solnM = simplify(solve([Eq(dM, dM_2)], a_prime))
-#pprint(solnM)
 
+if __name__ == "__main__":
+    derive(verbose=True)
@@ -0,0 +1,116 @@
+'''
+    BEM kernels. Generated by bem/bem_codegen.py from bem/bem_sym_converge.py
+    and bem/bem.sym.py, don't edit.
+
+    Every argument can be a scalar or an array (of blade elements).
+'''
+from numpy import pi, sqrt
+
+def induction(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' The dv and a_prime that C_L and C_D would induce '''
+    b = 1 - a_prime
+    x0 = dv + u_0
+    x1 = b*omega*r
+    x2 = (1/4)*B*c*sqrt(b**2*omega**2*r**2 + x0**2)/(pi*x0*(dr + 2*r))
+    return -x2*(C_D*x0 - C_L*x1), x2*(C_D*x1 + C_L*x0)/(omega*r)
+
+def lsq(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' The relative squared change of (dv, a_prime) in one induction step '''
+    b = 1 - a_prime
+    x0 = dv + u_0
+    x1 = b*omega*r
+    x2 = B*c*sqrt(b**2*omega**2*r**2 + x0**2)/(pi*x0*(dr + 2*r))
+    return (1/16)*(4*b - 4 + x2*(C_D*x1 + C_L*x0)/(omega*r))**2/(b - 1.01)**2 + (1/16)*(4*dv + x2*(C_D*x0 - C_L*x1))**2/dv**2
+
+def lsq_jac(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' Gradient of lsq with respect to (dv, a_prime), C_L and C_D held fixed '''
+    b = 1 - a_prime
+    x0 = dv + u_0
+    x1 = C_D*x0 - C_L*b*omega*r
+    x2 = x0**2
+    x3 = sqrt(b**2*omega**2*r**2 + x2)
+    x4 = (1/(x0))
+    x5 = (1/(pi))
+    x6 = (1/((dr + 2*r)))
+    x7 = B*c*x5*x6
+    x8 = x4*x7
+    x9 = x3*x8
+    x10 = -4*dv - x1*x9
+    x11 = (1/(omega))
+    x12 = (1/(r))
+    x13 = b - 1.01
+    x14 = (1/(x13**2))
+    x15 = omega*r
+    x16 = b*x15
+    x17 = C_D*x16 + C_L*x0
+    x18 = 4*b + x11*x12*x17*x9 - 4
+    x19 = C_L*x3
+    x20 = (1/(x3))
+    x21 = x17*x20
+    x22 = x3/x2
+    x23 = x1*x20
+    x24 = C_D*x9 + 4
+    x25 = x10/dv**2
+    return (1/8)*B*c*x11*x12*x14*x18*x5*x6*(-x17*x22 + x19*x4 + x21) - 1/8*x25*(-x1*x22*x7 + x23*x7 + x24) - 1/8*x10**2/(dv*dv*dv), -1/8*x14*x18*(x16*x21*x8 + x24) - 1/8*x15*x25*x8*(-x16*x23 + x19) + (1/8)*x18**2/(x13*x13*x13)
+
+def lsq_coeffs(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' Derivatives of lsq with respect to C_L and C_D '''
+    b = 1 - a_prime
+    x0 = dv + u_0
+    x1 = (1/(x0))
+    x2 = B*c*sqrt(b**2*omega**2*r**2 + x0**2)/(pi*(dr + 2*r))
+    x3 = x1*x2
+    x4 = (-4*dv + x3*(-C_D*x0 + C_L*b*omega*r))/dv**2
+    x5 = b*omega*r
+    x6 = 1/(omega*r)
+    x7 = (4*b + x3*x6*(C_D*x5 + C_L*x0) - 4)/(b - 1.01)**2
+    x8 = (1/8)*x2
+    return x8*(x1*x4*x5 + x6*x7), x8*(b*x1*x7 - x4)
+
+def lsq_all(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' lsq, lsq_jac and lsq_coeffs together '''
+    b = 1 - a_prime
+    x0 = (1/(dv**2))
+    x1 = 4*dv
+    x2 = dv + u_0
+    x3 = omega*r
+    x4 = b*x3
+    x5 = C_D*x2 - C_L*x4
+    x6 = (1/(pi))
+    x7 = (1/((dr + 2*r)))
+    x8 = B*c*x6*x7
+    x9 = x5*x8
+    x10 = x2**2
+    x11 = sqrt(b**2*omega**2*r**2 + x10)
+    x12 = (1/(x2))
+    x13 = x11*x12
+    x14 = b - 1.01
+    x15 = (1/(x14**2))
+    x16 = C_D*x4 + C_L*x2
+    x17 = (1/(omega))
+    x18 = (1/(r))
+    x19 = x17*x18
+    x20 = x13*x8
+    x21 = 4*b + x16*x19*x20 - 4
+    x22 = x21**2
+    x23 = -x1 - x20*x5
+    x24 = C_L*x11
+    x25 = (1/(x11))
+    x26 = x16*x25
+    x27 = x11/x10
+    x28 = x25*x5
+    x29 = C_D*x20 + 4
+    x30 = x0*x23
+    x31 = x12*x4
+    x32 = x15*x21
+    x33 = (1/8)*x11*x8
+    return (1/16)*x0*(x1 + x13*x9)**2 + (1/16)*x15*x22, (1/8)*B*c*x15*x17*x18*x21*x6*x7*(x12*x24 - x16*x27 + x26) - 1/8*x30*(-x27*x9 + x28*x8 + x29) - 1/8*x23**2/(dv*dv*dv), -1/8*x12*x3*x30*x8*(x24 - x28*x4) - 1/8*x32*(x26*x31*x8 + x29) + (1/8)*x22/(x14*x14*x14), x33*(x19*x32 + x30*x31), x33*(b*x12*x32 - x30)
+
+def dT(dv, r, dr, u_0, rho):
+    ''' Thrust of an element '''
+    return 2*pi*dr*dv*rho*(dr + 2*r)*(dv + u_0)
+
+def dM(dv, a_prime, r, dr, omega, u_0, rho):
+    ''' Torque of an element '''
+    b = 1 - a_prime
+    return -2*pi*dr*omega*r**2*rho*(b - 1)*(dr + 2*r)*(dv + u_0)
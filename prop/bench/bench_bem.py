@@ -0,0 +1,81 @@
+'''
+    Benchmark: the BEM analysis of a whole blade, element by element
+    (SLSQP with bem_iterate, or brentq in the inflow angle with bem_phi)
+    and all at once (bem_blade).
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    A blade of N ARA-D elements (default 200), twisted for 4 degrees angle of
+    attack at the hover inflow. The polars are simulated (with whatever
+    xfoil.XFOIL points at) and cached before the timings. Run it from the
+    prop directory so it uses foil_simulator.db there:
+
+        XFOIL_EXECUTABLE=./fake_xfoil.py python3 bench/bench_bem.py [N]
+'''
+import os
+import sys
+import time
+
+import numpy as np
+
+PROP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, PROP_DIR)
+import foil_ARA
+import optimize
+from blade_element import BladeElement, bem_blade
+
+RPM = 9000.0
+RADIUS = 0.12
+HUB = 0.015
+THRUST = 5.0
+B = 2
+
+
+def blade(n):
+    dr = (RADIUS - HUB)/n
+    dv = optimize.dv_from_thrust(THRUST, RADIUS, 0.0)
+    omega = optimize.rpm2omega(RPM)
+    elements = []
+    for r in HUB + dr*(np.arange(n) + 0.5):
+        f = foil_ARA.ARADFoil(chord=0.012*RADIUS/max(r, 0.04), thickness=0.1)
+        f.set_trailing_edge(0.01)
+        be = BladeElement(r, dr=dr, foil=f, twist=np.arctan(dv/(omega*r)) + np.radians(4), rpm=RPM, u_0=0.0)
+        be.dv = dv
+        elements.append(be)
+    return elements
+
+
+def scalar(elements, bem_solve=optimize.bem_iterate):
+    results = [bem_solve(be.fs, be.dv, be.get_twist(), be.rpm, be.r, be.dr, be.u_0, B) for be in elements]
+    return np.array(results).T
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    elements = blade(n)
+    bem_blade(elements, B)     # Simulate and cache the polars
+
+    start = time.time()
+    dv_s, a_s, err_s = scalar(elements)
+    t_scalar = time.time() - start
+
+    start = time.time()
+    dv_p, a_p, err_p = scalar(elements, optimize.bem_phi)
+    t_phi = time.time() - start
+
+    start = time.time()
+    dv_v, a_v, err_v = bem_blade(elements, B)
+    t_vector = time.time() - start
+
+    ok = err_v < 0.01
+    print("{} elements: element by element {:.3f} s, whole blade {:.3f} s ({:.0f}x)".format(
+        n, t_scalar, t_vector, t_scalar/t_vector))
+    print("whole blade solved {} of {} elements (lsq < 0.01), the rest fall back".format(np.sum(ok), n))
+    print("max |dv| difference {:.2e} m/s, max |a_prime| difference {:.2e}, max lsq {:.1e} (SLSQP {:.1e})".format(
+        np.max(np.abs(dv_v - dv_s)[ok]), np.max(np.abs(a_v - a_s)[ok]), np.max(err_v[ok]), np.max(err_s)))
+    print("inflow angle, element by element {:.3f} s ({:.0f}x), {} of {} elements with lsq < 0.01, max lsq {:.1e}".format(
+        t_phi, t_scalar/t_phi, np.sum(err_p < 0.01), n, np.max(err_p)))
+    print("max |dv| difference to the whole blade {:.2e} m/s, max |a_prime| difference {:.2e}".format(
+        np.max(np.abs(dv_p - dv_v)), np.max(np.abs(a_p - a_v))))
@@ -0,0 +1,156 @@
+'''
+    Benchmark: polar database lookups and inserts before and after the
+    foil_simulator_v1.sql migration (indexes, unique constraints, WAL and
+    batched inserts).
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    A synthetic database with N simulations (default 10^5) is built in a
+    temporary directory with the original schema, then migrated. A polar of
+    a foil stored under its legacy hash is then looked up by fingerprint.
+
+        python3 bench_db.py [N]
+'''
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+
+PROP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, PROP_DIR)
+import foil_simulator
+
+POINTS = 30
+RE_SPACE = np.round(np.geomspace(30000, 2e6, 20), -4)
+MACH = [0.0, 0.05, 0.1, 0.15, 0.2]
+
+
+def polar_rows(sim_id, n=POINTS):
+    alpha = np.radians(np.linspace(-30, 30, n))
+    return [(sim_id, a, 2*np.pi*a, 0.01 + a*a, 0.005, -0.05, 0.5, 0.9) for a in alpha.tolist()]
+
+
+def build(conn, n_sims):
+    ''' A database with the original schema: n_sims simulations over foils x Re x Mach '''
+    c = conn.cursor()
+    foil_simulator.run_sql_script(c, 'foil_simulator.sql')
+    per_foil = len(RE_SPACE)*len(MACH)
+    n_foils = n_sims // per_foil
+    c.executemany("INSERT INTO foil(id, hash) VALUES (?,?)",
+                  [(i + 1, "foil{:08d}".format(i)) for i in range(n_foils)])
+    sim_id = 0
+    for f in range(n_foils):
+        sims = []
+        rows = []
+        for re in RE_SPACE:
+            for ma in MACH:
+                sim_id += 1
+                sims.append((sim_id, f + 1, float(re), ma))
+                rows += polar_rows(sim_id)
+        c.executemany("INSERT INTO simulation(id, foil_id, reynolds, mach) VALUES (?,?,?,?)", sims)
+        c.executemany("INSERT INTO polar VALUES (?,?,?,?,?,?,?,?)", rows)
+    conn.commit()
+    return n_foils
+
+
+def lookups(conn, queries):
+    ''' The queries of XfoilSimulatedFoil.__init__, get_from_db and get_polars '''
+    c = conn.cursor()
+    for h, re, ma in queries:
+        foil_id = c.execute("SELECT f.id FROM foil f WHERE (f.hash=?)", (h,)).fetchone()[0]
+        c.execute("SELECT s.id FROM simulation s WHERE (s.foil_id=?) AND (s.reynolds = ?) AND (s.mach = ?)", (foil_id, re, ma))
+        sim_id = c.fetchone()[0]
+        alpha = [p[0] for p in c.execute("SELECT p.alpha, p.cl, p.cd FROM polar p WHERE (p.sim_id=?)", (sim_id,))]
+        assert len(alpha) == POINTS
+
+
+def insert_per_row(conn, foil_id, conditions):
+    ''' The original inserts: one execute (and commit) per row, id re-selected '''
+    c = conn.cursor()
+    for re, ma in conditions:
+        c.execute("INSERT INTO simulation(foil_id, reynolds, mach) VALUES (?,?, ?)", (foil_id, re, ma))
+        c.execute("SELECT id FROM simulation WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)", (foil_id, re, ma))
+        sim_id = c.fetchone()[0]
+        for row in polar_rows(sim_id):
+            c.execute("INSERT INTO polar(sim_id, alpha, cl, cd, cdp, cm, Top_Xtr, Bot_Xtr) VALUES (?,?,?,?,?,?,?,?)", row)
+            conn.commit()
+
+
+def insert_batched(conn, foil_id, conditions):
+    ''' As XfoilSimulatedFoil.store_polar: one transaction, lastrowid, executemany '''
+    for re, ma in conditions:
+        with conn:
+            c = conn.execute("INSERT INTO simulation(foil_id, reynolds, mach) VALUES (?,?, ?)", (foil_id, re, ma))
+            conn.executemany("INSERT INTO polar(sim_id, alpha, cl, cd, cdp, cm, Top_Xtr, Bot_Xtr) VALUES (?,?,?,?,?,?,?,?)",
+                             polar_rows(c.lastrowid))
+
+
+def legacy_lookup(conn):
+    ''' A polar stored under the Foil.hash() of a foil, as before fingerprints,
+        is found by an XfoilSimulatedFoil of that foil, and not by another foil
+        whose parameters round to the same hash.
+    '''
+    from foil import NACA4
+    f = NACA4(0.1, 0.12, 0.02, 0.4)
+    f.set_trailing_edge(0.001)
+    other = NACA4(0.1, 0.1234, 0.0234, 0.4)   # Rounded to 2 decimals in its hash
+    other.set_trailing_edge(0.001)
+    assert other.hash() == f.hash()
+    c = conn.execute("INSERT INTO foil(hash) VALUES (?)", (f.hash(),))
+    conn.commit()
+    insert_batched(conn, c.lastrowid, [(100000.0, 0.1)])
+    assert not foil_simulator.XfoilSimulatedFoil(other).has_polar(100000.0, 0.1)
+    assert foil_simulator.XfoilSimulatedFoil(f).has_polar(100000.0, 0.1)
+
+
+def timed(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    n_sims = int(float(sys.argv[1])) if len(sys.argv) > 1 else 100000
+    workdir = tempfile.mkdtemp(prefix='bench_db_')
+    for sql in ['foil_simulator.sql', 'foil_simulator_v1.sql']:
+        shutil.copy(os.path.join(PROP_DIR, sql), workdir)
+    os.chdir(workdir)
+    try:
+        conn = sqlite3.connect('foil_simulator.db')
+        start = time.time()
+        n_foils = build(conn, n_sims)
+        print("Built {} simulations ({} polar rows) in {:.1f} s".format(
+            n_sims, n_sims*POINTS, time.time() - start))
+
+        rng = np.random.RandomState(0)
+        queries = [("foil{:08d}".format(rng.randint(n_foils)), float(rng.choice(RE_SPACE)), MACH[rng.randint(len(MACH))])
+                   for i in range(200)]
+        new_re = np.linspace(3.1e4, 2.1e6, 50)
+        before = [timed(lookups, conn, queries),
+                  timed(insert_per_row, conn, 1, [(float(re), 0.3) for re in new_re])]
+
+        start = time.time()
+        c = conn.cursor()
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA foreign_keys=ON")
+        foil_simulator.run_sql_script(c, 'foil_simulator_v1.sql')
+        conn.commit()
+        print("Migrated in {:.1f} s".format(time.time() - start))
+
+        after = [timed(lookups, conn, queries),
+                 timed(insert_batched, conn, 2, [(float(re), 0.3) for re in new_re])]
+        legacy_lookup(conn)
+        conn.close()
+
+        print("{:>28s} {:>12s} {:>12s} {:>8s}".format("", "before (ms)", "after (ms)", "speedup"))
+        for label, n, b, a in [("lookup foil+sim+polar", len(queries), before[0], after[0]),
+                               ("insert {}-point polar".format(POINTS), len(new_re), before[1], after[1])]:
+            print("{:>28s} {:12.3f} {:12.3f} {:8.1f}".format(label, 1e3*b/n, 1e3*a/n, b/a))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
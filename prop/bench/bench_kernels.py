@@ -0,0 +1,55 @@
+'''
+    Benchmark: the generated BEM kernels (bem_kernels.py) against the
+    derivation expressions evaluated as they stand, the way the hand
+    pasted code in optimize.py used to.
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    Times one blade element (scalars) and N elements at once (arrays, default
+    10000). Needs sympy, for the expressions:
+
+        python3 bench/bench_kernels.py [N]
+'''
+import os
+import sys
+import timeit
+
+import numpy as np
+from sympy import lambdify
+
+PROP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, PROP_DIR)
+sys.path.insert(0, os.path.join(PROP_DIR, 'bem'))
+import bem_kernels
+import bem_codegen
+
+
+def elements(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return {'C_L': rng.uniform(-0.5, 1.5, n), 'C_D': rng.uniform(0.005, 0.2, n), 'c': rng.uniform(0.005, 0.03, n),
+            'dv': rng.uniform(0.5, 15, n), 'a_prime': rng.uniform(0.0, 0.3, n), 'omega': rng.uniform(300, 1500, n),
+            'r': rng.uniform(0.01, 0.15, n), 'dr': rng.uniform(0.001, 0.005, n), 'u_0': rng.uniform(0, 20, n),
+            'B': rng.choice([2.0, 3.0, 4.0], n), 'rho': np.full(n, 1.225)}
+
+
+def best(f, args, number):
+    return min(timeit.repeat(lambda: f(*args), number=number, repeat=5))/number
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    arrays = elements(n)
+    scalars = {k: float(v[0]) for k, v in arrays.items()}
+
+    print("{:>12s} {:>12s} {:>12s} {:>14s} {:>14s}".format(
+        'kernel', 'expr (us)', 'kernel (us)', 'expr N (us)', 'kernel N (us)'))
+    for name, args, doc, exprs in bem_codegen.kernels():
+        raw = lambdify(bem_codegen.symbols(*args), exprs, 'numpy')
+        kernel = getattr(bem_kernels, name)
+        s_args = [scalars[a] for a in args]
+        a_args = [arrays[a] for a in args]
+        print("{:>12s} {:12.2f} {:12.2f} {:14.0f} {:14.0f}".format(name,
+            1e6*best(raw, s_args, 2000), 1e6*best(kernel, s_args, 2000),
+            1e6*best(raw, a_args, 20), 1e6*best(kernel, a_args, 20)))
@@ -0,0 +1,60 @@
+'''
+    Benchmark: a performance map, the serial way (get_forces at every rpm and
+    airspeed, cold started, as the commented out loop in prop.py did) and with
+    Prop.performance_map.
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    Designs a prop (see bench_warm.py) and maps it over N_RPM x N_AIRSPEED
+    points. get_forces bounds each element's dv by its last solution, so the
+    serial points are each solved on a fresh copy of the designed prop, not in
+    an order dependent way.
+    Run it from the prop directory, with the polars cached or the fake XFOIL:
+
+        XFOIL_EXECUTABLE=./fake_xfoil.py python3 bench/bench_map.py [processes]
+'''
+import os
+import sys
+import copy
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from bench_warm import design, PROP_DIR
+from design_parameters import DesignParameters
+
+N_RPM = 15
+N_AIRSPEED = 6
+
+
+def serial(p, rpms, airspeeds):
+    thrust = np.zeros((len(rpms), len(airspeeds)))
+    for i, rpm in enumerate(rpms):
+        for j, u_0 in enumerate(airspeeds):
+            fresh = copy.deepcopy(p)
+            fresh.warm_starts = False
+            torque, thrust[i, j] = fresh.get_forces(rpm, u_0)
+    return thrust
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    p, rpm, first, second = design(DesignParameters(os.path.join(PROP_DIR, 'props', 'test_prop.json')), True)
+    rpms = np.linspace(rpm/3, 2*rpm, N_RPM)
+    airspeeds = np.linspace(0.0, 20.0, N_AIRSPEED)
+
+    start = time.time()
+    pmap = p.performance_map(rpms, airspeeds, processes=processes)
+    t_map = time.time() - start
+
+    start = time.time()
+    thrust = serial(p, rpms, airspeeds)
+    t_serial = time.time() - start
+
+    print("{} x {} points: serial get_forces {:.1f} s, performance_map {:.1f} s ({:.1f}x)".format(
+        N_RPM, N_AIRSPEED, t_serial, t_map, t_serial/t_map))
+    print("thrust differs by more than 1% at {} of {} points".format(
+        np.sum(np.abs(pmap['thrust'] - thrust) > 0.01*np.abs(thrust).max()), thrust.size))
@@ -0,0 +1,88 @@
+'''
+    Microbenchmark: the vectorized PLIS parser against the original
+    regex/list-of-lists implementation.
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+'''
+import os
+import re
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import xfoil
+
+
+def parse_stdout_polar_regex(lines):
+    """The original parser, kept here for comparison"""
+    def clean_split(s): return re.split(r'\s+', s.replace('\n',''))[1:]
+    # Find location of data from ---- divider
+    for i, line in enumerate(lines):
+        if re.match(r'\s*---', line):
+            dividerIndex = i
+
+    # What columns mean
+    data_header = clean_split(lines[dividerIndex-1])
+
+    # Clean info lines
+    info = ''.join(lines[dividerIndex-4:dividerIndex-2])
+    info = re.sub(r"[\r\n\s]","", info)
+    # Parse info with regular expressions
+    def p(s): return float(re.search(s, info).group(1))
+    infodict = {
+     'xtrf_top': p(r"xtrf=(\d+\.\d+)"),
+     'xtrf_bottom': p(r"\(top\)(\d+\.\d+)\(bottom\)"),
+     'Mach': p(r"Mach=(\d+\.\d+)"),
+     'Ncrit': p(r"Ncrit=(\d+\.\d+)"),
+     'Re': p(r"Re=(\d+\.\d+e\d+)")
+    }
+
+    # Extract, clean, convert to array
+    datalines = lines[dividerIndex+1:-2]
+    data_array = np.array(
+    [clean_split(dataline) for dataline in datalines], dtype='float')
+
+    return data_array, data_header, infodict
+
+
+def plis_output(n):
+    ''' Synthetic XFOIL session output with a PLIS dump of n points '''
+    lines = []
+    for a in np.linspace(-30, 30, n):
+        lines += ['\n', ' Solving BL system ...\n',
+                  '       a = {:6.3f}      CL = {:7.4f}\n'.format(a, 0.1*a),
+                  '\n', ' Point added to stored polar  1\n', '\n', '.OPERv   c>  \n']
+    lines += ['       XFOIL         Version 6.99\n', ' \n',
+              ' Calculated polar for: NACA 2215\n', ' \n',
+              ' 1 1 Reynolds number fixed          Mach number fixed         \n', ' \n',
+              ' xtrf =   1.000 (top)        1.000 (bottom)  \n',
+              ' Mach =   0.060     Re =     0.050 e 6     Ncrit =   9.000\n', ' \n',
+              '   alpha    CL        CD       CDp       CM     Top_Xtr  Bot_Xtr\n',
+              '  ------- -------- --------- --------- -------- -------- --------\n']
+    for a in np.linspace(-30, 30, n):
+        lines.append('  {:7.3f} {:8.4f} {:9.5f} {:9.5f} {:8.4f} {:8.4f} {:8.4f}\n'.format(
+            a, 0.1*a, 0.01 + 0.001*a*a, 0.005, -0.05, 0.5, 0.9))
+    lines += ['\n', '.OPERv   c>   ENDD  command not recognized.  Type a "?" for list\n']
+    return lines
+
+
+if __name__ == "__main__":
+    print("{:>8s} {:>14s} {:>14s} {:>8s}".format("points", "regex (us)", "vector (us)", "speedup"))
+    for n in [20, 60, 200, 1000, 5000]:
+        lines = plis_output(n)
+
+        old = parse_stdout_polar_regex(lines)
+        new = xfoil.parse_stdout_polar(lines)
+        assert old[1] == new[1]
+        assert old[2] == new[2]
+        for i, label in enumerate(new[1]):
+            assert np.array_equal(old[0][:, i], new[0][label])
+
+        number = max(10, 20000 // n)
+        t_old = min(timeit.repeat(lambda: parse_stdout_polar_regex(lines), number=number, repeat=5)) / number
+        t_new = min(timeit.repeat(lambda: xfoil.parse_stdout_polar(lines), number=number, repeat=5)) / number
+        print("{:8d} {:14.1f} {:14.1f} {:8.1f}".format(n, t_old*1e6, t_new*1e6, t_old / t_new))
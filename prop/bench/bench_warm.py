@@ -0,0 +1,100 @@
+'''
+    Benchmark: solver iterations with and without warm starts.
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    Designs a prop (full_optimize, then again for 5% less thrust, as the --auto
+    loop of prop.py does), and sweeps get_forces over RPM with each bem_solver.
+    Everything is done cold (Prop.warm_starts = False) and warm, and the
+    iterations counted in optimize.solver_iterations are compared. Run it from
+    the prop directory, with the polars cached or the fake XFOIL:
+
+        XFOIL_EXECUTABLE=./fake_xfoil.py python3 bench/bench_warm.py [props/test_prop.json]
+'''
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+PROP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, PROP_DIR)
+import optimize
+import motor_model
+from prop import ARADProp
+from design_parameters import DesignParameters
+
+RESOLUTION = 40
+SWEEP = np.linspace(0.6, 1.4, 17)
+
+
+class Unconverged(logging.Handler):
+    ''' Counts the elements get_forces reports as not converged '''
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if 'did not converge' in record.getMessage():
+            self.count += 1
+
+
+def counted(f, *args):
+    ''' f(*args), the solver iterations it used and the time it took '''
+    optimize.solver_iterations.clear()
+    start = time.time()
+    result = f(*args)
+    return result, dict(optimize.solver_iterations), time.time() - start
+
+
+def design(param, warm):
+    p = ARADProp(param, (param.radius - param.hub_radius)/RESOLUTION)
+    p.n_blades = param.blades
+    p.warm_starts = warm
+    m = motor_model.Motor(Kv=param.motor_Kv, I0=param.motor_no_load_current, Rm=param.motor_winding_resistance)
+    optimum_torque, optimum_rpm = m.get_Qmax(param.motor_volts)
+    first = counted(p.full_optimize, optimum_torque, optimum_rpm, param.thrust)
+    second = counted(p.full_optimize, optimum_torque, optimum_rpm, 0.95*param.thrust)
+    return p, optimum_rpm, first, second
+
+
+def sweep(p, rpm, solver, warm):
+    p.bem_solver = solver
+    p.warm_starts = warm
+    for be in p.blade_elements:
+        be.solutions = []
+    unconverged = Unconverged()
+    logging.getLogger('prop').addHandler(unconverged)
+    forces = [counted(p.get_forces, rpm*k) for k in SWEEP]
+    logging.getLogger('prop').removeHandler(unconverged)
+    iterations = {}
+    for result, its, elapsed in forces:
+        for k, n in its.items():
+            iterations[k] = iterations.get(k, 0) + n
+    return np.array([result for result, its, elapsed in forces]), iterations, sum(f[2] for f in forces), unconverged.count
+
+
+if __name__ == "__main__":
+    param = DesignParameters(sys.argv[1] if len(sys.argv) > 1 else os.path.join(PROP_DIR, 'props', 'test_prop.json'))
+
+    results = {}
+    for warm in (False, True):
+        p, rpm, first, second = design(param, warm)
+        results[warm] = p
+        label = 'warm' if warm else 'cold'
+        print("full_optimize {}: {} ({:.1f} s, torque {:.4f}, thrust {:.3f}), "
+              "then at 95% thrust {} ({:.1f} s, torque {:.4f}, thrust {:.3f})".format(label,
+            first[1], first[2], first[0][0], first[0][1], second[1], second[2], second[0][0], second[0][1]))
+
+    p = results[True]
+    for solver in ('vector', 'phi', 'scalar'):
+        cold, cold_its, cold_time, cold_failed = sweep(p, rpm, solver, False)
+        warm, warm_its, warm_time, warm_failed = sweep(p, rpm, solver, True)
+        print("get_forces over {} RPMs, {}: cold {} ({:.2f} s, {} unconverged), warm {} ({:.2f} s, {} unconverged), "
+              "max thrust difference {:.1e} N".format(len(SWEEP), solver, cold_its, cold_time, cold_failed,
+            warm_its, warm_time, warm_failed, np.max(np.abs(warm[:, 1] - cold[:, 1]))))
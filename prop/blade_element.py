@@ -31,6 +31,8 @@ class BladeElement:
         self.rpm = rpm
         self.omega = 2.0*np.pi*rpm / 60
         self.u_0 = u_0
+        self.solutions = []  # (rpm, u_0, dv, a_prime) of the BEM solutions for this chord and twist
+        self.design = None   # (dv, a_prime) of the design, see keep_design
 
     def get_zero_cl_angle(self):
         return 0.0 
@@ -39,9 +41,43 @@ class BladeElement:
 
     def set_chord(self, c):
         self.foil.modify_chord(c)
+        self.solutions = []
 
     def set_twist(self, twist):
         self._twist = twist
+        self.solutions = []
+
+    def set_operating_point(self, rpm, u_0):
+        self.rpm = rpm
+        self.omega = 2.0*np.pi*rpm / 60
+        self.u_0 = u_0
+
+    def remember(self):
+        ''' Keep the BEM solution at this operating point, for warm_start '''
+        self.solutions.append((self.rpm, self.u_0, self.dv, self.a_prime))
+
+    def keep_design(self):
+        ''' Keep the current (dv, a_prime) as the design of this element. The BEM
+            solvers take dv as their goal and overwrite it, restore_design puts
+            it back.
+        '''
+        self.design = (self.dv, self.a_prime)
+
+    def restore_design(self):
+        if self.design is not None:
+            self.set_bem(*self.design)
+
+    def warm_start(self, rpm, u_0):
+        ''' A starting (dv, a_prime) for the BEM equations at rpm and u_0, from the
+            nearest remembered solution (None if there is none). The axial speed
+            at the element is scaled with the rpm, a_prime is kept.
+        '''
+        if len(self.solutions) == 0:
+            return None
+        omega_r = 2.0*np.pi*rpm / 60 * self.r
+        distance = [abs(np.log(rpm/s_rpm)) + abs(u_0 - s_u_0)/omega_r for s_rpm, s_u_0, dv, a_prime in self.solutions]
+        s_rpm, s_u_0, dv, a_prime = self.solutions[int(np.argmin(distance))]
+        return max((s_u_0 + dv)*rpm/s_rpm - u_0, optimize.DV_MIN), a_prime
 
     def get_twist(self):
         return self._twist
@@ -54,11 +90,16 @@ class BladeElement:
     def dM(self):
         return optimize.dM(self.dv, self.a_prime, self.r, self.dr, self.omega, self.u_0, rho=1.225)
 
-    def bem(self, n_blades):
+    def bem(self, n_blades, solver='slsqp', x0=None):
+        ''' Solve the BEM equations of this element, by minimizing lsq (solver='slsqp',
+            see optimize.bem_iterate) or as an equation in the inflow angle ('phi',
+            see optimize.bem_phi), starting from x0 = (dv, a_prime) if given.
+        '''
         logger.info("bem {}".format(self))
-        dv, a_prime, err = optimize.bem_iterate(foil_simulator=self.fs, dv_goal=self.dv, \
+        bem_solve = optimize.bem_phi if solver == 'phi' else optimize.bem_iterate
+        dv, a_prime, err = bem_solve(foil_simulator=self.fs, dv_goal=self.dv, \
             theta = self._twist, rpm = self.rpm, B = n_blades, \
-            r = self.r, dr=self.dr, u_0 = self.u_0)
+            r = self.r, dr=self.dr, u_0 = self.u_0, x0=x0)
 
         self.set_bem(dv,a_prime)
         return dv, a_prime, err
@@ -118,6 +159,25 @@ class BladeElement:
         dm = self.dM()
         return "BladeElement(r={:5.3f}, twist={:5.2f}, foil[{}], dv={:4.1f}, eff={:4.1f})".format(self.r, np.degrees(self._twist), self.foil, self.dv, dt/dm)
 
+
+def bem_blade(elements, n_blades, x0=None):
+    ''' The BEM solution (dv, a_prime, err arrays) of every element at once, see
+        optimize.bem_blade. Unlike BladeElement.bem the elements aren't changed.
+        x0 is a list of starting (dv, a_prime) of the elements, or None for those
+        without one.
+    '''
+    logger.info("bem_blade {} elements".format(len(elements)))
+    if (x0 is not None) and any(x is not None for x in x0):
+        x0 = (np.array([be.dv if x is None else x[0] for be, x in zip(elements, x0)]),
+              np.array([0.01 if x is None else x[1] for x in x0]))
+    else:
+        x0 = None
+    return optimize.bem_blade([be.fs for be in elements],
+        dv_goal=np.array([be.dv for be in elements]), theta=np.array([be.get_twist() for be in elements]),
+        rpm=np.array([be.rpm for be in elements]), B=n_blades,
+        r=np.array([be.r for be in elements]), dr=np.array([be.dr for be in elements]),
+        u_0=np.array([be.u_0 for be in elements]), x0=x0)
+
 if __name__ == "__main__":
 
     f = NACA4(chord=0.1, thickness=0.15, m=0.06, p=0.4, angle_of_attack=8.0 * np.pi / 180.0)
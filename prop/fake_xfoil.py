@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+'''
+    A deterministic stand-in for the XFOIL binary.
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    This program speaks the subset of the XFOIL menu protocol that xfoil.py
+    uses (LOAD/NACA, PLOP, NORM, GDES/CADD, PCOP, OPER, VPAR, ITER, VISC, RE,
+    MACH, PACC, ALFA, ASEQ, INIT, !, PLIS, PDEL) and answers with synthetic
+    thin-airfoil polars. It allows the polar pipeline, the database cache and
+    the BEM optimizer to be profiled on a machine without XFOIL.
+
+    Point xfoil.py at it with the XFOIL_EXECUTABLE environment variable, or
+    with the --xfoil option of prop.py.
+
+    The behaviour is controlled by environment variables:
+
+        FAKE_XFOIL_LATENCY       Seconds spent solving each angle of attack (0.0)
+        FAKE_XFOIL_FAILURE_RATE  Probability that an unstalled point fails to converge (0.0)
+        FAKE_XFOIL_HANG_RATE     Probability that a point never returns (0.0)
+        FAKE_XFOIL_SEED          Seed for the failure model (0)
+
+    The same seed, airfoil and command sequence always give the same output.
+'''
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+
+LATENCY = float(os.environ.get('FAKE_XFOIL_LATENCY', '0.0'))
+FAILURE_RATE = float(os.environ.get('FAKE_XFOIL_FAILURE_RATE', '0.0'))
+HANG_RATE = float(os.environ.get('FAKE_XFOIL_HANG_RATE', '0.0'))
+SEED = int(os.environ.get('FAKE_XFOIL_SEED', '0'))
+
+
+def out(s):
+    sys.stdout.write(s)
+    sys.stdout.flush()
+
+
+class Airfoil:
+    ''' The geometric quantities the synthetic polar depends on '''
+    def __init__(self, name, thickness, camber):
+        self.name = name
+        self.thickness = thickness
+        self.camber = camber
+
+    @staticmethod
+    def from_naca(digits):
+        m = int(digits[0]) / 100.0
+        t = int(digits[2:4]) / 100.0
+        return Airfoil('NACA {}'.format(digits), t, m)
+
+    @staticmethod
+    def from_file(filename):
+        x = []
+        y = []
+        with open(filename, 'r') as f:
+            for line in f:
+                try:
+                    x0, y0 = [float(v) for v in line.split()[0:2]]
+                except (ValueError, IndexError):
+                    continue
+                x.append(x0)
+                y.append(y0)
+        x = np.array(x)
+        y = np.array(y)
+        chord = np.max(x) - np.min(x)
+        thickness = (np.max(y) - np.min(y)) / chord
+        camber = 0.5*(np.max(y) + np.min(y)) / chord
+        return Airfoil(os.path.basename(filename), thickness, camber)
+
+
+class Polar:
+    def __init__(self, airfoil, Re, Mach, ncrit):
+        self.airfoil = airfoil
+        self.Re = Re
+        self.Mach = Mach
+        self.ncrit = ncrit
+        self.points = []
+
+
+class FakeXfoil:
+
+    def __init__(self):
+        self.airfoil = None
+        self.viscous = False
+        self.Re = 0.0
+        self.Mach = 0.0
+        self.ncrit = 9.0
+        self.iterlim = 10
+        self.polars = []
+        self.active = None
+        self.last_alpha = None
+        self.attempt = 0
+        self.warm_alpha = None
+        self.lines = iter(sys.stdin.readline, '')
+
+    def next_line(self):
+        line = next(self.lines, None)
+        if line is None:
+            sys.exit(0)
+        return line.strip()
+
+    # Synthetic aerodynamics
+
+    def coefficients(self, alpha):
+        f = self.airfoil
+        a0 = -np.degrees(2.0*f.camber)
+        beta = np.sqrt(1.0 - min(self.Mach, 0.9)**2)
+        cla = 0.95*2.0*np.pi / beta
+        clmax = 0.9 + 8.0*f.camber + 2.0*min(f.thickness, 0.2) + 0.1*np.log10(self.Re / 1e5)
+        x = cla*np.radians(alpha - a0) / clmax
+        cl = clmax*np.tanh(x) - 0.4*clmax*np.sign(x)*max(0.0, abs(x) - 1.5)
+        cdf = 0.074*self.Re**-0.2*(1.0 + 2.0*f.thickness)
+        cd = cdf + 0.01*cl**2 + 1.2*np.sin(np.radians(alpha))**2*min(1.0, max(0.0, abs(x) - 1.0))
+        cdp = cd - 0.8*cdf
+        cm = -0.25*np.pi*f.camber*4.0 - 0.01*np.sin(np.radians(alpha))
+        xtr_top = np.clip(0.6 - 0.04*alpha, 0.01, 1.0)
+        xtr_bot = np.clip(0.7 + 0.04*alpha, 0.01, 1.0)
+        return cl, cd, cdp, cm, xtr_top, xtr_bot, abs(x) > 1.2
+
+    def solve(self, alpha):
+        self.last_alpha = alpha
+        key = (SEED, round(self.Re), round(self.Mach, 3), round(alpha, 3), self.attempt, self.iterlim)
+        rng = random.Random(hash(key))
+
+        if LATENCY > 0.0:
+            time.sleep(LATENCY)
+        if rng.random() < HANG_RATE:
+            time.sleep(1e6)
+
+        cl, cd, cdp, cm, xtr_top, xtr_bot, stalled = self.coefficients(alpha)
+        p_fail = FAILURE_RATE
+        if stalled:
+            # Boundary layer continuation from a nearby point makes stalled points converge more often.
+            warm = (self.warm_alpha is not None) and (abs(self.warm_alpha - alpha) <= 1.5)
+            p_fail = max(p_fail, 0.15 if warm else 0.5)
+        p_fail *= min(1.0, 100.0 / self.iterlim)
+
+        out('\n Solving BL system ...\n')
+        if rng.random() < p_fail:
+            out('\n VISCAL:  Convergence failed\n')
+            self.warm_alpha = None
+            converged = False
+        else:
+            self.warm_alpha = alpha
+            converged = True
+        out('       a = {:6.3f}      CL = {:7.4f}\n'.format(alpha, cl))
+        out('      Cm = {:7.4f}     CD = {:8.5f}   =>   CDf = {:8.5f}    CDp = {:8.5f}\n'.format(cm, cd, cd - cdp, cdp))
+        if converged and self.active is not None:
+            self.active.points.append((alpha, cl, cd, cdp, cm, xtr_top, xtr_bot))
+            out('\n Point added to stored polar {:2d}\n'.format(self.polars.index(self.active) + 1))
+
+    def alfa(self, alpha):
+        self.attempt = 0
+        self.solve(alpha)
+
+    def plis(self, polar):
+        f = polar.airfoil
+        out('\n       XFOIL         Version 6.99\n')
+        out(' \n Calculated polar for: {}\n \n'.format(f.name))
+        out(' 1 1 Reynolds number fixed          Mach number fixed         \n \n')
+        out(' xtrf =   1.000 (top)        1.000 (bottom)  \n')
+        out(' Mach = {:7.3f}     Re = {:9.3f} e 6     Ncrit = {:7.3f}\n \n'.format(polar.Mach, polar.Re / 1e6, polar.ncrit))
+        out('   alpha    CL        CD       CDp       CM     Top_Xtr  Bot_Xtr\n')
+        out('  ------- -------- --------- --------- -------- -------- --------\n')
+        for p in polar.points:
+            out('  {:7.3f} {:8.4f} {:9.5f} {:9.5f} {:8.4f} {:8.4f} {:8.4f}\n'.format(*p))
+
+    # Menus
+
+    def menu_top(self):
+        while True:
+            out('\n XFOIL   c>  ')
+            words = self.next_line().split()
+            if not words:
+                continue
+            cmd = words[0].upper()
+            if cmd == 'QUIT':
+                sys.exit(0)
+            elif cmd == 'LOAD':
+                try:
+                    self.airfoil = Airfoil.from_file(words[1])
+                    out('\n Plain airfoil file\n Enter airfoil name   s>  ')
+                    self.next_line()
+                except (IOError, IndexError):
+                    out('\n File OPEN error.  Nonexistent file\n')
+            elif cmd == 'NACA':
+                self.airfoil = Airfoil.from_naca(words[1])
+            elif cmd == 'PLOP' or cmd == 'VPAR':
+                self.menu_submenu()
+            elif cmd == 'GDES':
+                self.menu_gdes()
+            elif cmd == 'OPER':
+                self.menu_oper()
+            elif cmd in ('NORM', 'PCOP', 'PANE'):
+                pass
+            else:
+                out(' {}  command not recognized.  Type a "?" for list\n'.format(words[0]))
+
+    def menu_submenu(self):
+        while True:
+            out('\n   Option, Value   (or <Return>)    c>  ')
+            if not self.next_line():
+                return
+
+    def menu_gdes(self):
+        while True:
+            out('\n.GDES   c>  ')
+            words = self.next_line().split()
+            if not words:
+                return
+            if words[0].upper() == 'CADD':
+                for i in range(3):
+                    self.next_line()
+
+    def menu_oper(self):
+        while True:
+            out('\n.OPER{}   c>  '.format('v' if self.viscous else 'i'))
+            words = self.next_line().split()
+            if not words:
+                return
+            cmd = words[0].upper()
+            args = words[1:]
+            if cmd == 'VPAR':
+                self.menu_vpar()
+            elif cmd == 'ITER':
+                self.iterlim = int(args[0])
+            elif cmd == 'VISC':
+                self.viscous = not self.viscous
+                if self.viscous and args:
+                    self.Re = float(args[0])
+            elif cmd == 'RE':
+                self.Re = float(args[0])
+            elif cmd == 'MACH':
+                self.Mach = float(args[0])
+            elif cmd == 'INIT':
+                self.warm_alpha = None
+            elif cmd == 'PACC':
+                if self.active is None:
+                    self.next_line()
+                    self.next_line()
+                    self.active = Polar(self.airfoil, self.Re, self.Mach, self.ncrit)
+                    self.polars.append(self.active)
+                    out('\n Polar accumulation enabled\n')
+                else:
+                    self.active = None
+                    out('\n Polar accumulation disabled\n')
+            elif cmd == 'ALFA':
+                self.alfa(float(args[0]))
+            elif cmd == 'ASEQ':
+                a1, a2, da = [float(a) for a in args[0:3]]
+                da = abs(da) if a2 >= a1 else -abs(da)
+                for a in np.arange(a1, a2 + da/2, da):
+                    self.alfa(a)
+            elif cmd == '!':
+                if self.last_alpha is not None:
+                    self.attempt += 1
+                    self.solve(self.last_alpha)
+            elif cmd == 'PLIS':
+                if args:
+                    i = int(args[0]) - 1
+                    if 0 <= i < len(self.polars):
+                        self.plis(self.polars[i])
+                elif self.active is not None:
+                    self.plis(self.active)
+                elif self.polars:
+                    self.plis(self.polars[-1])
+            elif cmd == 'PDEL':
+                i = int(args[0]) if args else 1
+                if i <= 0:
+                    self.polars = []
+                elif i <= len(self.polars):
+                    del self.polars[i - 1]
+                if self.active not in self.polars:
+                    self.active = None
+            else:
+                out(' {}  command not recognized.  Type a "?" for list\n'.format(words[0]))
+
+    def menu_vpar(self):
+        while True:
+            out('\n..VPAR   c>  ')
+            words = self.next_line().split()
+            if not words:
+                return
+            if words[0].upper() == 'N':
+                self.ncrit = float(words[1])
+
+
+if __name__ == "__main__":
+    out('\n ===================================================\n')
+    out('  XFOIL Version 6.99 (fake_xfoil.py stand-in)\n')
+    out(' ===================================================\n')
+    try:
+        FakeXfoil().menu_top()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
@@ -7,11 +7,19 @@
 
 '''
 import numpy as np
+import hashlib
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Resolution (in chords) and number of stations per surface of Foil.fingerprint()
+FINGERPRINT_TOL = 1e-4
+FINGERPRINT_POINTS = 64
+
 class Foil(object):
+    # The parameters that hash() rounds to 2 decimals (see hash_is_exact)
+    HASHED = ()
+
     def __init__(self, chord, thickness):
         self.chord = chord
         self.thickness = thickness
@@ -49,7 +57,41 @@ class Foil(object):
         ''' Generate a unique hash for this foil'''
         pl, pu = self.get_shape_points(10)
         return "%s" % (np.sum(pu[1]) + np.sum(pl[1]))
+
+    def hash_is_exact(self):
+        ''' Is this the only foil of its class with its hash(). A hash that
+            rounds the parameters is shared by every foil that rounds the same
+            way, and names the one whose parameters are already round.
+        '''
+        return all([abs(float("%5.2f" % getattr(self, a)) - getattr(self, a)) < 1e-9 for a in self.HASHED])
     
+    def fingerprint(self, n=42, tol=FINGERPRINT_TOL):
+        ''' A digest of the shape of this foil, to identify its polars.
+        
+            The shape is normalized to unit chord with the leading edge at the
+            origin, each surface is resampled at FINGERPRINT_POINTS cosine
+            spaced stations, and the coordinates are quantized to tol (in
+            chords). This is a heuristic: foils that differ by much less than
+            tol, whatever their chord or class, usually share a fingerprint and
+            foils that differ by much more don't, but two foils either side of
+            a rounding boundary can get different ones however close they are.
+        '''
+        pl, pu = self.get_shape_points(n)
+        x = np.concatenate((pl[0], pu[0]))
+        y = np.concatenate((pl[1], pu[1]))
+        x_le = np.min(x)
+        c = np.max(x) - x_le
+        y_le = y[np.argmin(x)]
+
+        beta = np.linspace(0, np.pi, FINGERPRINT_POINTS)
+        x_grid = (1.0 - np.cos(beta))/2
+        quantized = []
+        for xs, ys in [pl, pu]:
+            order = np.argsort(xs)
+            ys = np.interp(x_grid, (np.asarray(xs)[order] - x_le)/c, (np.asarray(ys)[order] - y_le)/c)
+            quantized.append(np.round(ys / tol).astype(np.int32))
+        return hashlib.sha1(np.concatenate(quantized).tobytes()).hexdigest()
+
     def __repr__(self):
       return "ch=%f, a=%f" % (self.chord, self.thickness)
   
@@ -169,6 +211,7 @@ class NACA4(Foil):
     '''
     Foil generated from the NACA 4 series
     '''
+    HASHED = ('m', 'p', 'thickness', 'trailing_edge')
     
     def __init__(self, chord, thickness, m=0.0, p=0.4):
         ''' 
@@ -5,6 +5,8 @@ import numpy as np
 class ARAD_6_Foil(Foil):
     '''         ARA-D 20% AIRFOIL
     '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord):
         Foil.__init__(self,chord, chord*0.06)
 
@@ -25,6 +27,8 @@ class ARAD_6_Foil(Foil):
 class ARAD_10_Foil(Foil):
     '''         ARA-D 10% AIRFOIL
     '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord):
         Foil.__init__(self,chord, chord*0.1)
 
@@ -45,6 +49,8 @@ class ARAD_10_Foil(Foil):
 class ARAD_13_Foil(Foil):
     '''         ARA-D 13% AIRFOIL
     '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord):
         Foil.__init__(self,chord, chord*0.13)
 
@@ -65,6 +71,8 @@ class ARAD_13_Foil(Foil):
 class ARAD_20_Foil(Foil):
     '''         ARA-D 20% AIRFOIL
     '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord):
         Foil.__init__(self,chord, chord*0.2)
 
@@ -84,6 +92,8 @@ class ARAD_20_Foil(Foil):
 
 class ARADFoil_Old(Foil):
     ''' Interpolate between thickness 0.06 and 0.2 '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord, thickness):
         Foil.__init__(self,chord, thickness)
         if (self.thickness <= 0.06):
@@ -157,6 +167,8 @@ g_x1 = None
 
 class ARADFoil(Foil):
     ''' Interpolate between thickness 0.06 and 0.2 '''
+    HASHED = ('thickness', 'trailing_edge')
+
     def __init__(self, chord, thickness):
         Foil.__init__(self,chord, thickness)
         self.linterp, self.uinterp, x0, x1 = ARADFoil.load_interpolator()
@@ -16,7 +16,11 @@
 '''
 
 import xfoil
+import polar_archive
+from polar_model import PolarModel
+import time
 import numpy as np
+from collections import OrderedDict
 from scipy.optimize import brentq
 
 import logging
@@ -33,6 +37,19 @@ class SimulatedFoil:
     
     def get_cl(self, v, alpha):
       return None
+
+    def get_cl_cd(self, v, alpha):
+      ''' C_L and C_D for arrays (or scalars) of velocity and angle of attack, broadcast together '''
+      v, alpha = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(alpha, dtype=float))
+      cl = np.array([self.get_cl(vi, ai) for vi, ai in zip(v.flat, alpha.flat)]).reshape(v.shape)
+      cd = np.array([self.get_cd(vi, ai) for vi, ai in zip(v.flat, alpha.flat)]).reshape(v.shape)
+      return cl[()], cd[()]
+
+    def get_dcl_dcd(self, v, alpha, h=1e-5):
+      ''' dC_L/dalpha and dC_D/dalpha, by central differences '''
+      cl_hi, cd_hi = self.get_cl_cd(v, np.asarray(alpha) + h)
+      cl_lo, cd_lo = self.get_cl_cd(v, np.asarray(alpha) - h)
+      return (cl_hi - cl_lo)/(2*h), (cd_hi - cd_lo)/(2*h)
     
 class PlateSimulatedFoil(SimulatedFoil):
   
@@ -46,61 +63,338 @@ class PlateSimulatedFoil(SimulatedFoil):
     def get_cd(self, v, alpha):
         return 1.28 * np.sin(alpha)
 
-from random import choice
-from string import ascii_uppercase
+    def get_cl_cd(self, v, alpha):
+        v, alpha = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(alpha, dtype=float))
+        return (2.0 * np.pi * alpha)[()], (1.28 * np.sin(alpha))[()]
+
+    def get_dcl_dcd(self, v, alpha):
+        v, alpha = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(alpha, dtype=float))
+        return np.full(alpha.shape, 2.0 * np.pi)[()], (1.28 * np.cos(alpha))[()]
+
+class AdaptiveAlphaSampler:
+    '''
+    Chooses the angles of attack (degrees) to simulate for one polar.
+    
+    A coarse grid over the usual operating range is simulated first. Each
+    later round extends the range towards the limits until stall has been
+    passed (or a point failed to converge) on each side, and bisects the
+    intervals next to any point that linear interpolation of its neighbours
+    misses by more than the tolerance. That is where CL or CD is curved: near
+    stall and in the drag bucket around zero lift. Sampling stops when every
+    point is within tolerance. Each round marches out from 0 degrees through
+    the angles that have converged (see sweep).
+    '''
+    def __init__(self, coarse=np.arange(-8.0, 17.0, 4.0), limits=(-30.0, 30.0),
+                 extend_step=4.0, min_step=0.5, cl_tol=0.02, cd_tol=0.1, max_rounds=8):
+        self.coarse = coarse
+        self.limits = limits
+        self.extend_step = extend_step
+        self.min_step = min_step
+        self.cl_tol = cl_tol      # Absolute
+        self.cd_tol = cd_tol      # Relative
+        self.max_rounds = max_rounds
+        self.rounds = 0
+        self.requested = set()
+        
+    def request(self, alpha):
+        ''' Keep the new angles within the limits, return them sorted '''
+        new = set()
+        for a in np.round(alpha, 3):
+            if (a not in self.requested) and (self.limits[0] <= a <= self.limits[1]):
+                new.add(a)
+        self.requested.update(new)
+        return np.array(sorted(new))
+    
+    def initial(self):
+        return self.request(self.coarse)
+    
+    def refine(self, alpha, cl, cd):
+        ''' Angles for the next round, given the polar so far. Empty when done. '''
+        self.rounds += 1
+        if (self.rounds >= self.max_rounds) or (len(alpha) < 3):
+            return np.zeros(0)
+        order = np.argsort(alpha)
+        a = np.array(alpha)[order]
+        cl = np.array(cl)[order]
+        cd = np.array(cd)[order]
+        failed = self.requested - set(np.round(a, 3))
+        new = []
+        
+        # Extend the range until CL has turned over on each side
+        if (np.argmax(cl) == len(a) - 1) and not any(f > a[-1] for f in failed):
+            new.append(a[-1] + self.extend_step)
+        if (np.argmin(cl) == 0) and not any(f < a[0] for f in failed):
+            new.append(a[0] - self.extend_step)
+
+        # Leave-one-out error of linear interpolation, a measure of the curvature
+        h0 = a[1:-1] - a[:-2]
+        h1 = a[2:] - a[1:-1]
+        w = h0 / (h0 + h1)
+        cl_err = np.abs(cl[1:-1] - ((1.0 - w)*cl[:-2] + w*cl[2:]))
+        cd_err = np.abs(cd[1:-1] - ((1.0 - w)*cd[:-2] + w*cd[2:])) / np.abs(cd[1:-1])
+        for i in np.nonzero((cl_err > self.cl_tol) | (cd_err > self.cd_tol))[0] + 1:
+            for lo, hi in [(a[i-1], a[i]), (a[i], a[i+1])]:
+                if (hi - lo) >= 2*self.min_step:
+                    new.append(0.5*(lo + hi))
+        return self.request(new)
+
+    def sweep(self, alpha, converged):
+        ''' The angles to sweep to simulate the new angles alpha. XFOIL marches
+            out from 0 degrees on each side, starting cold at the first angle,
+            so the converged angles out to the farthest new one on each side are
+            swept again as a lead in. Their results are only for the march.
+        '''
+        alpha = np.asarray(alpha, dtype=float)
+        converged = np.asarray(converged, dtype=float)
+        lead_in = []
+        if np.any(alpha >= 0):
+            lead_in.append(converged[(converged >= 0) & (converged < alpha.max())])
+        if np.any(alpha < 0):
+            lead_in.append(converged[(converged < 0) & (converged > alpha.min())])
+        return np.union1d(np.round(alpha, 3), np.round(np.concatenate([np.zeros(0)] + lead_in), 3))
+
+
 import os
 
+import socket
 import sqlite3
 conn_global = None
+conn_pid = None
+
+DB_VERSION = 1
+
+# Seconds to wait for another process's write lock before 'database is locked'
+BUSY_TIMEOUT = 60.0
+# A claim on a condition that hasn't been refreshed for CLAIM_TIMEOUT seconds
+# belongs to a process that died, and is taken over. Waiters poll every CLAIM_POLL.
+CLAIM_TIMEOUT = 600.0
+CLAIM_POLL = 1.0
+HOST = socket.gethostname()
+
+def pid_alive(pid):
+    ''' Is a process on this host running '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def sql_statements(script):
+    ''' The complete statements of an SQL script '''
+    statement = ''
+    for line in script.splitlines(True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+def run_sql_script(c, filename):
+    with open(filename, 'r') as fd:
+        sqlFile = fd.read()
+
+    # Execute every command from the input file. An error stops the script,
+    # so that init_db doesn't mark a half migrated database as current.
+    for command in sql_statements(sqlFile):
+        logger.debug(command)
+        c.execute(command)
+
+def connect(filename='foil_simulator.db'):
+    ''' A connection to the database, that waits BUSY_TIMEOUT for locks '''
+    conn = sqlite3.connect(filename, timeout=BUSY_TIMEOUT)
+    conn.execute("PRAGMA busy_timeout = {:d}".format(int(BUSY_TIMEOUT*1000)))
+    return conn
+
+def init_db(conn):
+    ''' Create the tables in a database, and apply the migrations it hasn't had.
+        This is one transaction, so processes starting together don't both migrate.
+    '''
+    c = conn.cursor()
+    # Readers don't block the writer (and vice versa) with write-ahead logging.
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA foreign_keys=ON")
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        result = c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='foil'").fetchone()
+        if result == None:
+            logger.info("Creating Database for the first time")
+
+        # Create database tables. Every command is idempotent, so this
+        # also adds tables that are missing from an older database.
+        run_sql_script(c, 'foil_simulator.sql')
+
+        # Then the migrations that this database hasn't had, foil_simulator_v<n>.sql
+        # and/or a function in MIGRATIONS. The version is set once each has succeeded,
+        # and rolled back with it if a later one fails.
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for n in range(version + 1, DB_VERSION + 1):
+            logger.info("Migrating Database to version {}".format(n))
+            script = 'foil_simulator_v{}.sql'.format(n)
+            if os.path.exists(script):
+                run_sql_script(c, script)
+            if n in MIGRATIONS:
+                MIGRATIONS[n](c)
+            c.execute("PRAGMA user_version = {:d}".format(n))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def get_db():
+    ''' This process's connection to foil_simulator.db. A forked process (an
+        XFOIL worker, say) opens its own, rather than sharing its parent's.
+    '''
+    global conn_global, conn_pid
+    if (conn_global is None) or (conn_pid != os.getpid()):
+        conn_global = connect('foil_simulator.db')
+        conn_pid = os.getpid()
+        init_db(conn_global)
+    return conn_global
+
+# Seconds an XFOIL sweep may take. A sweep that times out is a 'timeout'
+# failure, which is retried by later runs.
+SWEEP_TIMEOUT = 120
+
+# Fewest converged points for a simulation to be accepted (and fitted)
+MIN_POLAR_POINTS = 12
+
+# Points per surface of the coordinates given to XFOIL (and fingerprinted)
+N_POINTS = 42
+
+
+def adopt_legacy_foil(c, hsh, fp):
+    ''' Re-key the foil stored under hsh, a Foil.hash() as the database used
+        before fingerprints, by the fingerprint fp of the foil it was made from.
+        If fp is already stored the two are merged, keeping its simulation at
+        each Re and Mach. Legacy hashes are rounded, so several foils can share
+        one, and only the foil it names exactly (see Foil.hash_is_exact) adopts it.
+    '''
+    legacy = c.execute("SELECT id FROM foil WHERE (hash=?)", (hsh,)).fetchone()
+    if legacy is None:
+        return
+    foil_id = legacy[0]
+    existing = c.execute("SELECT id FROM foil WHERE (hash=?)", (fp,)).fetchone()
+    if existing is None:
+        c.execute("UPDATE foil SET hash=? WHERE (id=?)", (fp, foil_id))
+    else:
+        c.execute("""DELETE FROM simulation WHERE (foil_id=?) AND
+                     (reynolds, mach) IN (SELECT reynolds, mach FROM simulation WHERE (foil_id=?))""", (foil_id, existing[0]))
+        c.execute("UPDATE simulation SET foil_id=? WHERE (foil_id=?)", (existing[0], foil_id))
+        c.execute("UPDATE failure SET foil_id=? WHERE (foil_id=?)", (existing[0], foil_id))
+        c.execute("DELETE FROM foil WHERE (id=?)", (foil_id,))
+    logger.info("Fingerprinted legacy foil '{}'".format(hsh))
+
+# Functions that migrate the database to a version, after its foil_simulator_v<n>.sql
+MIGRATIONS = {}
+
+# The Reynolds numbers that polars are simulated at
+RE_SPACE = np.round(np.geomspace(30000, 2e6, 20), -4)
+LOG_RE_SPACE = np.log(RE_SPACE)
+
+# How simulated points become C_L(alpha) and C_D(alpha). 'poly' is a polynomial
+# of degree 9 (or a third of the number of points, if less), used within the
+# simulated range of angles. 'pchip' is a
+# PolarModel, with a post-stall extension to +-180 degrees.
+POLAR_MODEL = 'poly'
+
+# Interpolate C_L and C_D in log Re towards the polar on the far side of the
+# Reynolds number, when it has been simulated, rather than using the nearest one.
+INTERPOLATE = False
+
+
+class PolarCache:
+    '''
+    A size bounded LRU cache of fitted polars, shared by every simulator in
+    the process. Keys are (foil hash, Re, Mach, polar model), so identical
+    foils at different radii (or in different BladeElements) share one fit.
+    Like the database, the key has no Ncrit: a stored polar is used whatever
+    Ncrit it was simulated at. Values are ([cl, cd], (alpha_min, alpha_max),
+    [dcl, dcd]).
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key):
+        ''' Look up without counting or touching the LRU order '''
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        return self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return "PolarCache: {} of {} entries, {} hits, {} misses, {} evictions".format(
+            len(self.entries), self.maxsize, self.hits, self.misses, self.evictions)
+
+polar_cache = PolarCache()
+
+# is_available's answers, by (hash, reynolds, Ma). store_polar forgets the ones it changes.
+polar_available = {}
 
 class XfoilSimulatedFoil(PlateSimulatedFoil):
+    '''
+        iterlim, ncrit   -> XFOIL settings for new simulations
+        retry_failed     -> Retry angles that failed before, unless they failed with these settings
+        polar_model      -> 'poly' or 'pchip' (see POLAR_MODEL, the default)
+        interpolate      -> Interpolate between polars (see INTERPOLATE, the default)
+    '''
   
-    def __init__(self, foil):
+    def __init__(self, foil, iterlim=200, ncrit=6, retry_failed=False, polar_model=None, interpolate=None):
         SimulatedFoil.__init__(self, foil)
-        self.hash = foil.hash()
-        conn = self.get_db()
-        c = conn.cursor()
-        result = c.execute("SELECT f.id FROM foil f WHERE (f.hash=?)", (self.hash,)).fetchone()
-        if result == None:
-            c.execute("INSERT INTO foil(hash) VALUES (?)", (self.hash,))
-            c.execute("SELECT id FROM foil WHERE (hash=?)", (self.hash,))
-            self.foil_id = c.fetchone()[0]
-            logger.info("Creating Foil In Database, %s, id=%d" % (foil, self.foil_id))
+        self.iterlim = iterlim
+        self.ncrit = ncrit
+        self.retry_failed = retry_failed
+        self.polar_model = polar_model or POLAR_MODEL
+        self.interpolate = INTERPOLATE if interpolate is None else interpolate
+        # Beyond this angle of attack C_L and C_D are those of a plate. The pchip
+        # model has its own post-stall extension.
+        if self.polar_model == 'pchip':
+            self.alpha_limit = np.pi
         else:
-            self.foil_id = result[0]
-        conn.commit()
-        #conn.close()
-        self.polar_poly_cache = {}
+            self.alpha_limit = np.radians(30)
+        self.hash = foil.fingerprint(n=N_POINTS)
+        conn = self.get_db()
+        with conn:
+            if foil.hash_is_exact():
+                adopt_legacy_foil(conn, foil.hash(), self.hash)
+            c = conn.execute("INSERT INTO foil(hash) VALUES (?) ON CONFLICT(hash) DO NOTHING", (self.hash,))
+            if c.rowcount == 1:
+                self.foil_id = c.lastrowid
+                logger.info("Creating Foil In Database, %s, id=%d" % (foil, self.foil_id))
+            else:
+                self.foil_id = conn.execute("SELECT f.id FROM foil f WHERE (f.hash=?)", (self.hash,)).fetchone()[0]
 
     def get_db(self):
-        global conn_global
-        if conn_global is None:
-            conn_global = sqlite3.connect('foil_simulator.db')
-            c = conn_global.cursor()
-            result = c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='foil'").fetchone()
-            if result == None:
-                # Create database tables
-                logger.info("Creating Database for the first time")
-                fd = open('foil_simulator.sql', 'r')
-                sqlFile = fd.read()
-                fd.close()
-
-                # all SQL commands (split on ';')
-                sqlCommands = sqlFile.split(';')
-
-                # Execute every command from the input file
-                for command in sqlCommands:
-                    # This will skip and report errors
-                    # For example, if the tables do not yet exist, this will skip over
-                    # the DROP TABLE commands
-                    try:
-                        logger.info(command)
-                        c.execute(command)
-                    except sqlite3.OperationalError as msg:
-                        print("Command skipped: ", msg)
-            conn_global.commit()
-
-        return conn_global
+        return get_db()
     
     def get_zero_cl_angle(self, v):
         cl, cd = self.get_polars(v)
@@ -111,20 +405,144 @@ class XfoilSimulatedFoil(PlateSimulatedFoil):
         return zero
         
 
+    def get_polar_range(self, v):
+        ''' The (min, max) angle of attack of the polar for velocity v '''
+        self.get_polars(v)
+        entry = polar_cache.peek(self.polar_key(self.get_reynolds(v), self.get_mach(v)))
+        return entry[1] if entry is not None else (-np.inf, np.inf)
+
+    def in_polar_range(self, v, alpha):
+        ''' Is alpha within the simulated range of the polar for velocity v '''
+        a_min, a_max = self.get_polar_range(v)
+        return (a_min <= alpha <= a_max)
+
+    def plate(self, v, alpha):
+        ''' Does get_cl give the flat plate values, whatever the polar '''
+        return (self.foil.Mach(v) > 0.97) | (np.abs(alpha) > self.alpha_limit) | (self.foil.Reynolds(v) < 30000)
+
     def get_cl(self, v, alpha):
-        Ma = self.foil.Mach(v)
-        if (Ma > 0.97 or abs(alpha) > np.radians(30) or (self.foil.Reynolds(v) < 30000)):
-            return 2.0 * np.pi * alpha
-        cl, cd = self.get_polars(v)
-        return cl(alpha)
+        return self.point_values(v, alpha)[0]
 
     def get_cd(self, v, alpha):
-        Ma = self.foil.Mach(v)
-        if (Ma > 0.97 or abs(alpha) > np.radians(30) or (self.foil.Reynolds(v) < 30000)):
-            return 1.28 * np.sin(alpha)
+        return self.point_values(v, alpha)[1]
 
-        cl, cd = self.get_polars(v)
-        return cd(alpha)
+    def get_dcl_dcd(self, v, alpha):
+        ''' dC_L/dalpha and dC_D/dalpha at a point, from the derivatives of the
+            fitted polars (or of the plate, where get_cl gives the plate values)
+        '''
+        return self.point_values(v, alpha, derivs=True)
+
+    def point_values(self, v, alpha, derivs=False):
+        ''' C_L and C_D (or their derivatives) at a point '''
+        if self.plate(v, alpha):
+            if derivs:
+                return 2.0 * np.pi, 1.28 * np.cos(alpha)
+            return 2.0 * np.pi * alpha, 1.28 * np.sin(alpha)
+        cl = 0.0
+        cd = 0.0
+        for reynolds, Ma, w in self.get_corners(v):
+            c_l, c_d = self.corner_values(reynolds, Ma, alpha, derivs)
+            cl += w*c_l
+            cd += w*c_d
+        return cl, cd
+
+    def get_cl_cd(self, v, alpha):
+        ''' C_L and C_D for arrays of velocity and angle of attack, broadcast together.
+            The points are grouped by the polars they come from (see get_corners),
+            and each group is evaluated with one call to each polar. Points that
+            get_cl would give the flat plate values get them here too.
+        '''
+        v, alpha = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(alpha, dtype=float))
+        if v.ndim == 0:
+            # Grouping costs more than it saves for a single point
+            return self.point_values(v[()], alpha[()])
+        cl = np.array(2.0 * np.pi * alpha)
+        cd = np.array(1.28 * np.sin(alpha))
+
+        simulated = ~self.plate(v, alpha)
+        if not np.any(simulated):
+            return cl[()], cd[()]
+
+        keys = self.polar_groups(v)
+        for k in np.unique(keys[simulated]):
+            group = simulated & (keys == k)
+            cl[group] = 0.0
+            cd[group] = 0.0
+            for reynolds, Ma, w in self.get_corners(v[group]):
+                c_l, c_d = self.corner_values(reynolds, Ma, alpha[group])
+                cl[group] += w*c_l
+                cd[group] += w*c_d
+        return cl[()], cd[()]
+
+    def polar_groups(self, v):
+        ''' An integer for each velocity, the same for those that get_corners
+            gives the same polars
+        '''
+        Re = self.foil.Reynolds(v)
+        ma_q = np.round(np.round(self.foil.Mach(v)*2, 1)*10).astype(int)
+        # Quantize as get_reynolds and get_mach do
+        re_idx = np.argmin(np.abs(RE_SPACE - Re[..., np.newaxis]), axis=-1)
+        if self.interpolate:
+            side = np.searchsorted(LOG_RE_SPACE, np.log(Re))
+            return (side*1000 + re_idx)*1000 + ma_q
+        return re_idx*1000 + ma_q
+
+    def get_corners(self, v):
+        ''' The (reynolds, Ma, weight) of the polars that C_L and C_D at velocities v
+            (all in one of the polar_groups) are a weighted sum of.
+
+            Always at the nearest Mach number. Without interpolation, the nearest
+            polar. With it, also the polar on the far side of the Reynolds number
+            if that has been simulated, weighted linearly in log Re. Only the
+            nearest polar is ever simulated here.
+        '''
+        v0 = np.ravel(v)[0]
+        reynolds, Ma = self.get_reynolds(v0), self.get_mach(v0)
+        if not self.interpolate:
+            return [(reynolds, Ma, 1.0)]
+
+        log_re = np.log(self.foil.Reynolds(v))
+        i = np.clip(np.searchsorted(LOG_RE_SPACE, np.ravel(log_re)[0]), 1, len(RE_SPACE) - 1)
+        t = np.clip((log_re - LOG_RE_SPACE[i-1]) / (LOG_RE_SPACE[i] - LOG_RE_SPACE[i-1]), 0.0, 1.0)
+        re_lo, re_hi = RE_SPACE[i-1], RE_SPACE[i]
+        far = re_hi if reynolds == re_lo else re_lo
+        if (reynolds not in (re_lo, re_hi)) or not self.is_available(far, Ma):
+            return [(reynolds, Ma, 1.0)]
+        return [(re_lo, Ma, 1 - t), (re_hi, Ma, t)]
+
+    def is_available(self, reynolds, Ma):
+        ''' has_polar, remembered until store_polar stores it '''
+        if polar_cache.peek(self.polar_key(reynolds, Ma)) is not None:
+            return True
+        key = (self.hash, float(reynolds), float(Ma))
+        if key not in polar_available:
+            polar_available[key] = self.has_polar(reynolds, Ma)
+        return polar_available[key]
+
+    def corner_values(self, reynolds, Ma, alpha, derivs=False):
+        ''' C_L and C_D (or their derivatives) of the polar at (reynolds, Ma), and
+            of the plate outside its range of alpha
+        '''
+        key = self.polar_key(reynolds, Ma)
+        entry = polar_cache.get(key)
+        if entry is None:
+            self.get_polars_at(reynolds, Ma)
+            entry = polar_cache.peek(key)
+        fns, (a_min, a_max), dfns = entry
+        if derivs:
+            fns = dfns
+        if np.ndim(alpha) == 0:
+            if a_min <= alpha <= a_max:
+                return fns[0](alpha), fns[1](alpha)
+            if derivs:
+                return 2.0 * np.pi, 1.28 * np.cos(alpha)
+            return 2.0 * np.pi * alpha, 1.28 * np.sin(alpha)
+        inside = (alpha >= a_min) & (alpha <= a_max)
+        if derivs:
+            return (np.where(inside, fns[0](alpha), 2.0 * np.pi)[()],
+                    np.where(inside, fns[1](alpha), 1.28 * np.cos(alpha))[()])
+        return (np.where(inside, fns[0](alpha), 2.0 * np.pi * alpha)[()],
+                np.where(inside, fns[1](alpha), 1.28 * np.sin(alpha))[()])
 
     def get_mach(self, velocity):
         # Round the Mach number to the neares 0.05
@@ -133,9 +551,8 @@ class XfoilSimulatedFoil(PlateSimulatedFoil):
     
     def get_reynolds(self, velocity):
         Re = self.foil.Reynolds(velocity)
-        re_space = np.round(np.geomspace(30000, 2e6, 20), -4)
-        idx = np.argmin(abs(re_space - Re))
-        reynolds = re_space[idx] # np.round(Re, -4)  # Round to nearest 1000
+        idx = np.argmin(abs(RE_SPACE - Re))
+        reynolds = RE_SPACE[idx] # np.round(Re, -4)  # Round to nearest 1000
 
         if (reynolds < 30000.0):
             reynolds = 30000.0
@@ -154,147 +571,96 @@ class XfoilSimulatedFoil(PlateSimulatedFoil):
         conn.commit()
         return sim_id
             
+    def get_polar_from_db(self, velocity, reynolds, Ma):
+        ''' The (alpha, cl, cd) lists of a stored polar, or None '''
+        sim_id = self.get_from_db(velocity, reynolds, Ma)
+        if (sim_id == None):
+            return None
+        conn = self.get_db()
+        c = conn.cursor()
+        logger.info("retrieving from database sim_id=%d, %f" % (sim_id, reynolds))
+        alpha = []
+        cl = []
+        cd = []
+        for pol in c.execute("SELECT p.alpha, p.cl, p.cd FROM polar p WHERE (p.sim_id=?)", (sim_id,)):
+            alpha.append(pol[0])
+            cl.append(pol[1])
+            cd.append(pol[2])
+        conn.commit()
+        if (len(alpha) < MIN_POLAR_POINTS):
+            logger.info("Cleaning up simulation with only {} points.".format(len(alpha)))
+            c.execute("DELETE FROM simulation WHERE (id=?)", (sim_id,))
+            conn.commit()
+            return None
+        return alpha, cl, cd
+
+    def polar_key(self, reynolds, Ma):
+        ''' The key of a fitted polar in the process-wide polar_cache '''
+        return (self.hash, float(reynolds), float(Ma), self.polar_model)
+
+    def fit(self, alpha, cl, cd):
+        ''' The cache entry for the polar through the simulated points '''
+        if self.polar_model == 'pchip':
+            model = PolarModel(alpha, cl, cd)
+            return ([model.cl, model.cd], (-np.inf, np.inf), [model.dcl, model.dcd])
+        # The adaptive samples are uneven, a high degree would oscillate between them
+        degree = min(9, len(alpha)//3)
+        cl_poly = np.poly1d(np.polyfit(alpha, cl, degree))
+        cd_poly = np.poly1d(np.polyfit(alpha, cd, degree))
+        return ([cl_poly, cd_poly], (np.min(alpha), np.max(alpha)), [cl_poly.deriv(), cd_poly.deriv()])
+
     def get_polars(self, velocity):
-        
-        reynolds = self.get_reynolds(velocity)
-        Ma = self.get_mach(velocity)
-        
-        re_str = str(reynolds)
-        if re_str in self.polar_poly_cache:
-            return self.polar_poly_cache[re_str]
+        return self.get_polars_at(self.get_reynolds(velocity), self.get_mach(velocity))
 
-        # Check if we're in the databse
-        sim_id = self.get_from_db(velocity, reynolds, Ma)
-        if (sim_id != None):
-            conn = self.get_db()
-            c = conn.cursor()
-            logger.info("retrieving from database sim_id=%d, %f" % (sim_id, reynolds))
-            alpha = []
-            cl = []
-            cd = []
-            for pol in c.execute("SELECT p.alpha, p.cl, p.cd FROM polar p WHERE (p.sim_id=?)", (sim_id,)):
-                alpha.append(pol[0])
-                cl.append(pol[1])
-                cd.append(pol[2])
-            if (len(alpha) > 20):
-                
-                cl_poly = np.poly1d(np.polyfit(alpha, cl, 9))
-                cd_poly = np.poly1d(np.polyfit(alpha, cd, 9))
-                conn.commit()
-                #conn.close()
-                
-                #if (False):
-                    #import matplotlib.pyplot as plt
-                    #plt.plot(np.degrees(alpha), cl_poly(np.array(alpha)), label='Cl fit')
-                    #plt.plot(np.degrees(alpha), cl, 'x', label='Cl')
-                    #plt.plot(np.degrees(alpha), cd, 'o', label='Cd')
-                    #plt.plot(np.degrees(alpha), np.array(cl)/np.array(cd), label='Cl/Cd')
-                    #plt.legend()
-                    #plt.grid(True)
-                    #plt.xlabel('Angle of Attack')
-                    #plt.title('{}'.format(self.foil))
-                    #plt.show()
-
-                self.polar_poly_cache[re_str] =  [cl_poly, cd_poly]
-
-                return [cl_poly, cd_poly]
-            else:
-                logger.info("Cleaning up simulation with only {} points.".format(len(alpha)))
-                c.execute("DELETE FROM simulation WHERE (id=?)", (sim_id,))
-                conn.commit()
-            
-        self.xfoil_simulate_polars(reynolds, Ma)
-        if (False):
-            logger.info("Simulating Foil {}, at Re={} Ma={:5.2f}".format(self.foil, reynolds, Ma))
-        
-            ''' Use XFOIL to simulate the performance of this get_shape
-            '''
-        
-            #n_points = int(101.0*self.foil.chord / self.foil.trailing_edge) + 30
-            #n_points = min(81.0, n_points)
-            #n_points = max(61, n_points)
-            n_points = 43
-            logger.info("N Points = %d" % n_points)
-            
-            pl, pu = self.foil.get_shape_points(n=n_points)
-            ''' This contains only the X,Y coordinates, which run from the 
-                trailing edge, round the leading edge, back to the trailing edge 
-                in either direction:
-            '''
-            xcoords = np.concatenate((pl[0][::-1], pu[0]), axis=0)
-            ycoords = np.concatenate((pl[1][::-1], pu[1]), axis=0)
-            
-            # Chop off overhang.
-            limit = xcoords <= xcoords[0]
-            xcoords = xcoords[limit]
-            ycoords = ycoords[limit]
-            if (False):
-                xcoords = np.append(xcoords, xcoords[0] )
-                ycoords = np.append(ycoords, ycoords[0] )
-            #if (False):
-                #xcoords = np.append(xcoords, xcoords[0] )
-                #ycoords = np.append(ycoords, ycoords[-1] )
+    def has_polar(self, reynolds, Ma):
+        ''' Is the polar at (reynolds, Ma) available without simulating it '''
+        return ((polar_cache.peek(self.polar_key(reynolds, Ma)) is not None) or
+                (polar_archive.lookup(self.hash, reynolds, Ma) is not None) or
+                (self.get_from_db(None, reynolds, Ma) is not None))
+
+    def get_polars_at(self, reynolds, Ma):
+        ''' The fitted [cl, cd] polar at a quantized (reynolds, Ma), simulated if need be '''
+        key = self.polar_key(reynolds, Ma)
+        entry = polar_cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+        # Check if we're in the polar archive (zero-copy), then the databse
+        archived = polar_archive.lookup(self.hash, reynolds, Ma)
+        if archived is not None:
+            alpha = archived['alpha']
+            cl = archived['cl']
+            cd = archived['cd']
+        else:
+            alpha = self.get_polar_from_db(None, reynolds, Ma)
+            if alpha is not None:
+                alpha, cl, cd = alpha
+        if (alpha is not None):
+            entry = self.fit(alpha, cl, cd)
+            polar_cache.put(key, entry)
+
+            return entry[0]
             
-            coordslist = np.array((xcoords, ycoords)).T
-            coordstrlist = ["{:.6f} {:.6f}".format(coord[0], coord[1])
-                            for coord in coordslist]
-            # Join with linebreaks in between
-            points = '\n'.join(coordstrlist)
-
-            # Save points to a file
-            randstr = ''.join(choice(ascii_uppercase) for i in range(20))
-            filename = "parsec_{}.dat".format(randstr)
-            with open(filename, 'w') as af:
-                af.write(points)
-                
-            # Let Xfoil do its magic
-            alfa = np.arange(-30, 30, 1.0)
-            polar = xfoil.get_polars(filename, alfa, reynolds, Mach=Ma,
-                                            iterlim=200, normalize=True)
-            #print polar.keys()
-            os.remove(filename)
-                    
-            cl = np.array(polar['CL'])
-            cd = np.array(polar['CD'])
-            cdp = np.array(polar['CDp'])
-            cm = np.array(polar['CM'])
-            top_xtr = np.array(polar['Top_Xtr'])
-            bot_xtr = np.array(polar['Bot_Xtr'])
-            alfa = np.radians(polar['alpha'])
-            if len(alfa) < 5:
-                logger.warning("Foil didn't simulate.")
-                # Try modifying things.
-                alpha = np.radians(np.linspace(-40, 40, 20))
-                cl = 2.0 * np.pi * alpha
-                cd = 1.28 * np.sin(alpha)
-                cl_poly = np.poly1d(np.polyfit(alpha, cl, 4))
-                cd_poly = np.poly1d(np.polyfit(alpha, cd, 4))
-                return [cl_poly, cd_poly]
-            else:
-                # Insert into database
-                conn = self.get_db()
-                c = conn.cursor()
-                c.execute("INSERT INTO simulation(foil_id, reynolds, mach) VALUES (?,?, ?)", (self.foil_id, reynolds, Ma))
-                c.execute("SELECT id FROM simulation WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)", (self.foil_id, reynolds, Ma ))
-                sim_id = c.fetchone()[0]
-
-                for i, a in enumerate(alfa):
-                    c.execute("INSERT INTO polar(sim_id, alpha, cl, cd, cdp, cm, Top_Xtr, Bot_Xtr) VALUES (?,?,?,?,?,?,?,?)", 
-                            (sim_id, a, cl[i], cd[i], cdp[i], cm[i], top_xtr[i], bot_xtr[i]))
-                conn.commit()
+        fallback = self.xfoil_simulate_polars(reynolds, Ma)
+        if fallback is not None:
+            self.cache_fallback(reynolds, Ma, fallback)
+            return fallback
         
-        return self.get_polars(velocity)
+        return self.get_polars_at(reynolds, Ma)
 
-    def xfoil_simulate_polars(self, reynolds, Ma):
-        logger.info("Simulating Foil {}, at Re={} Ma={:5.2f}".format(self.foil, reynolds, Ma))
-    
-        ''' Use XFOIL to simulate the performance of this get_shape
+    def cache_fallback(self, reynolds, Ma, fallback):
+        ''' Cache the flat plate polar of a condition that didn't simulate. It isn't
+            stored, the failures are, so later runs skip the doomed points.
         '''
-        
+        polar_cache.put(self.polar_key(reynolds, Ma),
+                        (fallback, (np.radians(-30.0), np.radians(30.0)), [p.deriv() for p in fallback]))
+
+    def airfoil_file(self):
+        ''' Stage the coordinates of this foil for XFOIL, returning the filename '''
         #n_points = int(101.0*self.foil.chord / self.foil.trailing_edge) + 30
         #n_points = min(81.0, n_points)
         #n_points = max(61, n_points)
-        n_points = 42
+        n_points = N_POINTS
         logger.info("N Points = %d" % n_points)
         
         pl, pu = self.foil.get_shape_points(n=n_points)
@@ -309,12 +675,6 @@ class XfoilSimulatedFoil(PlateSimulatedFoil):
         limit = xcoords <= xcoords[0]
         xcoords = xcoords[limit]
         ycoords = ycoords[limit]
-        if (False):
-            xcoords = np.append(xcoords, xcoords[0] )
-            ycoords = np.append(ycoords, ycoords[0] )
-        #if (False):
-            #xcoords = np.append(xcoords, xcoords[0] )
-            #ycoords = np.append(ycoords, ycoords[-1] )
         
         coordslist = np.array((xcoords, ycoords)).T
         coordstrlist = ["{:.6f} {:.6f}".format(coord[0], coord[1])
@@ -322,48 +682,331 @@ class XfoilSimulatedFoil(PlateSimulatedFoil):
         # Join with linebreaks in between
         points = '\n'.join(coordstrlist)
 
-        # Save points to a file
-        randstr = ''.join(choice(ascii_uppercase) for i in range(20))
-        filename = "parsec_{}.dat".format(randstr)
-        with open(filename, 'w') as af:
-            af.write(points)
+        # Stage the points (once per geometry) where XFOIL can load them
+        return xfoil.stage_airfoil(points)
+
+    def get_failures(self, reynolds, Ma, iterlim=None, ncrit=None, timeouts=True):
+        ''' Angles (degrees) known not to converge. If iterlim and ncrit are given,
+            only the failures recorded with those XFOIL settings. Without timeouts,
+            only the angles that didn't converge (not those whose sweep timed out).
+        '''
+        conn = self.get_db()
+        c = conn.cursor()
+        query = "SELECT f.alpha FROM failure f WHERE (f.foil_id=?) AND (f.reynolds=?) AND (f.mach=?)"
+        args = (self.foil_id, reynolds, Ma)
+        if not timeouts:
+            query += " AND (f.reason != 'timeout')"
+        if iterlim is not None:
+            query += " AND (f.iterlim=?) AND (f.ncrit=?)"
+            args += (iterlim, ncrit)
+        alpha = [f[0] for f in c.execute(query, args)]
+        return set(np.round(np.degrees(alpha), 3))
+
+    def record_failures(self, reynolds, Ma, alpha, reason, elapsed, iterlim, ncrit):
+        if len(alpha) == 0:
+            return
+        logger.info("Recording {} failures ({}) at Re={} Ma={:5.2f}".format(len(alpha), reason, reynolds, Ma))
+        conn = self.get_db()
+        c = conn.cursor()
+        c.executemany("INSERT INTO failure(foil_id, reynolds, mach, alpha, reason, elapsed, iterlim, ncrit) VALUES (?,?,?,?,?,?,?,?)",
+                      [(self.foil_id, reynolds, Ma, np.radians(a), reason, elapsed, iterlim, ncrit) for a in alpha])
+        conn.commit()
+
+    def clear_failures(self, reynolds, Ma, alpha, reason=None):
+        ''' Forget failures (with reason, if given) at angles (degrees) that have since converged '''
+        conn = self.get_db()
+        c = conn.cursor()
+        query = "DELETE FROM failure WHERE (foil_id=?) AND (reynolds=?) AND (mach=?) AND (abs(alpha - ?) < 1e-6)"
+        if reason is not None:
+            query += " AND (reason=?)"
+        c.executemany(query, [(self.foil_id, reynolds, Ma, np.radians(a)) + ((reason,) if reason else ()) for a in alpha])
+        conn.commit()
+
+    def simulate(self, filename, jobs, sweeps, iterlim, ncrit):
+        ''' Run a batch of XFOIL sweeps, one (angles, reynolds, Ma) sweep per
+            (alfa, reynolds, Ma, polar) job, add the converged points to each
+            polar and record the failures
+        '''
+        results = xfoil.get_polar_sweeps(filename, sweeps, iterlim=iterlim, normalize=True,
+                                         timeout=SWEEP_TIMEOUT, ncrit=ncrit)
+        self.add_results(jobs, results, iterlim, ncrit)
+
+    def add_results(self, jobs, results, iterlim, ncrit):
+        ''' Add the converged points of each sweep to its polar, and record the
+            failures with the time that their sweep took. The angles of a sweep
+            that timed out are recorded as 'timeout' failures, which later runs
+            try again (see get_failures).
+        '''
+        for (alfa, reynolds, Ma, polar), result in zip(jobs, results):
+            if result is None:
+                self.clear_failures(reynolds, Ma, alfa, 'timeout')
+                self.record_failures(reynolds, Ma, alfa, 'timeout', SWEEP_TIMEOUT, iterlim, ncrit)
+                continue
+            elapsed = result['elapsed']
+            # Only the requested angles, not the lead in of the sweep
+            requested = set(np.round(alfa, 3))
+            keep = [i for i, a in enumerate(result['alpha']) if round(a, 3) in requested]
+            result = {key: [result[key][i] for i in keep] for key in polar}
+            converged = set(np.round(result['alpha'], 3))
+            self.record_failures(reynolds, Ma, [a for a in alfa if round(a, 3) not in converged],
+                                 'convergence', elapsed, iterlim, ncrit)
+            self.clear_failures(reynolds, Ma, converged)
+            for key in polar:
+                polar[key].extend(result[key])
+
+    def insert_polar(self, sim_id, polar):
+        ''' Insert the rows of a polar, as part of the current transaction '''
+        conn = self.get_db()
+        rows = zip([sim_id]*len(polar['alpha']), np.radians(polar['alpha']).tolist(),
+                   polar['CL'], polar['CD'], polar['CDp'], polar['CM'], polar['Top_Xtr'], polar['Bot_Xtr'])
+        conn.executemany('''INSERT INTO polar(sim_id, alpha, cl, cd, cdp, cm, Top_Xtr, Bot_Xtr) VALUES (?,?,?,?,?,?,?,?)
+                            ON CONFLICT(sim_id, alpha) DO NOTHING''',
+                         [[float(x) for x in row] for row in rows])
+
+    def xfoil_simulate_polars(self, reynolds, Ma):
+        ''' Use XFOIL to simulate the performance of this get_shape.
+            Returns None if the polar was stored, or a flat plate polar if the foil didn't simulate.
+        '''
+        return self.simulate_polars([(reynolds, Ma)])[0]
+
+    def simulate_polars(self, conditions):
+        ''' Use XFOIL to simulate the polars for a list of (reynolds, Ma) conditions.
+            The conditions are sampled together, a round of angles at a time, so each
+            round loads the geometry once per worker instead of once per polar.
+            Conditions that are already in the database are skipped.
             
-        # Let Xfoil do its magic
-        alfa = np.arange(-30, 30, 1.0)
-        polar = xfoil.get_polars(filename, alfa, reynolds, Mach=Ma,
-                                        iterlim=200, normalize=True)
-        #print polar.keys()
-        os.remove(filename)
-                
-        cl = np.array(polar['CL'])
-        cd = np.array(polar['CD'])
-        cdp = np.array(polar['CDp'])
-        cm = np.array(polar['CM'])
-        top_xtr = np.array(polar['Top_Xtr'])
-        bot_xtr = np.array(polar['Bot_Xtr'])
-        alfa = np.radians(polar['alpha'])
-        if len(alfa) < 5:
+            Returns a list with None for each stored (or skipped) polar, and a flat
+            plate polar for each condition that didn't simulate.
+        '''
+        return simulate_foils([(self, conditions)])[0]
+
+    def claim(self, conditions):
+        ''' Claim conditions for this process to simulate. Returns the conditions
+            claimed, and those another live process is simulating. A claim whose
+            process has died (or stopped refreshing it) is taken over.
+        '''
+        conn = self.get_db()
+        pid = os.getpid()
+        mine = []
+        theirs = []
+        with conn:
+            for reynolds, Ma in conditions:
+                condition = (self.foil_id, float(reynolds), float(Ma))
+                c = conn.execute('''INSERT INTO claim(foil_id, reynolds, mach, host, pid, claimed) VALUES (?,?,?,?,?,?)
+                                    ON CONFLICT(foil_id, reynolds, mach) DO NOTHING''', condition + (HOST, pid, time.time()))
+                if c.rowcount == 1:
+                    mine.append((reynolds, Ma))
+                    continue
+                host, other, claimed = conn.execute("SELECT host, pid, claimed FROM claim WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)",
+                                                    condition).fetchone()
+                stale = ((host == HOST) and ((other == pid) or not pid_alive(other))) or (claimed < time.time() - CLAIM_TIMEOUT)
+                if stale:
+                    if other != pid:
+                        logger.info("Taking over the claim of process {} on {} at Re={} Ma={:5.2f}".format(other, host, reynolds, Ma))
+                    conn.execute('''UPDATE claim SET host=?, pid=?, claimed=? WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)''',
+                                 (HOST, pid, time.time()) + condition)
+                    mine.append((reynolds, Ma))
+                else:
+                    theirs.append((reynolds, Ma))
+        return mine, theirs
+
+    def refresh_claims(self, conditions):
+        ''' Show that this process is still simulating conditions '''
+        with self.get_db() as conn:
+            conn.executemany("UPDATE claim SET claimed=? WHERE (foil_id=?) AND (reynolds=?) AND (mach=?) AND (host=?) AND (pid=?)",
+                             [(time.time(), self.foil_id, float(reynolds), float(Ma), HOST, os.getpid()) for reynolds, Ma in conditions])
+
+    def release_claims(self, conditions, conn=None):
+        ''' Drop this process's claims on conditions (in conn's transaction, if given) '''
+        rows = [(self.foil_id, float(reynolds), float(Ma), HOST, os.getpid()) for reynolds, Ma in conditions]
+        query = "DELETE FROM claim WHERE (foil_id=?) AND (reynolds=?) AND (mach=?) AND (host=?) AND (pid=?)"
+        if conn is not None:
+            conn.executemany(query, rows)
+        else:
+            with self.get_db() as conn:
+                conn.executemany(query, rows)
+
+    def wait_for(self, conditions):
+        ''' Wait while other processes simulate conditions. Returns those that
+            are now stored, and those that need simulating again (the other
+            process stopped without storing the polar, or died).
+        '''
+        pending = list(conditions)
+        stored = []
+        retry = []
+        for reynolds, Ma in pending:
+            logger.info("Waiting for another process to simulate Foil {}, at Re={} Ma={:5.2f}".format(self.foil, reynolds, Ma))
+        while len(pending) > 0:
+            time.sleep(CLAIM_POLL)
+            conn = self.get_db()
+            for reynolds, Ma in list(pending):
+                if self.get_from_db(None, reynolds, Ma) is not None:
+                    stored.append((reynolds, Ma))
+                    pending.remove((reynolds, Ma))
+                    continue
+                claim = conn.execute("SELECT host, pid, claimed FROM claim WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)",
+                                     (self.foil_id, float(reynolds), float(Ma))).fetchone()
+                if (claim is None) or ((claim[0] == HOST) and not pid_alive(claim[1])) or (claim[2] < time.time() - CLAIM_TIMEOUT):
+                    retry.append((reynolds, Ma))
+                    pending.remove((reynolds, Ma))
+            conn.commit()
+        return stored, retry
+
+    def new_runs(self, conditions):
+        ''' The sampling state of each condition that isn't in the database yet,
+            and that this process has claimed, as [reynolds, Ma, polar, sampler,
+            known failures, next angles] lists. Also returns the conditions that
+            other processes are simulating.
+        '''
+        runs = []
+        mine, theirs = self.claim([(reynolds, Ma) for reynolds, Ma in conditions
+                                   if self.get_from_db(None, reynolds, Ma) is None])
+        for reynolds, Ma in mine:
+            # Stored by another process since we looked.
+            if self.get_from_db(None, reynolds, Ma) is not None:
+                self.release_claims([(reynolds, Ma)])
+                continue
+            logger.info("Simulating Foil {}, at Re={} Ma={:5.2f}".format(self.foil, reynolds, Ma))
+            polar = {'alpha': [], 'CL': [], 'CD': [], 'CDp': [], 'CM': [], 'Top_Xtr': [], 'Bot_Xtr': []}
+            sampler = AdaptiveAlphaSampler()
+            # Known failures count as already requested, so they are skipped (and not extended past).
+            # With retry_failed, only those that failed with the current settings are skipped.
+            if self.retry_failed:
+                known = self.get_failures(reynolds, Ma, self.iterlim, self.ncrit, timeouts=False)
+            else:
+                known = self.get_failures(reynolds, Ma, timeouts=False)
+            sampler.requested.update(known)
+            runs.append([reynolds, Ma, polar, sampler, known, sampler.initial()])
+        return runs, theirs
+
+    def store_runs(self, runs):
+        ''' Store the polars of finished runs, returning the store_polar result of each condition '''
+        stored = {}
+        for reynolds, Ma, polar, sampler, known, alfa in runs:
+            logger.info("Re={} Ma={:5.2f}: simulated {} of {} angles in {} rounds, skipped {} known failures".format(
+                reynolds, Ma, len(polar['alpha']), len(sampler.requested) - len(known), sampler.rounds, len(known)))
+            stored[(reynolds, Ma)] = self.store_polar(reynolds, Ma, polar)
+        return stored
+
+    def store_polar(self, reynolds, Ma, polar):
+        ''' Insert a simulated polar into the database, and release the claim on
+            it. Returns None, or a flat plate polar if there are too few points to fit.
+        '''
+        polar_available.pop((self.hash, float(reynolds), float(Ma)), None)
+        if len(polar['alpha']) < MIN_POLAR_POINTS:
             logger.warning("Foil didn't simulate.")
+            self.release_claims([(reynolds, Ma)])
             # Try modifying things.
-            alpha = np.arange(np.linspace(-30, 30, 1.1))
+            alpha = np.radians(np.linspace(-30, 30, 40))
             cl = 2.0 * np.pi * alpha
             cd = 1.28 * np.sin(alpha)
             cl_poly = np.poly1d(np.polyfit(alpha, cl, 4))
             cd_poly = np.poly1d(np.polyfit(alpha, cd, 4))
             return [cl_poly, cd_poly]
         else:
-            # Insert into database
+            # Insert into database, the simulation and its polar in one transaction
             conn = self.get_db()
-            c = conn.cursor()
-            c.execute("INSERT INTO simulation(foil_id, reynolds, mach) VALUES (?,?, ?)", (self.foil_id, reynolds, Ma))
-            c.execute("SELECT id FROM simulation WHERE (foil_id=?) AND (reynolds=?) AND (mach=?)", (self.foil_id, reynolds, Ma ))
-            sim_id = c.fetchone()[0]
-
-            for i, a in enumerate(alfa):
-                c.execute("INSERT INTO polar(sim_id, alpha, cl, cd, cdp, cm, Top_Xtr, Bot_Xtr) VALUES (?,?,?,?,?,?,?,?)", 
-                          (sim_id, a, cl[i], cd[i], cdp[i], cm[i], top_xtr[i], bot_xtr[i]))
-            conn.commit()
-        
+            with conn:
+                c = conn.execute('''INSERT INTO simulation(foil_id, reynolds, mach) VALUES (?,?,?)
+                                    ON CONFLICT(foil_id, reynolds, mach) DO NOTHING''', (self.foil_id, float(reynolds), float(Ma)))
+                # Another process may have stored it first (after its claim went stale)
+                if c.rowcount == 1:
+                    self.insert_polar(c.lastrowid, polar)
+                self.release_claims([(reynolds, Ma)], conn)
+            return None
+
+    def retry_failures(self, velocity, iterlim=500, ncrit=None):
+        ''' Simulate the known failures of the polar for this velocity again, with
+            different XFOIL settings (e.g. more iterations or another Ncrit). Points
+            that now converge are added to the stored polar. Returns how many did.
+            Nothing is retried if there is no stored polar to add them to.
+        '''
+        reynolds = self.get_reynolds(velocity)
+        Ma = self.get_mach(velocity)
+        if ncrit is None:
+            ncrit = self.ncrit
+        alfa = sorted(self.get_failures(reynolds, Ma) - self.get_failures(reynolds, Ma, iterlim, ncrit))
+        if len(alfa) == 0:
+            return 0
+        stored = self.get_polar_from_db(velocity, reynolds, Ma)
+        if stored is None:
+            return 0
+
+        # Sweep with a lead in of the stored angles, as simulate_foils does
+        sweep = AdaptiveAlphaSampler().sweep(alfa, np.degrees(stored[0]))
+        polar = {'alpha': [], 'CL': [], 'CD': [], 'CDp': [], 'CM': [], 'Top_Xtr': [], 'Bot_Xtr': []}
+        self.simulate(self.airfoil_file(), [(alfa, reynolds, Ma, polar)], [(sweep, reynolds, Ma)], iterlim, ncrit)
+        logger.info("Retry converged {} of {} failed angles".format(len(polar['alpha']), len(alfa)))
+        sim_id = self.get_from_db(velocity, reynolds, Ma)
+        with self.get_db():
+            self.insert_polar(sim_id, polar)
+        polar_cache.pop(self.polar_key(reynolds, Ma))
+        return len(polar['alpha'])
+
+
+def simulate_foils(plan):
+    ''' Simulate the polars of several foils together. plan is a list of
+        (XfoilSimulatedFoil, conditions) pairs. Each round of angles, for
+        every condition of every foil, is queued on the worker pool at once,
+        so no core waits for another foil's sweep to finish.
+
+        Returns the simulate_polars result of each foil.
+    '''
+    runs = []
+    try:
+        for fs, conditions in plan:
+            fs_runs, theirs = fs.new_runs(conditions)
+            runs.append((fs, fs.airfoil_file(), fs_runs, theirs))
+
+        # Let Xfoil do its magic, a round of angles at a time
+        while True:
+            batches = []
+            for fs, filename, fs_runs, theirs in runs:
+                active = [r for r in fs_runs if len(r[5]) > 0]
+                if len(active) > 0:
+                    jobs = [(alfa, reynolds, Ma, polar) for reynolds, Ma, polar, sampler, known, alfa in active]
+                    sweeps = [(sampler.sweep(alfa, polar['alpha']), reynolds, Ma) for reynolds, Ma, polar, sampler, known, alfa in active]
+                    batches.append((fs, filename, jobs, sweeps, active))
+            if len(batches) == 0:
+                break
+            for fs, filename, jobs, sweeps, active in batches:
+                fs.refresh_claims([(reynolds, Ma) for alfa, reynolds, Ma, polar in jobs])
+            results = xfoil.get_polar_sweeps_batch([(filename, sweeps, fs.iterlim, fs.ncrit)
+                                                    for fs, filename, jobs, sweeps, active in batches],
+                                                   normalize=True, timeout=SWEEP_TIMEOUT)
+            for (fs, filename, jobs, sweeps, active), result in zip(batches, results):
+                fs.add_results(jobs, result, fs.iterlim, fs.ncrit)
+                for r in active:
+                    polar, sampler = r[2], r[3]
+                    r[5] = sampler.refine(polar['alpha'], polar['CL'], polar['CD'])
+
+        stored = [fs.store_runs(fs_runs) for fs, filename, fs_runs, theirs in runs]
+    finally:
+        # Unfinished claims (after an interrupt, say) are released, so waiting processes carry on.
+        for fs, filename, fs_runs, theirs in runs:
+            fs.release_claims([(r[0], r[1]) for r in fs_runs])
+
+    # The conditions that other processes were simulating. Those they didn't
+    # finish are simulated here.
+    retries = []
+    for (fs, filename, fs_runs, theirs), fs_stored in zip(runs, stored):
+        done, retry = fs.wait_for(theirs)
+        fs_stored.update({c: None for c in done})
+        if len(retry) > 0:
+            retries.append((fs, retry, fs_stored))
+    if len(retries) > 0:
+        for (fs, retry, fs_stored), result in zip(retries, simulate_foils([(fs, retry) for fs, retry, fs_stored in retries])):
+            fs_stored.update(zip(retry, result))
+
+    return [[fs_stored.get((reynolds, Ma)) for reynolds, Ma in conditions]
+            for fs_stored, (fs, conditions) in zip(stored, plan)]
+
+
+def simulate_polars(foil, conditions, **kwargs):
+    ''' Fill the database with the polars of foil at a list of (reynolds, Ma)
+        conditions, in one batch. kwargs are passed to XfoilSimulatedFoil.
+    '''
+    return XfoilSimulatedFoil(foil, **kwargs).simulate_polars(conditions)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,14 @@
-CREATE TABLE foil(
+CREATE TABLE IF NOT EXISTS foil(
     id integer PRIMARY KEY AUTOINCREMENT,
     hash varchar);
 
-CREATE TABLE simulation(
+CREATE TABLE IF NOT EXISTS simulation(
     id integer PRIMARY KEY AUTOINCREMENT,
     foil_id int REFERENCES foil ON DELETE CASCADE, 
     reynolds float, 
     mach float);
 
-CREATE TABLE  polar (
+CREATE TABLE IF NOT EXISTS polar (
     sim_id int REFERENCES simulation ON DELETE CASCADE, 
     alpha float, 
     cl float, 
@@ -17,5 +17,35 @@ CREATE TABLE  polar (
     cm, 
     Top_Xtr, 
     Bot_Xtr);
-    
-    
+
+CREATE TABLE IF NOT EXISTS failure (
+    foil_id int REFERENCES foil ON DELETE CASCADE,
+    reynolds float,
+    mach float,
+    alpha float,
+    reason varchar,
+    elapsed float,
+    iterlim int,
+    ncrit float);
+
+-- Conditions that warm_cache.py has finished, whether or not their polar was stored
+CREATE TABLE IF NOT EXISTS warmed (
+    foil_id int REFERENCES foil ON DELETE CASCADE,
+    reynolds float,
+    mach float,
+    stored int,
+    elapsed float);
+
+CREATE UNIQUE INDEX IF NOT EXISTS warmed_condition ON warmed(foil_id, reynolds, mach);
+
+-- Conditions that a process is simulating. Other processes wait for the
+-- polar instead of simulating it again (see XfoilSimulatedFoil.claim).
+CREATE TABLE IF NOT EXISTS claim (
+    foil_id int REFERENCES foil ON DELETE CASCADE,
+    reynolds float,
+    mach float,
+    host varchar,
+    pid int,
+    claimed float);
+
+CREATE UNIQUE INDEX IF NOT EXISTS claim_condition ON claim(foil_id, reynolds, mach);
@@ -0,0 +1,23 @@
+-- Indexes and unique constraints for the lookups in foil_simulator.py.
+-- Duplicates left by older versions are removed first.
+
+UPDATE simulation SET foil_id = (
+    SELECT min(f2.id) FROM foil f1 JOIN foil f2 ON (f1.hash = f2.hash) WHERE (f1.id = simulation.foil_id))
+    WHERE foil_id IN (SELECT id FROM foil);
+
+DELETE FROM foil WHERE id NOT IN (SELECT min(id) FROM foil GROUP BY hash);
+
+DELETE FROM simulation WHERE id NOT IN (SELECT min(id) FROM simulation GROUP BY foil_id, reynolds, mach);
+
+DELETE FROM polar WHERE sim_id NOT IN (SELECT id FROM simulation);
+
+DELETE FROM polar WHERE rowid NOT IN (SELECT min(rowid) FROM polar GROUP BY sim_id, alpha);
+
+CREATE UNIQUE INDEX IF NOT EXISTS foil_hash ON foil(hash);
+
+CREATE UNIQUE INDEX IF NOT EXISTS simulation_condition ON simulation(foil_id, reynolds, mach);
+
+CREATE UNIQUE INDEX IF NOT EXISTS polar_sim ON polar(sim_id, alpha);
+
+CREATE INDEX IF NOT EXISTS failure_condition ON failure(foil_id, reynolds, mach);
+
@@ -4,22 +4,30 @@
    Authon: Tim Molteno (c) 2017.
 '''
 from numpy import pi, sin, cos, tan, arctan, degrees, sqrt, radians, arange, zeros, array, log
+import numpy as np
+from collections import Counter
+
+import bem_kernels
 
 import logging
 logger = logging.getLogger(__name__)
 
+''' Iterations used by each solver (optimizer iterations, Newton steps and scans
+    of the polar), to see what warm starts save. Clear it to start counting again.
+'''
+solver_iterations = Counter()
+
 def rpm2omega(rpm):
     rps = rpm / 60.0
     return 2*pi*rps
 
 def iterate(foil_simulator, c, dv, a_prime, theta, omega, r, dr, u_0, B):
     C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
-    
-    dv_new = -B*c*(C_D*(dv + u_0) + C_L*omega*r*(a_prime - 1))*sqrt(omega**2*r**2*(a_prime - 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0))
-    
-    a_prime_new = -B*c*sqrt(omega**2*r**2*(a_prime - 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(a_prime - 1) - C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0))
-    
-    return dv_new, a_prime_new
+    return induction(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B)
+
+def induction(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B):
+    ''' The dv and a_prime that C_L and C_D would induce '''
+    return bem_kernels.induction(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B)
 
 def precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B):
     u = u_0 + dv
@@ -28,45 +36,56 @@ def precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B):
     alpha = theta - phi
     #print alpha
     v_rel = sqrt(u**2 + v**2)
-    C_D = foil_simulator.get_cd(v_rel, alpha)
-    C_L = foil_simulator.get_cl(v_rel, alpha)
+    C_L, C_D = foil_simulator.get_cl_cd(v_rel, alpha)
     return C_L, C_D, phi
 
+def precalc_jac(foil_simulator, dv, a_prime, theta, omega, r, u_0):
+    ''' Gradients of C_L and C_D with respect to (theta, dv, a_prime), through the
+        angle of attack alpha = theta - arctan(u/v). The Reynolds number of the
+        polar is held fixed.
+    '''
+    u = u_0 + dv
+    v = omega*r*(1.0 - a_prime)
+    alpha = theta - arctan(u/v)
+    v_rel = sqrt(u**2 + v**2)
+    dcl, dcd = foil_simulator.get_dcl_dcd(v_rel, alpha)
+    dalpha = array([1.0, -v/v_rel**2, -u*omega*r/v_rel**2])
+    return dcl*dalpha, dcd*dalpha
+
+def lsq_coeffs(C_L, C_D, c, dv, a_prime, theta, omega, r, dr, u_0, B):
+    ''' Derivatives of lsq with respect to C_L and C_D '''
+    return array(bem_kernels.lsq_coeffs(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B))
+
 def lsq(C_L, C_D, c, dv, a_prime, theta, omega, r, dr, u_0, B):
-    minfun=(-B*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0)) + a_prime)**2/(a_prime + 0.01)**2 + (B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0)) + dv)**2/dv**2
-    return minfun
+    return bem_kernels.lsq(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B)
 
 def jac(C_L, C_D, c, dv, a_prime, theta, omega, r, dr, u_0, B):
-    dmindv=(-B*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0)) + a_prime)*(-B*C_L*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(2*pi*omega*r*(dr + 2*r)*(dv + u_0)) - B*c*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(2*pi*omega*r*(dr + 2*r)*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)) + B*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(2*pi*omega*r*(dr + 2*r)*(dv + u_0)**2))/(a_prime + 0.01)**2 + (B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0)) + dv)*(B*C_D*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(2*pi*(dr + 2*r)*(dv + u_0)) + B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))/(2*pi*(dr + 2*r)*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)) - B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(2*pi*(dr + 2*r)*(dv + u_0)**2) + 2)/dv**2 - 2*(B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0)) + dv)**2/dv**3
-    dminda=(-B*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0)) + a_prime)*(B*C_D*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(2*pi*(dr + 2*r)*(dv + u_0)) - B*c*omega*r*(2*a_prime - 2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(4*pi*(dr + 2*r)*(dv + u_0)*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)) + 2)/(a_prime + 0.01)**2 - 2*(-B*c*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(-a_prime + 1) + C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0)) + a_prime)**2/(a_prime + 0.01)**3 + (B*c*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0)) + dv)*(B*C_L*c*omega*r*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)/(2*pi*(dr + 2*r)*(dv + u_0)) + B*c*omega**2*r**2*(2*a_prime - 2)*(C_D*(dv + u_0) - C_L*omega*r*(-a_prime + 1))/(4*pi*(dr + 2*r)*(dv + u_0)*sqrt(omega**2*r**2*(-a_prime + 1)**2 + (dv + u_0)**2)))/dv**2
-    return array([dmindv, dminda])
+    return array(bem_kernels.lsq_jac(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B))
 
 def min_func2(x, theta, omega, r, dr, u_0, B, foil_simulator):
+    ''' lsq and its gradient, including the change of C_L and C_D with the angle of attack.
+        The polar is looked up once for both.
+    '''
     dv, a_prime = x
+    c = foil_simulator.foil.chord
     C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
-    return lsq(C_L, C_D, foil_simulator.foil.chord, dv, a_prime, theta, omega, r, dr, u_0, B)
+    dcl, dcd = precalc_jac(foil_simulator, dv, a_prime, theta, omega, r, u_0)
+    f, dmindv, dminda, dlsq_dcl, dlsq_dcd = bem_kernels.lsq_all(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B)
+    return f, array([dmindv, dminda]) + dlsq_dcl*dcl[1:] + dlsq_dcd*dcd[1:]
 
-def jac_func2(x, theta, omega, r, dr, u_0, B, foil_simulator):
+def lsq_func2(x, theta, omega, r, dr, u_0, B, foil_simulator):
+    ''' lsq alone, for the solvers that don't use its gradient (COBYLA) '''
     dv, a_prime = x
     C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
-    return jac(C_L, C_D, foil_simulator.foil.chord, dv, a_prime, theta, omega, r, dr, u_0, B)
-    
+    return lsq(C_L, C_D, foil_simulator.foil.chord, dv, a_prime, theta, omega, r, dr, u_0, B)
+
 def iterate_old(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B):
     C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
-
-    # These are created from the sympy file bem.sym.py, and are based on a modified
-    # Blade Element Momentum method.
-    c = foil_simulator.foil.chord
-    
-    dv_new = -B*c*(C_D*(dv + u_0) + C_L*omega*r*(a_prime - 1))*sqrt(omega**2*r**2*(a_prime - 1)**2 + (dv + u_0)**2)/(4*pi*(dr + 2*r)*(dv + u_0))
-    a_prime_new = -B*c*sqrt(omega**2*r**2*(a_prime - 1)**2 + (dv + u_0)**2)*(C_D*omega*r*(a_prime - 1) - C_L*(dv + u_0))/(4*pi*omega*r*(dr + 2*r)*(dv + u_0))
-
-    return dv_new, a_prime_new
+    return induction(C_L, C_D, foil_simulator.foil.chord, dv, a_prime, omega, r, dr, u_0, B)
 
 
 def dT(dv, r, dr, u_0, rho=1.225):
-    u = u_0 + dv
-    return 2*pi*dr*dv*rho*u*(dr + 2*r)
+    return bem_kernels.dT(dv, r, dr, u_0, rho)
 
 ''' 
     http://web.mit.edu/16.unified/www/FALL/thermodynamics/notes/node86.html 
@@ -80,8 +99,7 @@ def dv_from_thrust(T, R, u_0, rho=1.225):
 4*pi*a_prime*dr*omega*r**3*rho*u
 '''
 def dM(dv, a_prime, r, dr, omega, u_0, rho=1.225):
-    u = u_0 + dv
-    return 2*pi*a_prime*dr*omega*r**2*rho*u*(dr + 2*r)
+    return bem_kernels.dM(dv, a_prime, r, dr, omega, u_0, rho)
 
 
 def error(dv, dv2, a_prime, a_prime2):
@@ -105,7 +123,7 @@ def min_func(x, theta, omega, r, dr, u_0, B, foil_simulator):
         return 1e6
 
 
-from scipy.optimize import minimize, fixed_point
+from scipy.optimize import minimize, fixed_point, brentq
 
 def fp_func(x, theta, omega, r, dr, u_0, B, foil_simulator):
     dv, a_prime = x
@@ -113,21 +131,281 @@ def fp_func(x, theta, omega, r, dr, u_0, B, foil_simulator):
     dv2, a_prime2 = iterate(foil_simulator, foil_simulator.foil.chord, dv, a_prime, theta, omega, r, dr, u_0, B)
     return array([dv2, a_prime2])
 
-def bem_iterate(foil_simulator, dv_goal, theta, rpm, r, dr, u_0, B):
-    x0 = [dv_goal, 0.01]
+def bem_iterate(foil_simulator, dv_goal, theta, rpm, r, dr, u_0, B, x0=None):
+    ''' Solve the BEM equations of an element by minimizing lsq, from x0 = (dv, a_prime)
+        if given (the solution at a nearby operating point, or of the neighbouring
+        element), else from (dv_goal, 0.01). A warm start that fails is retried cold.
+    '''
+    cold = [dv_goal, 0.01]
     constraints = [
         {'type': 'ineq', 'fun': lambda x: x[0]},
         {'type': 'ineq', 'fun': lambda x: 3*dv_goal - x[0]},
         {'type': 'ineq', 'fun': lambda x: x[1]},
         {'type': 'ineq', 'fun': lambda x: 0.3 - x[1]}]
-    res = minimize(min_func2, x0, jac=jac_func2, args=(theta, rpm2omega(rpm), r, dr, u_0, B, foil_simulator), \
-        method='SLSQP', constraints=constraints, options={'disp': False, 'maxiter': 1000})
+    args = (theta, rpm2omega(rpm), r, dr, u_0, B, foil_simulator)
+    res = None
+    if x0 is not None:
+        x0 = [min(max(x0[0], DV_MIN), 3*dv_goal), min(max(x0[1], 0.0), 0.3)]
+        res = minimize(min_func2, x0, jac=True, args=args, \
+            method='SLSQP', constraints=constraints, options={'disp': False, 'maxiter': 1000})
+        solver_iterations['bem_iterate'] += int(res.nit)
+    if (res is None) or (res.fun > 0.1):
+        res = minimize(min_func2, cold, jac=True, args=args, \
+            method='SLSQP', constraints=constraints, options={'disp': False, 'maxiter': 1000})
+        solver_iterations['bem_iterate'] += int(res.nit)
     if (res.fun > 0.1):
-        res = minimize(min_func2, x0, jac=jac_func2, args=(theta, rpm2omega(rpm), r, dr, u_0, B, foil_simulator), \
+        res = minimize(lsq_func2, cold, args=args, \
             method='COBYLA', constraints=constraints, options={'disp': True, 'maxiter': 2000})
+        solver_iterations['bem_iterate'] += int(res.nfev)
     dv, a_prime = res.x
     err = res.fun
-    
+
+    return dv, a_prime, err
+
+
+'''
+    The fixed point of induction, in terms of the inflow angle phi. With
+    W = sqrt(u**2 + v**2), u = W sin(phi) = u_0 + dv and v = W cos(phi) = omega r (1 - a_prime),
+    and s = B c/(4 pi (dr + 2 r)), induction is
+
+        u_0 + s W C_y/sin(phi) = W sin(phi),    omega r - s W C_x/sin(phi) = W cos(phi)
+
+    where C_y = C_L cos(phi) - C_D sin(phi) and C_x = C_L sin(phi) + C_D cos(phi).
+    Eliminating W leaves one equation in phi, phi_residual = 0.
+'''
+PHI_SCAN = 24
+PHI_WINDOW = radians(0.5)   # Half width of the first scan around a warm start
+DV_MIN = 1e-3   # Lower bound on dv (m/s), lsq divides by it.
+
+def phi_residual(C_L, C_D, phi, s, omega, r, u_0):
+    C_y = C_L*cos(phi) - C_D*sin(phi)
+    C_x = C_L*sin(phi) + C_D*cos(phi)
+    return u_0*(sin(phi)*cos(phi) + s*C_x) - omega*r*(sin(phi)**2 - s*C_y)
+
+def phi_induction(C_L, C_D, phi, s, omega, r, u_0):
+    ''' dv, a_prime and W at the inflow angle phi '''
+    C_x = C_L*sin(phi) + C_D*cos(phi)
+    W = omega*r/(cos(phi) + s*C_x/sin(phi))
+    return W*sin(phi) - u_0, 1.0 - W*cos(phi)/(omega*r), W
+
+def bem_phi(foil_simulator, dv_goal, theta, rpm, r, dr, u_0, B, maxiter=20, x0=None):
+    ''' bem_iterate, by solving phi_residual for the inflow angle.
+
+        The smallest root over the phi allowed by the bounds of bem_iterate is
+        bracketed with two array evaluations of the polar (a coarse scan, then a
+        fine one inside the bracket), at an estimate of the relative velocity W.
+        With a warm start x0 = (dv, a_prime) the root is first looked for within
+        PHI_WINDOW of its inflow angle, in one scan at its W. Newton steps, with
+        the slope from the fine scan and clipped to the bracket, then polish it
+        while W is updated from each solution. If they don't converge, brentq
+        finishes the job at the last W. Falls back to bem_iterate if there is no
+        root in the bounds.
+    '''
+    omega = rpm2omega(rpm)
+    c = foil_simulator.foil.chord
+    s = B*c/(4*pi*(dr + 2*r))
+    phi_lo = arctan((u_0 + DV_MIN)/(omega*r))
+    phi_hi = arctan((u_0 + 3*dv_goal)/(0.7*omega*r))
+
+    def residual(phi, W):
+        C_L, C_D = foil_simulator.get_cl_cd(W, theta - phi)
+        return phi_residual(C_L, C_D, phi, s, omega, r, u_0)
+
+    def scan(lo, hi, W):
+        ''' phi, C_L, C_D and the residual on PHI_SCAN angles, and where it changes sign '''
+        grid = np.linspace(lo, hi, PHI_SCAN)
+        C_L, C_D = foil_simulator.get_cl_cd(W, theta - grid)
+        R = phi_residual(C_L, C_D, grid, s, omega, r, u_0)
+        solver_iterations['bem_phi'] += 1
+        return grid, C_L, C_D, R, np.nonzero(np.sign(R[:-1]) != np.sign(R[1:]))[0]
+
+    change = []
+    if x0 is not None:
+        u = u_0 + x0[0]
+        v = omega*r*(1.0 - x0[1])
+        W = sqrt(u**2 + v**2)
+        phi = arctan(u/v)
+        grid, C_L, C_D, R, change = scan(max(phi - PHI_WINDOW, phi_lo), min(phi + PHI_WINDOW, phi_hi), W)
+    if len(change) == 0:
+        W = sqrt((u_0 + dv_goal)**2 + (omega*r)**2)
+        grid, C_L, C_D, R, change = scan(phi_lo, phi_hi, W)
+        if len(change) == 0:
+            logger.info("bem_phi: no inflow angle in the bounds, r={}".format(r))
+            return bem_iterate(foil_simulator, dv_goal, theta, rpm, r, dr, u_0, B, x0=x0)
+        grid, C_L, C_D, R, change = scan(grid[change[0]], grid[change[0] + 1], W)
+    i = change[0]
+    lo, hi = grid[i], grid[i + 1]
+    slope = (R[i + 1] - R[i])/(grid[i + 1] - grid[i])
+    f = -R[i]/(R[i + 1] - R[i])
+    phi = grid[i] + f*(grid[i + 1] - grid[i])
+    # And W there, with C_L and C_D interpolated
+    dv, a_prime, W = phi_induction(C_L[i] + f*(C_L[i + 1] - C_L[i]), C_D[i] + f*(C_D[i + 1] - C_D[i]),
+                                   phi, s, omega, r, u_0)
+
+    tol = 1e-10*omega*r
+    for it in range(maxiter):
+        C_L, C_D = foil_simulator.get_cl_cd(W, theta - phi)
+        R = phi_residual(C_L, C_D, phi, s, omega, r, u_0)
+        dv, a_prime, W_new = phi_induction(C_L, C_D, phi, s, omega, r, u_0)
+        if (abs(R) < tol) and (abs(W_new - W) < 1e-7*W):
+            break
+        phi = min(max(phi - R/slope, lo), hi)
+        W = W_new
+    else:
+        if np.sign(residual(lo, W)) == np.sign(residual(hi, W)):
+            logger.info("bem_phi: the root left the bracket as W changed, r={}".format(r))
+            return bem_iterate(foil_simulator, dv_goal, theta, rpm, r, dr, u_0, B, x0=(dv, a_prime))
+        phi = brentq(residual, lo, hi, args=(W,), xtol=1e-14)
+        C_L, C_D = foil_simulator.get_cl_cd(W, theta - phi)
+        dv, a_prime, W = phi_induction(C_L, C_D, phi, s, omega, r, u_0)
+    solver_iterations['bem_phi'] += it + 1
+
+    err = lsq(C_L, C_D, c, dv, a_prime, theta, omega, r, dr, u_0, B)
+    return dv, a_prime, err
+
+
+'''
+    Whole blade BEM. Each element's polar is tabulated on a uniform grid of angles
+    of attack (one array call to its foil simulator), and the momentum balances of
+    all the elements are solved together by Newton's method on these tables.
+'''
+TABLE_POINTS = 256
+
+def tabulate_polars(foil_simulators, v_rel, alpha_lo, alpha_hi, n=TABLE_POINTS):
+    ''' C_L and C_D of each element on n angles from alpha_lo to alpha_hi (arrays over
+        the elements), at the relative velocity v_rel. Returns (alpha_lo, step, cl, cd)
+    '''
+    step = (alpha_hi - alpha_lo)/(n - 1)
+    cl = np.empty((len(foil_simulators), n))
+    cd = np.empty((len(foil_simulators), n))
+    for i, fs in enumerate(foil_simulators):
+        cl[i], cd[i] = fs.get_cl_cd(v_rel[i], alpha_lo[i] + step[i]*arange(n))
+    return alpha_lo, step, cl, cd
+
+def table_cl_cd(table, alpha):
+    ''' C_L and C_D of each element at its own alpha, interpolated from tabulate_polars '''
+    alpha_lo, step, cl, cd = table
+    x = np.clip((alpha - alpha_lo)/step, 0.0, cl.shape[1] - 1.000001)
+    i = x.astype(int)
+    f = x - i
+    rows = arange(len(i))
+    return (cl[rows, i]*(1 - f) + cl[rows, i + 1]*f,
+            cd[rows, i]*(1 - f) + cd[rows, i + 1]*f)
+
+def table_residual(table, c, dv, a_prime, theta, omega, r, dr, u_0, B):
+    ''' induction - (dv, a_prime), with C_L and C_D from the table, and the lsq of it '''
+    alpha = theta - arctan((u_0 + dv)/(omega*r*(1.0 - a_prime)))
+    C_L, C_D = table_cl_cd(table, alpha)
+    dv_new, a_prime_new = induction(C_L, C_D, c, dv, a_prime, omega, r, dr, u_0, B)
+    f_dv = dv_new - dv
+    f_a = a_prime_new - a_prime
+    return f_dv, f_a, (f_a/(a_prime + 0.01))**2 + (f_dv/dv)**2
+
+def newton_blade(table, c, dv, a_prime, dv_max, theta, omega, r, dr, u_0, B, maxiter=50, h=1e-7):
+    ''' Damped Newton iterations on table_residual, for all elements at once,
+        inside the bounds of bem_iterate. Returns dv, a_prime and the iterations used.
+    '''
+    args = (theta, omega, r, dr, u_0, B)
+    f_dv, f_a, cost = table_residual(table, c, dv, a_prime, *args)
+    for it in range(maxiter):
+        active = cost > 1e-20
+        if not np.any(active):
+            break
+        # Jacobian by forward differences, and the Newton step by Cramer's rule
+        h_dv = h*np.maximum(1.0, dv)
+        g_dv, g_a, _ = table_residual(table, c, dv + h_dv, a_prime, *args)
+        k_dv, k_a, _ = table_residual(table, c, dv, a_prime + h, *args)
+        j11, j21 = (g_dv - f_dv)/h_dv, (g_a - f_a)/h_dv
+        j12, j22 = (k_dv - f_dv)/h, (k_a - f_a)/h
+        det = j11*j22 - j12*j21
+        det = np.where(det == 0, 1e-30, det)
+        s_dv = -(j22*f_dv - j12*f_a)/det
+        s_a = -(j11*f_a - j21*f_dv)/det
+
+        # Halve the steps that don't reduce lsq
+        lam = np.where(active, 1.0, 0.0)
+        for k in range(10):
+            dv_t = np.clip(dv + lam*s_dv, DV_MIN, dv_max)
+            a_t = np.clip(a_prime + lam*s_a, 0.0, 0.3)
+            t_dv, t_a, t_cost = table_residual(table, c, dv_t, a_t, *args)
+            better = active & (t_cost < cost)
+            dv, a_prime = np.where(better, dv_t, dv), np.where(better, a_t, a_prime)
+            f_dv, f_a, cost = np.where(better, t_dv, f_dv), np.where(better, t_a, f_a), np.where(better, t_cost, cost)
+            active = active & ~better
+            if not np.any(active):
+                break
+            lam = lam/2
+    return dv, a_prime, it
+
+def blade_lsq(foil_simulators, c, dv, a_prime, theta, omega, r, dr, u_0, B):
+    ''' lsq of every element, with the foil simulators' own C_L and C_D '''
+    u = u_0 + dv
+    v = omega*r*(1.0 - a_prime)
+    alpha = theta - arctan(u/v)
+    C_L = np.empty(len(foil_simulators))
+    C_D = np.empty(len(foil_simulators))
+    for i, fs in enumerate(foil_simulators):
+        C_L[i], C_D[i] = fs.get_cl_cd(sqrt(u[i]**2 + v[i]**2), alpha[i])
+    return lsq(C_L, C_D, c, dv, a_prime, theta, omega, r, dr, u_0, B)
+
+WARM_LSQ = 1e-9     # lsq of a warm started bem_blade solution that is good enough
+
+def bem_blade(foil_simulators, dv_goal, theta, rpm, r, dr, u_0, B, window=radians(2), x0=None):
+    ''' bem_iterate for every element of a blade at once. foil_simulators is a list,
+        dv_goal, theta, r and dr are arrays over the elements.
+
+        The first pass tabulates the polars over every angle of attack allowed by
+        the bounds on dv and a_prime. The second re-tabulates them, within window
+        of the solution, at its relative velocity. err is lsq with the foil
+        simulators' own C_L and C_D, so an element whose solution is no good can
+        be handed to bem_iterate.
+
+        A warm start x0 = (dv, a_prime) arrays replaces the first pass: the polars
+        are tabulated within window of its angles of attack. Only the elements
+        for which that doesn't reach WARM_LSQ are solved again from cold.
+    '''
+    n = len(foil_simulators)
+    omega = rpm2omega(rpm)
+    c = array([fs.foil.chord for fs in foil_simulators])
+    dv_max = 3*dv_goal
+    args = (theta, omega, r, dr, u_0, B)
+
+    if x0 is not None:
+        dv = np.clip(x0[0], DV_MIN, dv_max)
+        a_prime = np.clip(x0[1], 0.0, 0.3)
+        u = u_0 + dv
+        v = omega*r*(1.0 - a_prime)
+        alpha = theta - arctan(u/v)
+        table = tabulate_polars(foil_simulators, sqrt(u**2 + v**2), alpha - window, alpha + window)
+        dv, a_prime, iterations = newton_blade(table, c, dv, a_prime, dv_max, *args)
+        solver_iterations['bem_blade'] += iterations
+        err = blade_lsq(foil_simulators, c, dv, a_prime, *args)
+        cold = np.nonzero(~(err < WARM_LSQ))[0]
+        logger.info("bem_blade: {} elements warm started, {} Newton iterations, {} solved again".format(
+            n, iterations, len(cold)))
+        if len(cold) > 0:
+            subset = [np.broadcast_to(np.asarray(a, dtype=float), (n,))[cold] for a in (dv_goal, theta, rpm, r, dr, u_0)]
+            dv[cold], a_prime[cold], err[cold] = bem_blade([foil_simulators[i] for i in cold], *subset, B=B, window=window)
+        return dv, a_prime, err
+
+    dv = np.clip(dv_goal, DV_MIN, dv_max)
+    a_prime = np.full(n, 0.01)
+
+    v_rel = sqrt((u_0 + dv)**2 + (omega*r*(1.0 - a_prime))**2)
+    alpha_lo = theta - arctan((u_0 + dv_max)/(omega*r*0.7))
+    alpha_hi = theta - arctan((u_0 + DV_MIN)/(omega*r))
+    table = tabulate_polars(foil_simulators, v_rel, alpha_lo, alpha_hi)
+    dv, a_prime, iterations = newton_blade(table, c, dv, a_prime, dv_max, *args)
+
+    u = u_0 + dv
+    v = omega*r*(1.0 - a_prime)
+    alpha = theta - arctan(u/v)
+    table = tabulate_polars(foil_simulators, sqrt(u**2 + v**2), alpha - window, alpha + window)
+    dv, a_prime, polish = newton_blade(table, c, dv, a_prime, dv_max, *args)
+    solver_iterations['bem_blade'] += iterations + polish
+    logger.info("bem_blade: {} elements, {} + {} Newton iterations".format(n, iterations, polish))
+
+    err = blade_lsq(foil_simulators, c, dv, a_prime, *args)
     return dv, a_prime, err
 
 def initial_simplex_all(x0):
@@ -182,24 +460,64 @@ def min_all(x, goal, rpm, r, dr, u_0, B, foil_simulator):
     theta, dv, a_prime, chord = x
     try:
         omega = rpm2omega(rpm)
-        dv2, a_prime2 = iterate(foil_simulator, chord, dv, a_prime, theta, omega, r, dr, u_0, B)
-        err = error(dv, dv2, a_prime, a_prime2)
-        err += 10*((dv2 - goal)/(dv2 + goal))**2
-        torque = dM(dv, a_prime, r, dr, omega, u_0)
-        thrust = dT(dv, r, dr, u_0)
-        eff = abs(thrust / torque)
-        err += 50.0/eff
-        #print x, err, eff
-        return (err)
+        C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
+        return all_error(C_L, C_D, x, goal, omega, r, dr, u_0, B)
     except ValueError as ve:
         logging.info("ValueError in iteration {}".format(ve))
         return 1e6
 
-
-def optimize_all(foil_simulator, dv_goal, rpm, r, dr, u_0, B, maxchord):
+def all_error(C_L, C_D, x, goal, omega, r, dr, u_0, B):
+    ''' min_all for given C_L and C_D '''
+    theta, dv, a_prime, chord = x
+    dv2, a_prime2 = induction(C_L, C_D, chord, dv, a_prime, omega, r, dr, u_0, B)
+    err = error(dv, dv2, a_prime, a_prime2)
+    err += 10*((dv2 - goal)/(dv2 + goal))**2
+    torque = dM(dv, a_prime, r, dr, omega, u_0)
+    thrust = dT(dv, r, dr, u_0)
+    eff = abs(thrust / torque)
+    err += 50.0/eff
+    #print x, err, eff
+    return (err)
+
+def jac_all(x, goal, rpm, r, dr, u_0, B, foil_simulator, h=1e-7):
+    ''' Gradient of min_all. The polar is evaluated (with its analytic derivative)
+        once, all_error is differenced with C_L and C_D held fixed, and the
+        polar's contribution is added by the chain rule.
+    '''
+    theta, dv, a_prime, chord = x
+    omega = rpm2omega(rpm)
+    C_L, C_D, phi = precalc(foil_simulator, dv, a_prime, theta, omega, r, dr, u_0, B)
+    dcl, dcd = precalc_jac(foil_simulator, dv, a_prime, theta, omega, r, u_0)
+    args = (goal, omega, r, dr, u_0, B)
+    x = array(x, dtype=float)
+    grad = zeros(4)
+    for i in range(4):
+        step = h*max(1.0, abs(x[i]))
+        e = zeros(4)
+        e[i] = step
+        grad[i] = (all_error(C_L, C_D, x + e, *args) - all_error(C_L, C_D, x - e, *args))/(2*step)
+    step = h*max(1.0, abs(C_L))
+    derr_dcl = (all_error(C_L + step, C_D, x, *args) - all_error(C_L - step, C_D, x, *args))/(2*step)
+    step = h*max(1.0, abs(C_D))
+    derr_dcd = (all_error(C_L, C_D + step, x, *args) - all_error(C_L, C_D - step, x, *args))/(2*step)
+    grad[0:3] += derr_dcl*dcl + derr_dcd*dcd
+    return grad
+
+
+TRUST_THETA = radians(2)    # Half width, in twist, of the trust region around a warm start
+
+def optimize_all(foil_simulator, dv_goal, rpm, r, dr, u_0, B, maxchord, x0=None, trust=TRUST_THETA):
+    ''' The twist, dv, a_prime and chord of an element for dv_goal at the best efficiency.
+        x0 is a starting (theta, dv, a_prime, chord), from the neighbouring element or
+        a nearby operating point (see design_start). The search is confined to within
+        trust of its twist first, and only repeated over all the bounds if the
+        solution is on the edge of that region.
+    '''
     C_L, C_D, phi = precalc(foil_simulator, dv_goal, 0, 0, (rpm/60) * 2 * pi, r, dr, u_0, B)
     print(C_L, C_D, degrees(phi), dv_goal)
-    x0 = [phi, dv_goal, 0.002, foil_simulator.foil.chord] # theta, dv, a_prime
+    start = [phi, dv_goal, 0.002, foil_simulator.foil.chord] # theta, dv, a_prime
+    lower = [phi - radians(8), dv_goal/2, 0.0, 0.0]
+    upper = [phi + radians(10), 2*dv_goal, 0.2, maxchord]
     constraints = [
         {'type': 'ineq', 'fun': lambda x: x[0] - (phi-radians(8))},
         {'type': 'ineq', 'fun': lambda x: (phi+radians(10)) - x[0]},
@@ -209,12 +527,38 @@ def optimize_all(foil_simulator, dv_goal, rpm, r, dr, u_0, B, maxchord):
         {'type': 'ineq', 'fun': lambda x: 0.2 - x[2]},
         {'type': 'ineq', 'fun': lambda x: x[3]},
         {'type': 'ineq', 'fun': lambda x: maxchord - x[3]}]
-    res = minimize(min_all, x0, args=(dv_goal, rpm, r, dr, u_0, B, foil_simulator), tol=1e-10, \
+    args = (dv_goal, rpm, r, dr, u_0, B, foil_simulator)
+    if x0 is not None:
+        x0 = np.clip(x0, lower, upper)
+        region = [
+            {'type': 'ineq', 'fun': lambda x: x[0] - (x0[0] - trust)},
+            {'type': 'ineq', 'fun': lambda x: (x0[0] + trust) - x[0]}]
+        res = minimize(min_all, x0, jac=jac_all, args=args, tol=1e-10, \
+            method='SLSQP', constraints=constraints + region, options={'disp': True, 'maxiter': 1000})
+        solver_iterations['optimize_all'] += int(res.nit)
+        if res.success and (abs(res.x[0] - x0[0]) < 0.99*trust):
+            logger.info("dv: {}, goal: {} a_prime={}, chord={}".format(res.x[1], dv_goal, res.x[2], res.x[3]))
+            return res.x, res.fun
+        logger.info("optimize_all: solution on the edge of the trust region, searching all the bounds")
+        start = res.x if res.success else start
+    res = minimize(min_all, start, jac=jac_all, args=args, tol=1e-10, \
         method='SLSQP', constraints=constraints, options={'disp': True, 'maxiter': 1000})
-        
+    solver_iterations['optimize_all'] += int(res.nit)
+
     logger.info("dv: {}, goal: {} a_prime={}, chord={}".format(res.x[1], dv_goal, res.x[2], res.x[3]))
     return res.x, res.fun
 
+def design_start(x, r, dv_goal, omega, u_0, r_new, dv_goal_new, omega_new, u_0_new):
+    ''' A warm start for optimize_all from its solution x = (theta, dv, a_prime, chord)
+        at another radius or operating point. The angle of attack is kept, dv is
+        scaled to the new goal and the chord in proportion to 1/r (as get_max_chord).
+    '''
+    theta, dv, a_prime, chord = x
+    alpha = theta - arctan((u_0 + dv)/(omega*r*(1.0 - a_prime)))
+    dv_new = dv*dv_goal_new/dv_goal
+    theta_new = alpha + arctan((u_0_new + dv_new)/(omega_new*r_new*(1.0 - a_prime)))
+    return [theta_new, dv_new, a_prime, chord*r/r_new]
+
 
 from foil import NACA4
 from foil_simulator import PlateSimulatedFoil as FoilSim
@@ -0,0 +1,178 @@
+'''
+    Columnar polar archive
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    An export/import format for the polars in foil_simulator.db. The archive
+    is a directory of .npy files, one contiguous array per polar column
+    (alpha, cl, cd, cdp, cm, top_xtr, bot_xtr), sorted by foil, Re, Mach and
+    alpha, and an index.npy of (hash, reynolds, mach, start, count) records.
+    The columns are memory mapped, so a polar is a zero-copy slice and
+    thousands of polars are available as soon as the index has been read.
+
+        python3 polar_archive.py export foil_simulator.db polar_archive
+        python3 polar_archive.py import foil_simulator.db polar_archive
+
+    XfoilSimulatedFoil.get_polars looks in the archive (ARCHIVE, or the
+    POLAR_ARCHIVE environment variable) before the database.
+'''
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+ARCHIVE = os.environ.get('POLAR_ARCHIVE', 'polar_archive')
+
+# Column name, dtype, and the column of the polar table it comes from
+COLUMNS = [('alpha', np.float64, 'alpha'),
+           ('cl', np.float64, 'cl'),
+           ('cd', np.float64, 'cd'),
+           ('cdp', np.float32, 'cdp'),
+           ('cm', np.float32, 'cm'),
+           ('top_xtr', np.float32, 'Top_Xtr'),
+           ('bot_xtr', np.float32, 'Bot_Xtr')]
+
+
+class PolarArchive:
+    '''
+    A read-only, memory mapped polar archive.
+    '''
+    def __init__(self, path):
+        self.path = path
+        index = np.load(os.path.join(path, 'index.npy'))
+        self.index = {}
+        for hsh, reynolds, mach, start, count in index.tolist():
+            self.index[(hsh, reynolds, mach)] = (start, start + count)
+        self.columns = {}
+        for name, dtype, sql in COLUMNS:
+            self.columns[name] = np.load(os.path.join(path, '{}.npy'.format(name)), mmap_mode='r')
+
+    def get(self, hsh, reynolds, Ma):
+        ''' The polar of foil hsh at (reynolds, Ma) as a dictionary of column views, or None '''
+        span = self.index.get((hsh, float(reynolds), float(Ma)))
+        if span is None:
+            return None
+        return {name: col[span[0]:span[1]] for name, col in self.columns.items()}
+
+    def __len__(self):
+        return len(self.index)
+
+
+def export_archive(conn, path, min_points=1):
+    ''' Write every simulation in the database with at least min_points points to an archive at path '''
+    c = conn.cursor()
+    rows = c.execute('''SELECT f.hash, s.reynolds, s.mach, {} FROM polar p
+                        JOIN simulation s ON (p.sim_id = s.id) JOIN foil f ON (s.foil_id = f.id)
+                        ORDER BY f.hash, s.reynolds, s.mach, p.alpha'''.format(
+                        ', '.join(['p.{}'.format(sql) for name, dtype, sql in COLUMNS]))).fetchall()
+    keys = [r[0:3] for r in rows]
+
+    # Start of each polar, and the number of points in it
+    start = [i for i in range(len(keys)) if (i == 0) or (keys[i] != keys[i-1])]
+    count = np.diff(start + [len(keys)])
+    keep = np.repeat(count >= min_points, count)
+
+    starts = []
+    offset = 0
+    for s, n in zip(start, count):
+        if n >= min_points:
+            starts.append((keys[s][0], keys[s][1], keys[s][2], offset, n))
+            offset += n
+    width = max([len(s[0]) for s in starts] + [1])
+    index = np.array(starts, dtype=[('hash', 'U{}'.format(width)), ('reynolds', np.float64),
+                                    ('mach', np.float64), ('start', np.int64), ('count', np.int64)])
+
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'index.npy'), index)
+    for i, (name, dtype, sql) in enumerate(COLUMNS):
+        # None (NULL) becomes nan
+        col = np.array([r[3 + i] for r in rows], dtype=dtype)
+        np.save(os.path.join(tmp, '{}.npy'.format(name)), col[keep])
+    # Open archives keep reading the files they have mapped.
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp, path)
+    logger.info("Exported {} polars ({} points) to {}".format(len(index), offset, path))
+    return len(index)
+
+
+def import_archive(conn, path):
+    ''' Add the polars in the archive at path to the database, skipping simulations it already has '''
+    archive = PolarArchive(path)
+    n_imported = 0
+    with conn:
+        c = conn.cursor()
+        for (hsh, reynolds, Ma), (start, stop) in archive.index.items():
+            c.execute("INSERT OR IGNORE INTO foil(hash) VALUES (?)", (hsh,))
+            foil_id = c.execute("SELECT f.id FROM foil f WHERE (f.hash=?)", (hsh,)).fetchone()[0]
+            c.execute("INSERT OR IGNORE INTO simulation(foil_id, reynolds, mach) VALUES (?,?,?)", (foil_id, reynolds, Ma))
+            if c.rowcount == 0:
+                continue
+            sim_id = c.lastrowid
+            cols = [archive.columns[name][start:stop].tolist() for name, dtype, sql in COLUMNS]
+            c.executemany("INSERT INTO polar(sim_id, {}) VALUES (?,?,?,?,?,?,?,?)".format(
+                          ', '.join([sql for name, dtype, sql in COLUMNS])),
+                          [(sim_id,) + row for row in zip(*cols)])
+            n_imported += 1
+    logger.info("Imported {} of {} polars from {}".format(n_imported, len(archive), path))
+    return n_imported
+
+
+_archive = None
+_archive_checked = False
+
+def get_archive():
+    ''' The PolarArchive at ARCHIVE, opened on first use, or None if there isn't one '''
+    global _archive, _archive_checked
+    if not _archive_checked:
+        _archive_checked = True
+        if os.path.exists(os.path.join(ARCHIVE, 'index.npy')):
+            _archive = PolarArchive(ARCHIVE)
+            logger.info("Polar archive {} has {} polars".format(ARCHIVE, len(_archive)))
+    return _archive
+
+def set_archive(path):
+    ''' Use the archive at path (which need not exist yet) '''
+    global ARCHIVE, _archive, _archive_checked
+    ARCHIVE = path
+    _archive = None
+    _archive_checked = False
+
+def lookup(hsh, reynolds, Ma):
+    ''' The archived polar of foil hsh at (reynolds, Ma), or None '''
+    archive = get_archive()
+    if archive is None:
+        return None
+    return archive.get(hsh, reynolds, Ma)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Export or import the columnar polar archive.')
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('db', nargs='?', default='foil_simulator.db', help="The foil simulator database.")
+    parser.add_argument('archive', nargs='?', default=ARCHIVE, help="The archive directory.")
+    parser.add_argument('--min-points', type=int, default=12, help="Fewest points for a polar to be exported.")
+    args = parser.parse_args()
+
+    out_hdlr = logging.StreamHandler(sys.stdout)
+    out_hdlr.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(out_hdlr)
+    logger.setLevel(logging.INFO)
+
+    if args.action == 'export':
+        export_archive(sqlite3.connect(args.db), args.archive, args.min_points)
+    else:
+        import foil_simulator
+        conn = sqlite3.connect(args.db)
+        # Create (or migrate) the database with the simulator's schema.
+        foil_simulator.init_db(conn)
+        import_archive(conn, args.archive)
@@ -0,0 +1,127 @@
+'''
+    Piecewise cubic polar model with a post-stall extension
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    A shape preserving (PCHIP) cubic through the converged XFOIL points,
+    extended past stall to +-180 degrees with the Viterna-Corrigan model.
+    Unlike a high order polynomial fit it doesn't oscillate between or beyond
+    the points, and its derivatives are continuous.
+
+    The model is compiled into a knot array and one (4, n) array of cubic
+    coefficients each for CL and CD, so evaluating it (and its analytic
+    derivative) is a searchsorted and a Horner step.
+'''
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+
+def viterna(alpha, alpha_s, cl_s, cd_s, cd_max):
+    ''' Viterna-Corrigan CL and CD for stall at (alpha_s, cl_s, cd_s), alpha_s < alpha <= pi/2 '''
+    B1 = cd_max
+    B2 = (cd_s - cd_max*np.sin(alpha_s)**2) / np.cos(alpha_s)
+    A1 = B1 / 2
+    A2 = (cl_s - cd_max*np.sin(alpha_s)*np.cos(alpha_s)) * np.sin(alpha_s) / np.cos(alpha_s)**2
+    cl = A1*np.sin(2*alpha) + A2*np.cos(alpha)**2/np.sin(alpha)
+    cd = B1*np.sin(alpha)**2 + B2*np.cos(alpha)
+    return cl, cd
+
+def post_stall(alpha, alpha_s, cl_s, cd_s, cd_max):
+    ''' CL and CD from stall (alpha_s > 0) round to pi. Beyond pi/2 the foil is
+        a reversed plate, with 0.7 of the lift (as in AirfoilPrep).
+    '''
+    beta = np.where(alpha <= np.pi/2, alpha, np.pi - alpha)
+    cl, cd = viterna(beta, alpha_s, cl_s, cd_s, cd_max)
+    cl = np.where(alpha <= np.pi/2, cl, -0.7*cl)
+    return cl, cd
+
+
+class PolarModel:
+    '''
+    CL(alpha) and CD(alpha) over the whole circle, alpha in radians.
+
+        alpha, cl, cd -> The converged points of a polar
+        cd_max        -> Drag at 90 degrees (that of a flat plate)
+        step          -> Knot spacing of the post-stall extension
+    '''
+    def __init__(self, alpha, cl, cd, cd_max=1.28, step=np.radians(2.0)):
+        alpha, idx = np.unique(np.asarray(alpha, dtype=float), return_index=True)
+        cl = np.asarray(cl, dtype=float)[idx]
+        cd = np.asarray(cd, dtype=float)[idx]
+
+        # Stall at the ends of the converged range. Positive side first, then
+        # the negative side by symmetry.
+        a_hi = np.arange(alpha[-1] + step, np.pi - max(alpha[-1], step), step)
+        cl_hi, cd_hi = post_stall(a_hi, alpha[-1], cl[-1], cd[-1], cd_max)
+        a_lo = np.arange(-alpha[0] + step, np.pi - max(-alpha[0], step), step)
+        cl_lo, cd_lo = post_stall(a_lo, -alpha[0], -cl[0], cd[0], cd_max)
+
+        # Reversed flow at +-180 degrees: no lift, and the drag at stall.
+        cd_rev = 0.5*(cd[0] + cd[-1])
+        x = np.concatenate(([-np.pi], -a_lo[::-1], alpha, a_hi, [np.pi]))
+        y_cl = np.concatenate(([0.0], -cl_lo[::-1], cl, cl_hi, [0.0]))
+        y_cd = np.concatenate(([cd_rev], cd_lo[::-1], cd, cd_hi, [cd_rev]))
+
+        self.alpha_range = (alpha[0], alpha[-1])
+        self.x = x
+        self.cl_c = PchipInterpolator(x, y_cl).c
+        self.cd_c = PchipInterpolator(x, y_cd).c
+
+    def segment(self, alpha):
+        ''' Knot index and offset into the segment for each alpha, wrapped to [-pi, pi) '''
+        alpha = np.mod(np.asarray(alpha, dtype=float) + np.pi, 2*np.pi) - np.pi
+        i = np.clip(np.searchsorted(self.x, alpha, side='right') - 1, 0, len(self.x) - 2)
+        return i, alpha - self.x[i]
+
+    @staticmethod
+    def horner(c, i, dx):
+        return ((c[0, i]*dx + c[1, i])*dx + c[2, i])*dx + c[3, i]
+
+    @staticmethod
+    def horner_deriv(c, i, dx):
+        return (3*c[0, i]*dx + 2*c[1, i])*dx + c[2, i]
+
+    def cl(self, alpha):
+        i, dx = self.segment(alpha)
+        return self.horner(self.cl_c, i, dx)
+
+    def cd(self, alpha):
+        i, dx = self.segment(alpha)
+        return self.horner(self.cd_c, i, dx)
+
+    def dcl(self, alpha):
+        ''' dCL/dalpha '''
+        i, dx = self.segment(alpha)
+        return self.horner_deriv(self.cl_c, i, dx)
+
+    def dcd(self, alpha):
+        ''' dCD/dalpha '''
+        i, dx = self.segment(alpha)
+        return self.horner_deriv(self.cd_c, i, dx)
+
+    def __call__(self, alpha):
+        ''' cl, cd, dcl, dcd with one search '''
+        i, dx = self.segment(alpha)
+        return (self.horner(self.cl_c, i, dx), self.horner(self.cd_c, i, dx),
+                self.horner_deriv(self.cl_c, i, dx), self.horner_deriv(self.cd_c, i, dx))
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    a = np.radians(np.arange(-12, 17, 1.0))
+    cl = 1.2*np.tanh(2*np.pi*(a + 0.03)/1.2)
+    cd = 0.01 + 0.02*cl**2 + 0.5*np.maximum(0, np.abs(a) - 0.2)
+    m = PolarModel(a, cl, cd)
+
+    alpha = np.radians(np.linspace(-180, 180, 721))
+    plt.plot(np.degrees(alpha), m.cl(alpha), label='CL')
+    plt.plot(np.degrees(alpha), m.cd(alpha), label='CD')
+    plt.plot(np.degrees(a), cl, 'x', label='CL points')
+    plt.plot(np.degrees(a), cd, 'o', label='CD points')
+    plt.legend()
+    plt.grid(True)
+    plt.xlabel('Angle of Attack')
+    plt.show()
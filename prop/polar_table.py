@@ -0,0 +1,230 @@
+'''
+    Tabulated polars for families of foils
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    An offline build step simulates a regular grid over (thickness, trailing
+    edge, Re, Mach, alpha) for a family of foils (ARADFoil, or NACA4 with a
+    fixed camber and camber position) and saves CL and CD as a lookup table.
+    The TabulatedSimulatedFoil interpolates the table, so a design inside the
+    table's envelope never waits for XFOIL.
+
+        python3 polar_table.py arad
+        python3 polar_table.py naca4 --m 0.04 --p 0.4
+
+    The simulations go through XfoilSimulatedFoil, so they are stored in
+    foil_simulator.db as they finish and an interrupted build resumes where
+    it stopped.
+'''
+import os
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+import foil
+import foil_ARA
+import foil_simulator
+from foil_simulator import SimulatedFoil, PlateSimulatedFoil, XfoilSimulatedFoil
+
+import logging
+logger = logging.getLogger(__name__)
+
+TABLE_DIR = os.environ.get('POLAR_TABLE_DIR', 'tables')
+
+# The default grid
+THICKNESS = np.arange(0.04, 0.201, 0.02)
+TRAILING_EDGE = np.array([0.0, 0.01, 0.02, 0.04])
+MACH = np.array([0.0, 0.1, 0.2, 0.3])
+ALPHA = np.radians(np.arange(-20.0, 20.1, 0.5))
+
+
+def family_name(f):
+    ''' The name of the table for a foil, or None if it isn't in a tabulated family '''
+    if isinstance(f, foil_ARA.ARADFoil):
+        return 'arad'
+    if isinstance(f, foil.NACA4):
+        return 'naca4_m{:4.2f}_p{:3.1f}'.format(f.m, f.p)
+    return None
+
+def family_foil(name, thickness, te):
+    ''' A unit chord foil of a family '''
+    if name == 'arad':
+        f = foil_ARA.ARADFoil(chord=1.0, thickness=thickness)
+    else:
+        m, p = [float(w[1:]) for w in name.split('_')[1:3]]
+        f = foil.NACA4(chord=1.0, thickness=thickness, m=m, p=p)
+    f.set_trailing_edge(te)
+    return f
+
+
+class PolarTable:
+    '''
+    CL and CD on a regular (thickness, trailing edge, log10 Re, Mach, alpha)
+    grid. Points that XFOIL didn't converge are nan, and interpolating near
+    them gives nan.
+    '''
+    def __init__(self, thickness, te, reynolds, mach, alpha, cl, cd):
+        self.thickness = thickness
+        self.te = te
+        self.reynolds = reynolds
+        self.mach = mach
+        self.alpha = alpha
+        self.cl = cl
+        self.cd = cd
+        axes = (thickness, te, np.log10(reynolds), mach, alpha)
+        self.interpolator = RegularGridInterpolator(axes, np.stack((cl, cd), axis=-1),
+                                                    bounds_error=False, fill_value=np.nan)
+
+    def __call__(self, thickness, te, reynolds, Ma, alpha):
+        ''' (cl, cd) at a point, nan outside the envelope '''
+        return self.interpolator([thickness, te, np.log10(reynolds), Ma, alpha])[0]
+
+    def save(self, filename):
+        np.savez(filename, thickness=self.thickness, te=self.te, reynolds=self.reynolds,
+                 mach=self.mach, alpha=self.alpha, cl=self.cl, cd=self.cd)
+
+    @staticmethod
+    def load(filename):
+        d = np.load(filename)
+        return PolarTable(d['thickness'], d['te'], d['reynolds'], d['mach'], d['alpha'], d['cl'], d['cd'])
+
+
+def build_table(name, thickness=THICKNESS, te=TRAILING_EDGE, reynolds=foil_simulator.RE_SPACE,
+                mach=MACH, alpha=ALPHA):
+    ''' Simulate every polar of the grid (those in the database are reused) and tabulate CL and CD '''
+    shape = (len(thickness), len(te), len(reynolds), len(mach), len(alpha))
+    cl = np.full(shape, np.nan)
+    cd = np.full(shape, np.nan)
+    conditions = [(re, ma) for re in reynolds for ma in mach]
+    for i, t in enumerate(thickness):
+        for j, e in enumerate(te):
+            fs = XfoilSimulatedFoil(family_foil(name, t, e))
+            logger.info("Tabulating {} thickness={:4.2f} te={:4.2f}".format(name, t, e))
+            fs.simulate_polars(conditions)
+            for k, re in enumerate(reynolds):
+                for l, ma in enumerate(mach):
+                    polar = fs.get_polar_from_db(None, re, ma)
+                    if polar is None:
+                        continue
+                    a, c_l, c_d = [np.array(p) for p in polar]
+                    order = np.argsort(a)
+                    a = a[order]
+                    inside = (alpha >= a[0]) & (alpha <= a[-1])
+                    cl[i, j, k, l, inside] = np.interp(alpha[inside], a, c_l[order])
+                    cd[i, j, k, l, inside] = np.interp(alpha[inside], a, c_d[order])
+    logger.info("{} of {} table entries converged".format(np.sum(np.isfinite(cl)), cl.size))
+    return PolarTable(np.asarray(thickness), np.asarray(te), np.asarray(reynolds),
+                      np.asarray(mach), np.asarray(alpha), cl, cd)
+
+
+_tables = {}
+
+def get_table(name):
+    ''' The table for a family, loaded from TABLE_DIR on first use, or None '''
+    if name not in _tables:
+        filename = os.path.join(TABLE_DIR, '{}.npz'.format(name))
+        _tables[name] = PolarTable.load(filename) if os.path.exists(filename) else None
+        if _tables[name] is None:
+            logger.warning("No polar table {}".format(filename))
+    return _tables[name]
+
+
+class TabulatedSimulatedFoil(PlateSimulatedFoil):
+    '''
+    CL and CD interpolated from the polar table of the foil's family. Outside
+    the table's envelope (or where the table has no data) it asks an
+    XfoilSimulatedFoil, created on first use.
+    '''
+    def __init__(self, foil, **kwargs):
+        PlateSimulatedFoil.__init__(self, foil)
+        name = family_name(foil)
+        self.table = get_table(name) if name is not None else None
+        self.kwargs = kwargs
+        self.fallback = None
+        self.last = (None, None, None)
+
+    def get_xfoil(self):
+        if self.fallback is None:
+            self.fallback = XfoilSimulatedFoil(self.foil, **self.kwargs)
+        return self.fallback
+
+    def lookup(self, v, alpha):
+        ''' (cl, cd) from the table, nan outside it. The last lookup is kept, as
+            get_cd usually follows get_cl at the same point.
+        '''
+        if self.last[0] == v and self.last[1] == alpha:
+            return self.last[2]
+        if self.table is None:
+            value = (np.nan, np.nan)
+        else:
+            f = self.foil
+            value = self.table(f.thickness, f.trailing_edge, f.Reynolds(v), f.Mach(v), alpha)
+        self.last = (v, alpha, value)
+        return value
+
+    def get_cl(self, v, alpha):
+        cl = self.lookup(v, alpha)[0]
+        if np.isnan(cl):
+            return self.get_xfoil().get_cl(v, alpha)
+        return cl
+
+    def get_cd(self, v, alpha):
+        cd = self.lookup(v, alpha)[1]
+        if np.isnan(cd):
+            return self.get_xfoil().get_cd(v, alpha)
+        return cd
+
+    def get_cl_cd(self, v, alpha):
+        v, alpha = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(alpha, dtype=float))
+        if v.ndim == 0:
+            return self.get_cl(v[()], alpha[()]), self.get_cd(v[()], alpha[()])
+        if self.table is None:
+            return self.get_xfoil().get_cl_cd(v, alpha)
+        f = self.foil
+        value = self.table.interpolator(np.stack(np.broadcast_arrays(f.thickness, f.trailing_edge,
+                    np.log10(f.Reynolds(v)), f.Mach(v), alpha), axis=-1))
+        cl = value[..., 0]
+        cd = value[..., 1]
+        outside = np.isnan(cl) | np.isnan(cd)
+        if np.any(outside):
+            cl[outside], cd[outside] = self.get_xfoil().get_cl_cd(v[outside], alpha[outside])
+        return cl[()], cd[()]
+
+    # Not the plate's. The table is linear in alpha, so differences are exact between grid points.
+    get_dcl_dcd = SimulatedFoil.get_dcl_dcd
+
+    def get_zero_cl_angle(self, v):
+        return self.get_xfoil().get_zero_cl_angle(v)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Build a polar table for a family of foils.')
+    parser.add_argument('family', choices=['arad', 'naca4'])
+    parser.add_argument('--m', type=float, default=0.0, help="NACA4 maximum camber.")
+    parser.add_argument('--p', type=float, default=0.4, help="NACA4 location of maximum camber.")
+    parser.add_argument('--xfoil', default=None, help="The XFOIL executable.")
+    args = parser.parse_args()
+
+    out_hdlr = logging.StreamHandler(sys.stdout)
+    out_hdlr.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    for log in [logger, foil_simulator.logger]:
+        log.addHandler(out_hdlr)
+        log.setLevel(logging.INFO)
+
+    if args.xfoil:
+        import xfoil
+        xfoil.set_executable(args.xfoil)
+
+    if args.family == 'arad':
+        name = 'arad'
+    else:
+        name = family_name(foil.NACA4(chord=1.0, thickness=0.1, m=args.m, p=args.p))
+    table = build_table(name)
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    filename = os.path.join(TABLE_DIR, '{}.npz'.format(name))
+    table.save(filename)
+    logger.info("Saved {}".format(filename))
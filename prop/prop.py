@@ -8,7 +8,7 @@ import foil
 import stl_tools
 import motor_model
 
-from blade_element import BladeElement
+from blade_element import BladeElement, bem_blade
 from design_parameters import DesignParameters
 from scipy.interpolate import PchipInterpolator, interp1d
 
@@ -16,8 +16,49 @@ import os
 import logging
 logger = logging.getLogger(__name__)
 
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+
 import optimize
 import textwrap
+import xfoil
+import foil_simulator
+import polar_archive
+
+''' The prop a performance_map worker process evaluates '''
+_map_prop = None
+
+def _map_init(prop):
+    global _map_prop
+    _map_prop = prop
+    # The map processes share the cores, each gets one XFOIL worker
+    xfoil.set_pool_processes(1)
+
+def _map_point(rpm, u_0):
+    ''' (torque, thrust) at rpm and airspeed u_0, solved from the design dv
+        of the elements. Only the warm starts carry over from earlier points.
+    '''
+    for be in _map_prop.blade_elements:
+        be.restore_design()
+    return _map_prop.get_forces(rpm, u_0)
+
+def _map_sweep(u_0, rpms):
+    ''' (torque, thrust) at each of rpms and airspeed u_0, warm started one from the next '''
+    return [_map_point(rpm, u_0) for rpm in rpms]
+
+MAP_COLUMNS = ['thrust', 'torque', 'power', 'efficiency', 'CT', 'CP', 'J']
+
+def save_performance_map(pmap, basename):
+    ''' Write a performance_map to basename.npz, and to basename.csv with a row for
+        each rpm and airspeed (N, Nm, W and m/s)
+    '''
+    np.savez(basename + '.npz', **pmap)
+    rpm, airspeed = np.meshgrid(pmap['rpm'], pmap['airspeed'], indexing='ij')
+    columns = [rpm, airspeed] + [pmap[k] for k in MAP_COLUMNS]
+    np.savetxt(basename + '.csv', np.column_stack([c.ravel() for c in columns]), delimiter=',', \
+        header=','.join(['rpm', 'airspeed'] + MAP_COLUMNS), comments='', fmt='%.6g')
+    logger.info("Performance map written to {}.npz and {}.csv".format(basename, basename))
+
 
 class Prop:
     '''
@@ -31,6 +72,9 @@ class Prop:
         self.n_blades = 2
         self.max_depth_interpolator = None
         self.scimitar_interpolator = None
+        self.bem_solver = 'vector'
+        self.warm_starts = True
+        self.designs = {}   # r -> [(rpm, u_0, dv_goal, x)], the optimize_all solutions at each radius
 
 
     def new_blade_element(self, foilclass, r, rpm, twist):
@@ -161,15 +205,47 @@ class Prop:
         return self.max_depth_interpolator(r)
 
 
-    def get_forces(self, rpm):
+    def get_forces(self, rpm, u_0=None):
+        ''' Total torque and thrust at rpm (and the airspeed u_0, by default the
+            forward airspeed). With the 'vector' bem_solver the whole blade is
+            solved at once, and only the elements that it doesn't solve go through
+            BladeElement.bem. With 'phi' each element is solved for its inflow
+            angle, and with 'scalar' by minimizing lsq.
+
+            With warm_starts each element starts from its nearest solution at
+            another operating point, or else (element by element) from the
+            solution of its neighbour along the span.
+        '''
         torque = 0.0
         thrust = 0.0
+        u_0 = self.param.forward_airspeed if u_0 is None else u_0
         for be in self.blade_elements:
-            be.rpm = rpm
+            be.set_operating_point(rpm, u_0)
+        if self.warm_starts:
+            starts = [be.warm_start(rpm, u_0) for be in self.blade_elements]
+        else:
+            starts = [None]*len(self.blade_elements)
+        if self.bem_solver == 'vector':
+            solved = list(zip(*bem_blade(self.blade_elements, self.n_blades, x0=starts)))
+        else:
+            solved = [None]*len(self.blade_elements)
+
+        neighbour = None
+        for be, solution, start in zip(self.blade_elements, solved, starts):
             dv_goal = be.dv
-            dv, a_prime, err = be.bem(self.n_blades)
+            if (solution is not None) and (solution[2] < 0.01):
+                dv, a_prime, err = solution
+                be.set_bem(dv, a_prime)
+            else:
+                if solution is not None:
+                    logger.info("r={}: bem_blade err={}, using the scalar solver".format(be.r, solution[2]))
+                if (start is None) and self.warm_starts:
+                    start = neighbour
+                dv, a_prime, err = be.bem(self.n_blades, solver='phi' if self.bem_solver == 'phi' else 'slsqp', x0=start)
 
             if (err < 0.01):
+                be.remember()
+                neighbour = (dv, a_prime)
                 dT = be.dT()
                 dM = be.dM()
                 thrust += dT
@@ -184,10 +260,59 @@ class Prop:
                     be.dv = 1.0
                     be.a_prime = 0.0
 
+        logger.info("get_forces: rpm={}, u_0={}, solver iterations {}".format(rpm, u_0, dict(optimize.solver_iterations)))
         return torque, thrust
 
 
 
+    def performance_map(self, rpms, airspeeds, processes=None):
+        ''' Thrust, torque, power, efficiency (thrust*airspeed/power), the thrust and
+            power coefficients CT = T/(rho n^2 D^4) and CP = P/(rho n^3 D^5) and the
+            advance ratio J = u_0/(n D) of the blade, at every rpm and airspeed.
+            Returns a dict of arrays of shape (len(rpms), len(airspeeds)), with the
+            'rpm' and 'airspeed' axes (see save_performance_map).
+
+            The polars of the whole grid are prefetched first. Then the grid is
+            split into runs of rpms at one airspeed, each solved by get_forces in
+            one of processes worker processes (by default one per core), on its
+            own copy of the prop with one XFOIL worker. Every point is solved
+            from the design dv of the elements, warm started from the points
+            before. The workers share the polars through the database.
+        '''
+        rpms = np.asarray(rpms, dtype=float)
+        airspeeds = np.asarray(airspeeds, dtype=float)
+        processes = processes or cpu_count()
+        for be in self.blade_elements:
+            if be.design is None:
+                be.keep_design()
+
+        # The air speeds at the elements scale roughly with the rpm
+        self.prefetch_polars([(be, rpm, (airspeeds.min(), airspeeds.max() + 3*be.dv*rpm/be.rpm), (0.0, 0.3)) \
+            for rpm in rpms for be in self.blade_elements])
+
+        chunks = int(np.ceil(processes/len(airspeeds)))
+        runs = [(j, part) for j in range(len(airspeeds)) for part in np.array_split(np.arange(len(rpms)), chunks) \
+            if len(part) > 0]
+        torque = np.zeros((len(rpms), len(airspeeds)))
+        thrust = np.zeros((len(rpms), len(airspeeds)))
+        logger.info("performance_map: {} rpms x {} airspeeds in {} runs on {} processes".format( \
+            len(rpms), len(airspeeds), len(runs), processes))
+        with ProcessPoolExecutor(processes, initializer=_map_init, initargs=(self,)) as executor:
+            futures = [(j, part, executor.submit(_map_sweep, airspeeds[j], rpms[part])) for j, part in runs]
+            for j, part, future in futures:
+                torque[part, j], thrust[part, j] = np.array(future.result()).T
+
+        rho = self.get_air_density()
+        D = 2.0*self.param.radius
+        n = rpms[:, np.newaxis]/60.0
+        u_0 = airspeeds[np.newaxis, :]
+        power = torque*2.0*np.pi*n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = np.where(power > 0, thrust*u_0/power, 0.0)
+        return {'rpm': rpms, 'airspeed': airspeeds, 'thrust': thrust, 'torque': torque, 'power': power,
+                'efficiency': efficiency, 'CT': thrust/(rho*n**2*D**4), 'CP': power/(rho*n**3*D**5),
+                'J': u_0/(n*D)*np.ones_like(thrust)}
+
     def gen_mesh(self, filename, n):
         import pygmsh as pg
         geom = pg.Geometry()
@@ -347,6 +472,88 @@ class Prop:
         hub_loss = 2.0 * np.arccos(np.exp(-f)) / np.pi
         return tip_loss*hub_loss 
         
+    def polar_conditions(self, be, rpm, u_range, a_prime_range):
+        ''' The (reynolds, Ma) polars that a blade element's simulator quantizes
+            to, for axial air speeds in u_range and a_prime in a_prime_range
+        '''
+        fs = be.fs
+        omega = (rpm / 60.0) * 2.0 * np.pi
+        u = np.array(u_range)
+        v = omega*be.r*(1.0 - np.array(a_prime_range))
+        v_rel = np.sqrt(u**2 + v[:, np.newaxis]**2)
+        v_min, v_max = np.min(v_rel), np.max(v_rel)
+        if (be.foil.Reynolds(v_max) < 30000):
+            return []
+        v_min = max(v_min, 30000*v_max/be.foil.Reynolds(v_max))
+        # The nearest polars, the only ones get_corners simulates
+        re_lo, re_hi = fs.get_reynolds(v_min), fs.get_reynolds(v_max)
+        reynolds = foil_simulator.RE_SPACE[(foil_simulator.RE_SPACE >= re_lo) & (foil_simulator.RE_SPACE <= re_hi)]
+        mach = np.arange(fs.get_mach(v_min), fs.get_mach(v_max) + 0.01, 0.05)
+        return [(re, np.round(ma, 2)) for re in reynolds for ma in mach if ma <= 0.97]
+
+    def prefetch_polars(self, elements):
+        ''' Simulate, in one batch, the polars that a list of (blade element, rpm,
+            u_range, a_prime_range) will need and that aren't stored yet. Blade
+            elements with the same foil fingerprint share their conditions.
+        '''
+        plan = {}
+        for be, rpm, u_range, a_prime_range in elements:
+            if not isinstance(be.fs, foil_simulator.XfoilSimulatedFoil):
+                continue
+            fs, conditions = plan.setdefault(be.fs.hash, (be.fs, set()))
+            for reynolds, Ma in self.polar_conditions(be, rpm, u_range, a_prime_range):
+                if polar_archive.lookup(fs.hash, reynolds, Ma) is None:
+                    conditions.add((reynolds, Ma))
+        plan = [(fs, sorted(conditions)) for fs, conditions in plan.values()]
+        n_planned = sum([len(conditions) for fs, conditions in plan])
+        missing = [(fs, [c for c in conditions if fs.get_from_db(None, c[0], c[1]) is None]) for fs, conditions in plan]
+        missing = [(fs, conditions) for fs, conditions in missing if len(conditions) > 0]
+        n_missing = sum([len(conditions) for fs, conditions in missing])
+        logger.info("Prefetch: {} polars of {} foils needed, {} to simulate".format(n_planned, len(plan), n_missing))
+        if n_missing > 0:
+            foil_simulator.simulate_foils(missing)
+
+    def plan_polars(self, optimum_rpm, dv_goal, radial_points):
+        ''' Blade elements as full_optimize will build them, with the range of air
+            speeds optimize_all will search, for prefetch_polars. Each element's
+            twist comes from the one before, so the twist is predicted as the
+            inflow angle there.
+        '''
+        u_0 = self.param.forward_airspeed
+        omega = (optimum_rpm /  60.0) * 2.0 * np.pi
+        elements = []
+        prev_twist = 0.0
+        for r in radial_points:
+            phi = np.arctan((u_0 + dv_goal)/(omega*r))
+            dv_modified = dv_goal*self.tip_loss(r, phi)
+            be = self.new_foil(r, optimum_rpm, prev_twist)
+            # The bounds of optimize_all
+            elements.append((be, optimum_rpm, (u_0 + dv_modified/2, u_0 + 2*dv_modified), (0.0, 0.2)))
+            prev_twist = phi
+        return elements
+
+    NEARBY = 0.3    # How far (in log rpm and log dv) a design is still a useful warm start
+
+    def design_warm_start(self, r, rpm, u_0, dv_goal, neighbour):
+        ''' A starting point for optimize_all at radius r. The nearest design there
+            at another operating point (full_optimize keeps them in self.designs),
+            else that of the neighbouring element, neighbour = (r, dv_goal, x),
+            else None.
+        '''
+        omega = (rpm /  60.0) * 2.0 * np.pi
+        designs = self.designs.get(r, [])
+        if len(designs) > 0:
+            distance = [abs(np.log(rpm/d_rpm)) + abs(np.log(dv_goal/d_dv_goal)) + abs(u_0 - d_u_0)/(omega*r) \
+                for d_rpm, d_u_0, d_dv_goal, x in designs]
+            d_rpm, d_u_0, d_dv_goal, x = designs[int(np.argmin(distance))]
+            if min(distance) < self.NEARBY:
+                return optimize.design_start(x, r, d_dv_goal, (d_rpm /  60.0) * 2.0 * np.pi, d_u_0, \
+                    r, dv_goal, omega, u_0)
+        if neighbour is not None:
+            n_r, n_dv_goal, x = neighbour
+            return optimize.design_start(x, n_r, n_dv_goal, omega, u_0, r, dv_goal, omega, u_0)
+        return None
+
     def full_optimize(self, optimum_torque, optimum_rpm, thrust):
         self.blade_elements = []
         u_0 = self.param.forward_airspeed
@@ -376,6 +583,11 @@ class Prop:
         plt.xlabel('radius')
         plt.show()
         #return None
+
+        # Simulate every polar the optimization is expected to need up front, on all cores
+        self.prefetch_polars(self.plan_polars(optimum_rpm, dv_goal, radial_points))
+
+        neighbour = None
         for r in radial_points:
             u = u_0 + dv_goal
             v = omega*r
@@ -390,8 +602,13 @@ class Prop:
             x_limit = self.get_max_chord(r, prev_twist)
             maxchord = be.foil.get_max_chord(x_limit, y_limit, prev_twist) # Assumes that the foil chord is 1.0
 
+            x0 = None
+            if self.warm_starts:
+                x0 = self.design_warm_start(r, optimum_rpm, u_0, dv_modified, neighbour)
             x, fun = optimize.optimize_all(foil_simulator=be.fs, dv_goal=dv_modified, \
-                rpm = optimum_rpm, B = self.n_blades, r = r, dr=dr, u_0 = u_0, maxchord = maxchord)
+                rpm = optimum_rpm, B = self.n_blades, r = r, dr=dr, u_0 = u_0, maxchord = maxchord, x0=x0)
+            self.designs.setdefault(r, []).append((optimum_rpm, u_0, dv_modified, x))
+            neighbour = (r, dv_modified, x)
             theta, dv, a_prime, chord = x
             be.set_chord(chord)
             #if (fun > 0.03):
@@ -419,6 +636,7 @@ class Prop:
 
             be.set_twist(theta)
             be.set_bem(dv, a_prime)
+            be.keep_design()
             twist_angles.append(theta)
             chords.append(be.foil.chord)
             
@@ -433,6 +651,7 @@ class Prop:
             self.blade_elements.append(be)
             prev_twist = theta
             
+        logger.info("full_optimize: solver iterations {}".format(dict(optimize.solver_iterations)))
         self.blade_elements.reverse()
         twist_angles.reverse()
         chords.reverse()
@@ -469,6 +688,8 @@ class Prop:
             be.set_twist(twist_angle_poly(be.r))
             print(be)
 
+        # And those of the smoothed blade, over the bounds of bem_iterate
+        self.prefetch_polars([(be, optimum_rpm, (u_0, u_0 + 3*be.dv), (0.0, 0.3)) for be in self.blade_elements])
             
         torque, thrust = self.get_forces(optimum_rpm)
         return torque, thrust
@@ -508,13 +729,36 @@ if __name__ == "__main__":
     parser.add_argument('--resolution', type=int, default=40, help="The number of blade elements.")
     parser.add_argument('--dir', default='.', help="The directory for output files")
     parser.add_argument('--stl-file', default='prop.stl', help="The STL filename to generate.")
+    parser.add_argument('--xfoil', default=None, help="The XFOIL executable (fake_xfoil.py for benchmarking).")
+    parser.add_argument('--archive', default=None, help="A polar archive to read before the database (see polar_archive.py).")
+    parser.add_argument('--table', action='store_true', help="Interpolate polars from the tables built by polar_table.py where possible.")
+    parser.add_argument('--interpolate', action='store_true', help="Interpolate in log Re towards simulated polars on the far side of each Reynolds number, rather than using the nearest polar.")
+    parser.add_argument('--bem-solver', default='vector', choices=['vector', 'phi', 'scalar'], help="Solve the BEM equations of the whole blade at once, element by element for the inflow angle, or element by element with SLSQP.")
+    parser.add_argument('--cold-start', action='store_true', help="Start every optimization and BEM solution from scratch, rather than from the neighbouring element or operating point.")
+    parser.add_argument('--map', action='store_true', help="Write the performance map (thrust, torque, power, efficiency, CT, CP, J over RPM and airspeed) of the design.")
+    parser.add_argument('--map-rpms', type=int, default=30, help="The number of RPMs (from a third to twice the optimum) in the performance map.")
+    parser.add_argument('--map-airspeeds', type=int, default=11, help="The number of airspeeds in the performance map.")
+    parser.add_argument('--map-airspeed', type=float, default=20.0, help="The highest airspeed (m/s) in the performance map.")
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes for the performance map (default one per core).")
+    parser.add_argument('--polar-model', default='poly', choices=['poly', 'pchip'], help="Fit polars with a polynomial, or PCHIP with a post-stall extension.")
     args = parser.parse_args()
+
+    if args.xfoil:
+        xfoil.set_executable(args.xfoil)
+    if args.archive:
+        polar_archive.set_archive(args.archive)
+    foil_simulator.POLAR_MODEL = args.polar_model
+    foil_simulator.INTERPOLATE = args.interpolate
+    if args.table:
+        import blade_element
+        import polar_table
+        blade_element.FoilSimulator = polar_table.TabulatedSimulatedFoil
     
     # Set up Logging
     path = 'logging.yaml'
     if os.path.exists(path):
         with open(path, 'rt') as f:
-            config = yaml.load(f.read())
+            config = yaml.safe_load(f.read())
         logging.config.dictConfig(config)
 
     # Decode Design Parameters
@@ -526,6 +770,8 @@ if __name__ == "__main__":
         p = NACAProp(param, resolution_m)
     else:
         p = Prop(param, resolution_m)
+    p.bem_solver = args.bem_solver
+    p.warm_starts = not args.cold_start
 
     m = motor_model.Motor(Kv = param.motor_Kv, I0 = param.motor_no_load_current, Rm = param.motor_winding_resistance)
     optimum_torque, optimum_rpm = m.get_Qmax(param.motor_volts)
@@ -550,13 +796,17 @@ if __name__ == "__main__":
                 thrust *= 0.95 * goal_torque/Q
                 Q, T =p.full_optimize(optimum_torque, optimum_rpm, thrust=thrust)
                 print(("Total Thrust: {:5.2f} (N), Torque: {:5.2f} (Nm)".format(T, Q)))
-
-        # Print Thrust and Torque as a function of RPM.
-        #print("RPM, \t\t THRUST, \t TORQUE")
-        #rpm_list = np.linspace(optimum_rpm/3, 2*optimum_rpm, 30)
-        #for rpm in rpm_list:
-            #torque, thrust = p.get_forces(rpm)
-            #print("{:5.3f}, \t {:5.3f}, \t{:5.3f}".format(rpm, thrust, torque))
+        logger.info(foil_simulator.polar_cache)
+
+        if (args.map):
+            # Thrust and Torque as a function of RPM and airspeed.
+            rpm_list = np.linspace(optimum_rpm/3, 2*optimum_rpm, args.map_rpms)
+            airspeed_list = np.linspace(0.0, args.map_airspeed, args.map_airspeeds)
+            pmap = p.performance_map(rpm_list, airspeed_list, processes=args.processes)
+            save_performance_map(pmap, "{}/{}_performance".format(args.dir, param.name))
+            print("RPM, \t\t THRUST, \t TORQUE (airspeed {:4.1f} m/s)".format(airspeed_list[0]))
+            for rpm, thrust, torque in zip(rpm_list, pmap['thrust'][:, 0], pmap['torque'][:, 0]):
+                print("{:5.3f}, \t {:5.3f}, \t{:5.3f}".format(rpm, thrust, torque))
 
 
     if (args.mesh):
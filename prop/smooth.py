@@ -55,7 +55,7 @@ def smooth(x,window_len=11,window='hanning'):
         w=eval('numpy.'+window+'(window_len)')
 
     y=numpy.convolve(w/w.sum(),s,mode='valid')
-    return y[(window_len/2):-(window_len/2)]
+    return y[(window_len//2):-(window_len//2)]
 
 if __name__=="__main__":
     t=numpy.linspace(-2,2,20)
@@ -0,0 +1,63 @@
+'''
+    Interrupting warm_cache.py and resuming it
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    Runs warm_cache.py with the fake XFOIL in a temporary directory, sends it
+    SIGINT once a batch has been checkpointed, then runs it again to finish.
+
+        python3 -m pytest test_warm_cache.py
+'''
+import os
+import sys
+import time
+import shutil
+import signal
+import sqlite3
+import subprocess
+
+PROP_DIR = os.path.dirname(os.path.realpath(__file__))
+ARGS = ['naca4', '--m', '0.02', '0.02', '1', '--p', '0.4', '0.4', '1', '--t', '0.12', '0.12', '1',
+        '--te', '0.0', '--mach', '0.0', '--batch', '2', '--xfoil', os.path.join(PROP_DIR, 'fake_xfoil.py')]
+N_CONDITIONS = 20   # len(foil_simulator.RE_SPACE) at one Mach number
+
+
+def warm_cache(cwd):
+    # fake_xfoil.py runs with the python3 on the PATH, give it this one
+    env = dict(os.environ, PATH=os.path.dirname(sys.executable) + os.pathsep + os.environ.get('PATH', ''))
+    return subprocess.Popen([sys.executable, os.path.join(PROP_DIR, 'warm_cache.py')] + ARGS, cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+def n_warmed(cwd):
+    try:
+        with sqlite3.connect(os.path.join(cwd, 'foil_simulator.db'), timeout=60) as conn:
+            return conn.execute("SELECT count(*) FROM warmed").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0   # Not created yet
+
+
+def test_interrupt_and_resume(tmp_path):
+    cwd = str(tmp_path)
+    for sql in ['foil_simulator.sql', 'foil_simulator_v1.sql']:
+        shutil.copy(os.path.join(PROP_DIR, sql), cwd)
+
+    proc = warm_cache(cwd)
+    deadline = time.time() + 300
+    while (n_warmed(cwd) == 0) and (proc.poll() is None) and (time.time() < deadline):
+        time.sleep(0.2)
+    assert proc.poll() is None, proc.communicate()[0]
+    proc.send_signal(signal.SIGINT)
+    output = proc.communicate(timeout=120)[0]
+    assert proc.returncode == 1, output
+    assert "Run the same command again to resume" in output
+    assert "Traceback" not in output
+    interrupted = n_warmed(cwd)
+    assert 0 < interrupted < N_CONDITIONS
+
+    proc = warm_cache(cwd)
+    output = proc.communicate(timeout=600)[0]
+    assert proc.returncode == 0, output
+    assert "({} from earlier runs)".format(interrupted) in output
+    assert n_warmed(cwd) == N_CONDITIONS
@@ -0,0 +1,161 @@
+'''
+    Warm the polar cache for a family of foils
+
+    Author Tim Molteno tim@elec.ac.nz
+
+    Copyright 2016-2017
+
+    Simulates every polar of a family of foils on the grid of conditions that
+    XfoilSimulatedFoil quantizes to (RE_SPACE, and Mach in steps of 0.05), so
+    the first design on a new machine doesn't wait for XFOIL.
+
+        python3 warm_cache.py naca4 --m 0 0.06 0.02 --p 0.3 0.5 0.1 --t 0.06 0.2 0.02
+        python3 warm_cache.py arad --t 0.06 0.2 0.01
+        python3 warm_cache.py arad_fixed
+
+    The simulations run in batches on all cores. Each finished condition is
+    recorded in the warmed table of foil_simulator.db (along with the polars
+    themselves), so after Ctrl-C the same command carries on where it stopped,
+    without retrying the conditions that didn't simulate.
+'''
+import time
+
+import numpy as np
+
+import foil
+import foil_ARA
+import foil_simulator
+import xfoil
+from foil_simulator import XfoilSimulatedFoil
+
+import logging
+logger = logging.getLogger(__name__)
+
+TRAILING_EDGE = [0.0, 0.01, 0.02, 0.04]
+MACH = np.arange(0.0, 0.301, 0.05)
+
+
+def frange(start, stop, step):
+    ''' start to stop inclusive, in steps '''
+    return np.round(np.arange(start, stop + step/2, step), 6)
+
+def family_foils(family, m=None, p=None, t=None, te=TRAILING_EDGE):
+    ''' The unit chord foils of a family, as (name, foil) pairs '''
+    foils = []
+    for e in te:
+        if family == 'naca4':
+            shapes = [('NACA4 m={} p={} t={}'.format(mi, pi, ti), foil.NACA4(chord=1.0, thickness=ti, m=mi, p=pi))
+                      for mi in m for pi in p for ti in t]
+        elif family == 'arad':
+            shapes = [('ARADFoil t={}'.format(ti), foil_ARA.ARADFoil(chord=1.0, thickness=ti)) for ti in t]
+        else:
+            shapes = [('ARAD_{}'.format(n), getattr(foil_ARA, 'ARAD_{}_Foil'.format(n))(1.0)) for n in [6, 10, 13, 20]]
+        for name, f in shapes:
+            f.set_trailing_edge(e)
+            foils.append(('{} te={}'.format(name, e), f))
+    return foils
+
+
+def get_warmed(fs):
+    ''' The (reynolds, Ma) conditions of a simulator that have been warmed '''
+    c = fs.get_db().cursor()
+    return set(c.execute("SELECT reynolds, mach FROM warmed WHERE (foil_id=?)", (fs.foil_id,)).fetchall())
+
+def set_warmed(fs, conditions, results, elapsed):
+    ''' Checkpoint conditions, with their simulate_polars results '''
+    with fs.get_db() as conn:
+        conn.executemany('''INSERT INTO warmed(foil_id, reynolds, mach, stored, elapsed) VALUES (?,?,?,?,?)
+                            ON CONFLICT(foil_id, reynolds, mach) DO UPDATE SET stored=excluded.stored, elapsed=excluded.elapsed''',
+                         [(fs.foil_id, float(re), float(ma), int(r is None), elapsed)
+                          for (re, ma), r in zip(conditions, results)])
+
+
+class Progress:
+    ''' Throughput and failure rate of the polars simulated so far '''
+    def __init__(self, total, done):
+        self.total = total
+        self.done = done
+        self.simulated = 0
+        self.failed = 0
+        self.start_time = time.time()
+
+    def add(self, results):
+        self.simulated += len(results)
+        self.failed += len([r for r in results if r is not None])
+
+    def __str__(self):
+        minutes = (time.time() - self.start_time) / 60.0
+        rate = self.simulated / minutes if minutes > 0 else 0.0
+        failure_rate = 100.0*self.failed / self.simulated if self.simulated > 0 else 0.0
+        remaining = self.total - self.done - self.simulated
+        eta = remaining / rate if rate > 0 else np.inf
+        return "{} of {} polars ({} from earlier runs), {:5.1f} polars/minute, {:4.1f}% failed, {:5.1f} minutes left".format(
+            self.done + self.simulated, self.total, self.done, rate, failure_rate, eta)
+
+
+def warm(foils, conditions, batch_size=None):
+    ''' Simulate the conditions of every foil that haven't been warmed, batch_size polars at a time '''
+    batch_size = batch_size or 4*xfoil.cpu_count()
+    pending = []
+    done = 0
+    for name, f in foils:
+        fs = XfoilSimulatedFoil(f)
+        warmed = get_warmed(fs)
+        todo = [c for c in conditions if (float(c[0]), float(c[1])) not in warmed]
+        done += len(conditions) - len(todo)
+        for i in range(0, len(todo), batch_size):
+            pending.append((fs, todo[i:i + batch_size]))
+    progress = Progress(len(foils)*len(conditions), done)
+    logger.info(progress)
+
+    while len(pending) > 0:
+        # The next batch_size polars, in as few foils as possible
+        plan = []
+        n = 0
+        while (len(pending) > 0) and (n + len(pending[0][1]) <= batch_size or n == 0):
+            fs, todo = pending.pop(0)
+            plan.append((fs, todo))
+            n += len(todo)
+        start_time = time.time()
+        results = foil_simulator.simulate_foils(plan)
+        elapsed = time.time() - start_time
+        for (fs, todo), r in zip(plan, results):
+            set_warmed(fs, todo, r, elapsed / n)
+            progress.add(r)
+        logger.info(progress)
+    return progress
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Fill foil_simulator.db with the polars of a family of foils.')
+    parser.add_argument('family', choices=['naca4', 'arad', 'arad_fixed'])
+    parser.add_argument('--m', type=float, nargs=3, default=[0.0, 0.06, 0.02], metavar=('START', 'STOP', 'STEP'), help="NACA4 maximum camber.")
+    parser.add_argument('--p', type=float, nargs=3, default=[0.3, 0.5, 0.1], metavar=('START', 'STOP', 'STEP'), help="NACA4 location of maximum camber.")
+    parser.add_argument('--t', type=float, nargs=3, default=[0.06, 0.2, 0.02], metavar=('START', 'STOP', 'STEP'), help="Thickness.")
+    parser.add_argument('--te', type=float, nargs='+', default=TRAILING_EDGE, help="Trailing edge thicknesses (fraction of chord).")
+    parser.add_argument('--mach', type=float, nargs='+', default=MACH, help="Mach numbers (multiples of 0.05).")
+    parser.add_argument('--batch', type=int, default=None, help="Polars per batch (default 4 per core).")
+    parser.add_argument('--xfoil', default=None, help="The XFOIL executable.")
+    args = parser.parse_args()
+
+    out_hdlr = logging.StreamHandler(sys.stdout)
+    out_hdlr.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(out_hdlr)
+    logger.setLevel(logging.INFO)
+
+    if args.xfoil:
+        xfoil.set_executable(args.xfoil)
+
+    foils = family_foils(args.family, frange(*args.m), frange(*args.p), frange(*args.t), args.te)
+    conditions = [(re, ma) for re in foil_simulator.RE_SPACE for ma in np.round(np.asarray(args.mach)*20)/20]
+    logger.info("Warming {} foils at {} conditions".format(len(foils), len(conditions)))
+    try:
+        progress = warm(foils, conditions, args.batch)
+    except KeyboardInterrupt:
+        # The batch in progress is lost, the ones before it are in the database.
+        logger.info("Stopped. Run the same command again to resume.")
+        xfoil.close_pool(terminate=True)
+        sys.exit(1)
+    xfoil.close_pool()
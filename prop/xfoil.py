@@ -32,6 +32,21 @@ from queue import Queue, Empty
    INSTALL from https://github.com/RobotLocomotion/xfoil.git
 '''
 
+# The XFOIL executable. Override with the XFOIL_EXECUTABLE environment variable
+# or set_executable(), e.g. to use fake_xfoil.py for benchmarking.
+XFOIL = os.environ.get('XFOIL_EXECUTABLE', "/usr/local/bin/xfoil")
+#XFOIL = "/home/tim/github/xfoil/build/src/xfoil"
+
+def set_executable(path):
+    """
+    Use a different XFOIL executable. The worker pool is closed, so that
+    its processes are respawned with the new executable.
+    """
+    global XFOIL
+    XFOIL = os.path.realpath(path)
+    os.environ['XFOIL_EXECUTABLE'] = XFOIL
+    close_pool()
+
 
 def get_polar(airfoil, alpha, Re, Mach=None,
              normalize=True, iterlim=None, gen_naca=False, debug=False, timeout=10):
@@ -91,10 +106,11 @@ def get_polar(airfoil, alpha, Re, Mach=None,
         a = alpha
         xf.cmd("ALFA {:.3f}".format(a))
         test = True
-        start_time = time.time()
+        deadline = time.time() + timeout
 
         while test:
-            line = xf.readline()
+            # Block on the reader queue until a line arrives, rather than polling.
+            line = xf.readline(timeout=deadline - time.time())
             if line:
                 #print line
                 if re.search("Point added to stored polar", line):
@@ -110,28 +126,23 @@ def get_polar(airfoil, alpha, Re, Mach=None,
                 else:
                     output.append(line)
             else:
-                seconds = time.time() - start_time
-                time.sleep(0.01)
-                if seconds > timeout:
-                    logger.warning("Simulation Terminated!. a={:4.2f} taking too long".format(a))
+                logger.warning("Simulation Terminated!. a={:4.2f} taking too long".format(a))
 
-                    xf.close()
-                    raise RuntimeError('Runtime took too long')
+                xf.close()
+                raise RuntimeError('Runtime took too long')
         # List polar and send recognizable end marker
         xf.cmd("PLIS\nENDD\n\n", autonewline=False)
         
         #print "Xfoil module starting read"
         # Keep reading until end marker is encountered
         while not re.search("ENDD", output[-1]):
-            seconds = time.time() - start_time
-            if seconds > timeout:
+            line = xf.readline(timeout=deadline - time.time())
+            if line is None:
                 logger.warning("Simulation Terminated!. a={:4.2f} taking too long".format(a))
 
                 xf.close()
                 raise RuntimeError('Runtime took too long')
-
-            line = xf.readline()
-            if line:
+            else:
                 #print "End Search %s" % line
                 output.append(line)
                 #if (re.search("CPCALC: Local speed too large.", line)):
@@ -146,8 +157,336 @@ def get_polar(airfoil, alpha, Re, Mach=None,
 
 
 
-from multiprocessing import Pool
+from multiprocessing import Pool, cpu_count
+import multiprocessing.util
 import signal
+import atexit
+import tempfile
+import shutil
+import hashlib
+
+
+class XfoilWorker():
+    """
+    A warm XFOIL process that is kept open between polar requests.
+
+    The plotting and normalization flags are set once, when the process is
+    spawned. Each call to polar() loads an airfoil, sets up the OPER menu for
+    the requested Reynolds and Mach number, runs the angles of attack and
+    returns XFOIL to the top level menu ready for the next job. If XFOIL stops
+    responding the process is killed and a fresh one is spawned.
+
+    The geometry stays in XFOIL's buffer between jobs, so consecutive jobs for
+    the same airfoil (filename or NACA designation) skip loading and paneling.
+    Staged airfoil files are named by their contents, so the name identifies
+    the geometry.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.xf = None
+
+    def start(self):
+        path = os.path.dirname(os.path.realpath(__file__))
+        self.xf = Xfoil(path)
+        self.viscous = False
+        self.normalized = False
+        self.loaded = None
+        if (not self.debug):
+            # Disable G(raphics) flag in Plotting options
+            self.xf.cmd("PLOP\nG\n\n", autonewline=False)
+
+    def close(self):
+        if self.xf is not None:
+            self.xf.close()
+            self.xf = None
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def load(self, airfoil, normalize=True, gen_naca=False):
+        if self.xf is None:
+            self.start()
+        if self.loaded == (airfoil, normalize, gen_naca):
+            return
+        if (normalize != self.normalized):
+            # NORM toggles normalization, so only send it on a change.
+            self.xf.cmd("NORM")
+            self.normalized = normalize
+
+        # Generate NACA or load from file
+        if gen_naca:
+            self.xf.cmd(airfoil)
+        else:
+            self.xf.cmd('LOAD {}\n\n'.format(airfoil),
+                   autonewline=False)
+        self.xf.cmd("GDES")
+        self.xf.cmd("CADD\n\n1\n\n\n", autonewline=False)
+        self.xf.cmd("PCOP")
+        self.loaded = (airfoil, normalize, gen_naca)
+
+    def oper(self, Re, Mach=None, iterlim=None, ncrit=6):
+        """ Enter the OPER menu and start a new stored polar """
+        self.xf.cmd("OPER")
+        self.xf.cmd("VPAR\nVACC 0.0\nN {:g}\n\n".format(ncrit), autonewline=False)
+        if iterlim:
+            self.xf.cmd("ITER {:.0f}".format(iterlim))
+        if self.viscous:
+            # VISC toggles viscous mode, so a warm process only changes Re.
+            self.xf.cmd("RE {}".format(Re))
+        else:
+            self.xf.cmd("VISC {}".format(Re))
+            self.viscous = True
+        self.xf.cmd("MACH {:.3f}".format(Mach if Mach else 0.0))
+        # Turn polar accumulation on, double enter for no savefile or dumpfile
+        self.xf.cmd("PACC\n\n\n", autonewline=False)
+
+    def alfa(self, a, timeout):
+        """ Run a single angle of attack, waiting until it is added to the polar """
+        self.xf.cmd("ALFA {:.3f}".format(a))
+        deadline = time.time() + timeout
+        while True:
+            line = self.xf.readline(timeout=deadline - time.time())
+            if line is None:
+                logger.warning("Simulation Terminated!. a={:4.2f} taking too long".format(a))
+                raise RuntimeError('Runtime took too long')
+            if re.search("Point added to stored polar", line):
+                return
+            elif re.search("VISCAL:  Convergence failed", line):
+                logger.info("Convergence failed a={:4.2f}. Trying harder!".format(a))
+                self.xf.cmd("!")
+
+    def plis(self, timeout):
+        """ List the stored polar, then close and delete it and leave the OPER menu """
+        output = ['']
+        self.xf.cmd("PLIS\nENDD\n", autonewline=False)
+        deadline = time.time() + timeout
+        while not re.search("ENDD", output[-1]):
+            line = self.xf.readline(timeout=deadline - time.time())
+            if line is None:
+                logger.warning("Simulation Terminated!. PLIS taking too long")
+                raise RuntimeError('Runtime took too long')
+            output.append(line)
+        self.xf.cmd("PACC\nPDEL 0\n\n", autonewline=False)
+        return parse_stdout_polar(output)
+
+    def sweep(self, airfoil, alpha, Re, Mach=None,
+              normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+        """
+        Return the PLIS polar for a list of angles of attack, run in a single
+        XFOIL session. The sweep marches outward from 0 degrees in both
+        directions, so each point starts from the converged boundary layer of
+        its neighbour. The timeout applies to the whole sweep. The seconds the
+        sweep took are returned after the polar.
+        """
+        start_time = time.time()
+        alpha = np.sort(np.asarray(alpha, dtype=float))
+        upper = alpha[alpha >= 0]
+        lower = alpha[alpha < 0][::-1]
+
+        self.load(airfoil, normalize=normalize, gen_naca=gen_naca)
+        self.oper(Re, Mach, iterlim, ncrit)
+        for branch in [upper, lower]:
+            if len(branch) > 0:
+                self.xf.cmd("INIT")
+                self.xf.cmd(sweep_commands(branch))
+        try:
+            data, header, info = self.plis(timeout)
+        except RuntimeError:
+            logger.warning("Sweep Re={} Mach={} taking too long".format(Re, Mach))
+            self.restart()
+            return None
+        if len(data) > 0:
+            data = data[np.argsort(data['alpha'])]
+        return data, header, info, time.time() - start_time
+
+    def sweeps(self, airfoil, jobs,
+               normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+        """
+        Run a sweep for each (alpha, Re, Mach) in jobs on one airfoil. The
+        geometry is loaded and paneled once, then only the viscous settings
+        change from one polar to the next. Returns a list of results, None for
+        a sweep that timed out.
+        """
+        return [self.sweep(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout, ncrit)
+                for alpha, Re, Mach in jobs]
+
+    def polar(self, airfoil, alpha, Re, Mach=None,
+              normalize=True, iterlim=None, gen_naca=False, timeout=10):
+        """
+        Return the PLIS polar for a list of angles of attack. Angles that time
+        out are dropped, and the process is restarted to run the rest.
+        """
+        alpha = list(alpha)
+        while True:
+            self.load(airfoil, normalize=normalize, gen_naca=gen_naca)
+            self.oper(Re, Mach, iterlim)
+            try:
+                for a in alpha:
+                    failed = a
+                    self.alfa(a, timeout)
+                failed = None
+                return self.plis(timeout)
+            except RuntimeError:
+                self.restart()
+                if failed is None:
+                    return None
+                alpha.remove(failed)
+
+
+def sweep_commands(branch):
+    """ XFOIL commands to march through a sorted branch of angles of attack """
+    if len(branch) > 2:
+        step = np.diff(branch)
+        if np.allclose(step, step[0]):
+            return "ASEQ {:.3f} {:.3f} {:.3f}".format(branch[0], branch[-1], step[0])
+    return '\n'.join(["ALFA {:.3f}".format(a) for a in branch])
+
+
+_worker = None
+
+def _worker_init():
+    global _worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker = XfoilWorker()
+    multiprocessing.util.Finalize(_worker, _worker.close, exitpriority=10)
+
+def _worker_polar(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout):
+    return _worker.polar(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout)
+
+def _worker_sweep(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout, ncrit):
+    return _worker.sweep(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout, ncrit)
+
+def _worker_sweeps(airfoil, jobs, normalize, iterlim, gen_naca, timeout, ncrit):
+    return _worker.sweeps(airfoil, jobs, normalize, iterlim, gen_naca, timeout, ncrit)
+
+
+class XfoilPool():
+    """
+    A long-lived pool of warm XFOIL workers. Each worker process owns an
+    XfoilWorker, so a job only pays for loading the airfoil, not for
+    spawning and configuring XFOIL.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or cpu_count()
+        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.pool = Pool(self.processes, initializer=_worker_init)
+        signal.signal(signal.SIGINT, original_sigint_handler)
+
+    def submit(self, airfoil, alpha, Re, Mach=None,
+               normalize=True, iterlim=None, gen_naca=False, timeout=10):
+        """ Queue a polar job, returning an AsyncResult """
+        return self.pool.apply_async(_worker_polar,
+            (airfoil, list(alpha), Re, Mach, normalize, iterlim, gen_naca, timeout))
+
+    def submit_sweep(self, airfoil, alpha, Re, Mach=None,
+                     normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+        """ Queue a single session alpha sweep, returning an AsyncResult """
+        return self.pool.apply_async(_worker_sweep,
+            (airfoil, list(alpha), Re, Mach, normalize, iterlim, gen_naca, timeout, ncrit))
+
+    def submit_sweeps(self, airfoil, jobs,
+                      normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+        """ Queue sweeps for (alpha, Re, Mach) jobs on one airfoil and one worker, returning an AsyncResult """
+        jobs = [(list(alpha), Re, Mach) for alpha, Re, Mach in jobs]
+        return self.pool.apply_async(_worker_sweeps,
+            (airfoil, jobs, normalize, iterlim, gen_naca, timeout, ncrit))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+_pool = None
+_pool_pid = None
+_pool_processes = None
+
+def set_pool_processes(processes):
+    """
+    Use processes XFOIL workers (None for one per core) in the pools created
+    from now on, e.g. one in each of several processes that share the cores.
+    """
+    global _pool_processes
+    _pool_processes = processes
+
+def get_pool():
+    """ Return the process-wide XfoilPool, creating it on first use. A forked
+        process gets its own, the workers of the parent's pool don't answer it.
+    """
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool = None
+    if _pool is None:
+        _pool = XfoilPool(_pool_processes)
+        _pool_pid = os.getpid()
+        atexit.register(close_pool)
+    return _pool
+
+def close_pool(terminate=False):
+    global _pool
+    if (_pool is not None) and (_pool_pid == os.getpid()):
+        if terminate:
+            _pool.terminate()
+        else:
+            _pool.close()
+        _pool = None
+
+
+_stage_dir = None
+_stage_pid = None
+
+def stage_airfoil(points):
+    """
+    Write airfoil coordinates to this process's staging directory and return
+    the filename for XFOIL to LOAD. The file is named by a digest of its
+    contents, so a foil is written once and reused by every Re/Mach sweep.
+    The directory is on tmpfs (/dev/shm) when available, not in the current
+    working directory, and is removed when the process exits.
+    """
+    global _stage_dir, _stage_pid
+    if _stage_pid != os.getpid():
+        base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        _stage_dir = tempfile.mkdtemp(prefix='xfoil_', dir=base)
+        _stage_pid = os.getpid()
+        atexit.register(_remove_stage_dir, _stage_dir, _stage_pid)
+
+    digest = hashlib.sha1(points.encode()).hexdigest()[0:16]
+    filename = os.path.join(_stage_dir, "{}.dat".format(digest))
+    if not os.path.exists(filename):
+        # Write then rename, so a reader never sees a partial file.
+        tmpname = filename + '.tmp'
+        with open(tmpname, 'w') as af:
+            af.write(points)
+        os.replace(tmpname, filename)
+    return filename
+
+def _remove_stage_dir(path, pid):
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def merge_polar(polar, results):
+    """ Append the rows of a parsed PLIS polar to a dictionary of columns """
+    if results is None:
+        return polar
+    labels = results[1]
+    values = results[0]
+
+    if (polar is None):
+        polar = {}
+        for label in labels:
+            polar[label] = []
+
+    for label in labels:
+        polar[label].extend(values[label])
+    return polar
+
 
 def get_polars(airfoil, alpha, Re, Mach=None,
              normalize=True, iterlim=None, gen_naca=False):
@@ -158,92 +497,146 @@ def get_polars(airfoil, alpha, Re, Mach=None,
 
     mp = True
     if (mp):
-        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-        p = Pool()
-        signal.signal(signal.SIGINT, original_sigint_handler)
-    
-        resultList = []
-
+        p = get_pool()
+        # Contiguous chunks of alpha, one per worker.
+        chunks = [c for c in np.array_split(np.asarray(alpha), p.processes) if len(c) > 0]
         try:
-            for a in alpha:
-                resultList.append(p.apply_async(get_polar, (airfoil, a, Re, Mach, normalize, iterlim, gen_naca)))
-
-                
+            resultList = [p.submit(airfoil, c, Re, Mach, normalize, iterlim, gen_naca) for c in chunks]
             for polar_thread in resultList:
-                results = polar_thread.get(timeout=1000) # timeout=2000
-                if results is not None:
-                    labels = results[1]
-                    values = results[0]
-                    
-                    if (polar is None):
-                        polar = {}
-                        for label in labels:
-                            polar[label] = []
-                    
-                    for v in values:
-                        for label, value in zip(labels, v):
-                            polar[label].append(value)
-            p.terminate()
+                polar = merge_polar(polar, polar_thread.get(timeout=1000))
         except KeyboardInterrupt:
-            print('control-c pressed')
-            p.terminate()
-            raise Exception("Simulation Terminated by user")
-        else:
-            p.close()
-        p.join()
+            close_pool(terminate=True)
+            raise
     else:
+        worker = XfoilWorker()
         for a in alpha:
             start_time = time.time()
             logger.info("alpha={:4.2f}".format(a)), 
-            results = get_polar(airfoil, a, Re, Mach, normalize, iterlim, gen_naca)
+            results = worker.polar(airfoil, [a], Re, Mach, normalize, iterlim, gen_naca)
             if results is not None:
                 logger.info("Simulation took {:4.2f} seconds".format(time.time() - start_time))
-                labels = results[1]
-                values = results[0]
-                
-                if (polar is None):
-                    polar = {}
-                    for label in labels:
-                        polar[label] = []
-                
-                for v in values:
-                    for label, value in zip(labels, v):
-                        polar[label].append(value)
+                polar = merge_polar(polar, results)
+        worker.close()
     return polar
 
+def get_polar_sweep(airfoil, alpha, Re, Mach=None,
+             normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+    """
+    Polar for a range of alpha from one warm-started XFOIL session.
+    The timeout is for the whole sweep, not for each angle of attack.
+    """
+    if (Mach is not None):
+        if Mach > 1.0:
+            raise ValueError("Mach number ({}) exceeds 1.0".format(Mach))
+
+    p = get_pool()
+    try:
+        results = p.submit_sweep(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout, ncrit).get()
+    except KeyboardInterrupt:
+        close_pool(terminate=True)
+        raise
+    return merge_polar(None, results)
+
+def get_polar_sweeps(airfoil, jobs,
+             normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+    """
+    Polars for a list of (alpha, Re, Mach) jobs on one airfoil. The jobs are
+    split into contiguous chunks, one per worker, and each worker loads the
+    geometry once for its whole chunk. Returns a list of polars in job order,
+    None for a sweep that timed out.
+    """
+    return get_polar_sweeps_batch([(airfoil, jobs, iterlim, ncrit)], normalize, gen_naca, timeout)[0]
+
+def get_polar_sweeps_batch(batches, normalize=True, gen_naca=False, timeout=120):
+    """
+    Polars for several airfoils at once. Each batch is (airfoil, jobs, iterlim,
+    ncrit) with a list of (alpha, Re, Mach) jobs. Every job is queued on the
+    pool before any result is waited for, with the workers shared between the
+    airfoils in proportion to their number of jobs. Returns a list of polars
+    (in job order) for each batch, with the seconds each sweep took as 'elapsed'.
+    """
+    for airfoil, jobs, iterlim, ncrit in batches:
+        for alpha, Re, Mach in jobs:
+            if (Mach is not None):
+                if Mach > 1.0:
+                    raise ValueError("Mach number ({}) exceeds 1.0".format(Mach))
+
+    p = get_pool()
+    n_jobs = sum([len(jobs) for airfoil, jobs, iterlim, ncrit in batches])
+    polars = []
+    try:
+        resultLists = []
+        for airfoil, jobs, iterlim, ncrit in batches:
+            n_chunks = int(np.ceil(p.processes * len(jobs) / max(n_jobs, 1)))
+            chunks = [c for c in np.array_split(np.arange(len(jobs)), n_chunks) if len(c) > 0]
+            resultLists.append([p.submit_sweeps(airfoil, [jobs[i] for i in c], normalize, iterlim, gen_naca, timeout, ncrit)
+                                for c in chunks])
+        for resultList in resultLists:
+            batch = []
+            for polar_thread in resultList:
+                for results in polar_thread.get():
+                    polar = merge_polar(None, results)
+                    if polar is not None:
+                        polar['elapsed'] = results[3]
+                    batch.append(polar)
+            polars.append(batch)
+    except KeyboardInterrupt:
+        close_pool(terminate=True)
+        raise
+    return polars
+
 def parse_stdout_polar(lines):
-    """Converts polar 'PLIS' data to array"""    
-    def clean_split(s): return re.split('\s+', s.replace('\n',''))[1:]
-    # Find location of data from ---- divider
-    for i, line in enumerate(lines):
-        if re.match('\s*---', line):
-            dividerIndex = i
-    
+    """
+    Converts polar 'PLIS' data to a structured array with one field per
+    column (alpha, CL, CD, CDp, CM, Top_Xtr, Bot_Xtr).
+    Returns the array, the column names and a dictionary of the polar settings.
+    """
+    # Find location of data from the last ---- divider
+    dividerIndex = len(lines) - 1
+    while not lines[dividerIndex].lstrip().startswith('---'):
+        dividerIndex -= 1
+
     # What columns mean
-    data_header = clean_split(lines[dividerIndex-1])
-    logger.info(data_header)
+    data_header = lines[dividerIndex-1].split()
+    logger.debug(data_header)
 
     # Clean info lines
     info = ''.join(lines[dividerIndex-4:dividerIndex-2])
-    info = re.sub("[\r\n\s]","", info)
+    info = re.sub(r"[\r\n\s]","", info)
     # Parse info with regular expressions
     def p(s): return float(re.search(s, info).group(1))
     infodict = {
-     'xtrf_top': p("xtrf=(\d+\.\d+)"),
-     'xtrf_bottom': p("\(top\)(\d+\.\d+)\(bottom\)"),
-     'Mach': p("Mach=(\d+\.\d+)"),
-     'Ncrit': p("Ncrit=(\d+\.\d+)"),
-     'Re': p("Re=(\d+\.\d+e\d+)")
+     'xtrf_top': p(r"xtrf=(\d+\.\d+)"),
+     'xtrf_bottom': p(r"\(top\)(\d+\.\d+)\(bottom\)"),
+     'Mach': p(r"Mach=(\d+\.\d+)"),
+     'Ncrit': p(r"Ncrit=(\d+\.\d+)"),
+     'Re': p(r"Re=(\d+\.\d+e\d+)")
     }
 
-    # Extract, clean, convert to array
-    datalines = lines[dividerIndex+1:-2]
-    logger.info(datalines)
-    data_array = np.array(
-    [clean_split(dataline) for dataline in datalines], dtype='float')
+    # The numeric block runs from the divider to the first line that is not a row of numbers
+    end = dividerIndex + 1
+    while end < len(lines) and _is_number(lines[end].split()[0:1]):
+        end += 1
+    block = ''.join(lines[dividerIndex+1:end])
+    logger.debug(block)
+
+    # Convert the whole block in one call, then view it as one field per column.
+    n_cols = len(data_header)
+    values = np.fromstring(block, sep=' ') if block else np.zeros(0)
+    if values.size != (end - dividerIndex - 1)*n_cols:
+        raise ValueError("Malformed PLIS polar data")
+    dtype = np.dtype([(label, np.float64) for label in data_header])
+    data_array = np.ascontiguousarray(values.reshape(-1, n_cols)).view(dtype).reshape(-1)
 
     return data_array, data_header, infodict
 
+def _is_number(words):
+    try:
+        float(words[0])
+        return True
+    except (ValueError, IndexError):
+        return False
+
 
 class Xfoil():
     """
@@ -254,10 +647,9 @@ class Xfoil():
     
     def __init__(self, path="/usr/bin"):
         """Spawn xfoil child process"""
-        xf = "/usr/local/bin/xfoil"
-        #xf = "/home/tim/github/xfoil/build/src/xfoil"
-        self.xfinst = subp.Popen(xf,
-                  stdin=subp.PIPE, stdout=subp.PIPE, stderr=subp.PIPE)
+        self.xfinst = subp.Popen(XFOIL,
+                  stdin=subp.PIPE, stdout=subp.PIPE, stderr=subp.PIPE,
+                  universal_newlines=True)
         self._stdoutnonblock = NonBlockingStreamReader(self.xfinst.stdout)
         self._stdin = self.xfinst.stdin
         self._stderr = self.xfinst.stderr
@@ -267,10 +659,11 @@ class Xfoil():
         n = '\n' if autonewline else ''
         #print (cmd + n),
         self.xfinst.stdin.write(cmd + n)
+        self.xfinst.stdin.flush()
 
-    def readline(self):
-        """Read one line, returns None if empty"""
-        return self._stdoutnonblock.readline()
+    def readline(self, timeout=None):
+        """Read one line, returns None if empty (or nothing arrives within timeout)"""
+        return self._stdoutnonblock.readline(timeout)
 
     def close(self):
         #print "Xfoil: instance closed through .close()"
@@ -326,7 +719,7 @@ class NonBlockingStreamReader:
     def readline(self, timeout = None):
         try:
             if timeout is not None:
-                return self._q.get(block = True, timeout = timeout)
+                return self._q.get(block = True, timeout = max(timeout, 0.0))
             else:
                 return self._q.get(block = False)
 
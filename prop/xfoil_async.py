@@ -0,0 +1,220 @@
+"""
+Event driven XFOIL client built on asyncio subprocesses.
+
+Where xfoil.Xfoil needs a reader thread per process and a worker process per
+XFOIL instance, here a single event loop awaits the stdout of any number of
+XFOIL processes. Markers such as "Point added to stored polar" and the ENDD
+end marker are detected as soon as the line arrives, and timeouts are enforced
+with asyncio.wait_for instead of by polling.
+
+    import xfoil_async
+    polar = asyncio.run(xfoil_async.polar("NACA 2215", [0, 2, 4], 5E4, gen_naca=True))
+
+The XFOIL command sequences are shared with xfoil.XfoilWorker.
+"""
+
+import asyncio
+import re
+
+import numpy as np
+
+import xfoil
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncProcess():
+    """
+    An XFOIL child process with asyncio pipes. Like xfoil.Xfoil this only
+    implements direct actions on the process.
+    """
+
+    def __init__(self, proc):
+        self.proc = proc
+
+    @staticmethod
+    async def spawn():
+        proc = await asyncio.create_subprocess_exec(xfoil.XFOIL,
+                  stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                  stderr=asyncio.subprocess.DEVNULL)
+        return AsyncProcess(proc)
+
+    def cmd(self, cmd, autonewline=True):
+        """Give a command. Set newline=False for manual control with '\n'"""
+        n = '\n' if autonewline else ''
+        self.proc.stdin.write((cmd + n).encode())
+
+    async def readline(self):
+        """Wait for one line of output"""
+        await self.proc.stdin.drain()
+        line = await self.proc.stdout.readline()
+        if not line:
+            raise xfoil.UnexpectedEndOfStream()
+        return line.decode(errors='replace')
+
+    async def close(self):
+        """Kill the process, and wait for it while the event loop is running"""
+        if self.proc.returncode is None:
+            self.proc.kill()
+        await self.proc.wait()
+
+
+class AsyncXfoil(xfoil.XfoilWorker):
+    """
+    A warm XFOIL process driven from an event loop. The menu handling (load
+    and oper) is inherited from XfoilWorker, only the waiting is asynchronous.
+    """
+
+    async def spawn(self):
+        self.xf = await AsyncProcess.spawn()
+        self.viscous = False
+        self.normalized = False
+        self.loaded = None
+        if (not self.debug):
+            # Disable G(raphics) flag in Plotting options
+            self.xf.cmd("PLOP\nG\n\n", autonewline=False)
+
+    async def close(self):
+        if self.xf is not None:
+            await self.xf.close()
+            self.xf = None
+
+    async def respawn(self):
+        await self.close()
+        await self.spawn()
+
+    async def _alfa(self, a):
+        self.xf.cmd("ALFA {:.3f}".format(a))
+        while True:
+            line = await self.xf.readline()
+            if re.search("Point added to stored polar", line):
+                return
+            elif re.search("VISCAL:  Convergence failed", line):
+                logger.info("Convergence failed a={:4.2f}. Trying harder!".format(a))
+                self.xf.cmd("!")
+
+    async def _plis(self):
+        output = ['']
+        self.xf.cmd("PLIS\nENDD\n", autonewline=False)
+        while not re.search("ENDD", output[-1]):
+            output.append(await self.xf.readline())
+        self.xf.cmd("PACC\nPDEL 0\n\n", autonewline=False)
+        return xfoil.parse_stdout_polar(output)
+
+    async def polar(self, airfoil, alpha, Re, Mach=None,
+                    normalize=True, iterlim=None, gen_naca=False, timeout=10):
+        """
+        Return the PLIS polar for a list of angles of attack. Each angle has its
+        own timeout. Angles that time out are dropped, and the process is
+        respawned to run the rest.
+        """
+        alpha = list(alpha)
+        while True:
+            if self.xf is None:
+                await self.spawn()
+            self.load(airfoil, normalize=normalize, gen_naca=gen_naca)
+            self.oper(Re, Mach, iterlim)
+            failed = None
+            try:
+                for a in alpha:
+                    failed = a
+                    await asyncio.wait_for(self._alfa(a), timeout)
+                failed = None
+                return await asyncio.wait_for(self._plis(), timeout)
+            except (asyncio.TimeoutError, xfoil.UnexpectedEndOfStream):
+                logger.warning("Simulation Terminated!. a={} taking too long".format(failed))
+                await self.respawn()
+                if failed is None:
+                    return None
+                alpha.remove(failed)
+
+    async def sweep(self, airfoil, alpha, Re, Mach=None,
+                    normalize=True, iterlim=None, gen_naca=False, timeout=120, ncrit=6):
+        """
+        Return the PLIS polar for a warm-started sweep (see XfoilWorker.sweep).
+        The timeout applies to the whole sweep.
+        """
+        alpha = np.sort(np.asarray(alpha, dtype=float))
+        upper = alpha[alpha >= 0]
+        lower = alpha[alpha < 0][::-1]
+
+        if self.xf is None:
+            await self.spawn()
+        self.load(airfoil, normalize=normalize, gen_naca=gen_naca)
+        self.oper(Re, Mach, iterlim, ncrit)
+        for branch in [upper, lower]:
+            if len(branch) > 0:
+                self.xf.cmd("INIT")
+                self.xf.cmd(xfoil.sweep_commands(branch))
+        try:
+            data, header, info = await asyncio.wait_for(self._plis(), timeout)
+        except (asyncio.TimeoutError, xfoil.UnexpectedEndOfStream):
+            logger.warning("Sweep Re={} Mach={} taking too long".format(Re, Mach))
+            await self.respawn()
+            return None
+        if len(data) > 0:
+            data = data[np.argsort(data['alpha'])]
+        return data, header, info
+
+
+async def polar(airfoil, alpha, Re, Mach=None,
+                normalize=True, iterlim=None, gen_naca=False, timeout=10, sweep=False):
+    """
+    Polar for the angles of attack in alpha, from a dedicated XFOIL process.
+    Returns the same dictionary of columns as xfoil.get_polars().
+    """
+    if (Mach is not None):
+        if Mach > 1.0:
+            raise ValueError("Mach number ({}) exceeds 1.0".format(Mach))
+    client = AsyncXfoil()
+    try:
+        if sweep:
+            results = await client.sweep(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout)
+        else:
+            results = await client.polar(airfoil, alpha, Re, Mach, normalize, iterlim, gen_naca, timeout)
+    finally:
+        await client.close()
+    return xfoil.merge_polar(None, results)
+
+
+async def polars(jobs, processes=None, sweep=True):
+    """
+    Run a list of jobs on N concurrent XFOIL processes from one event loop.
+    Each job is a dictionary of keyword arguments for AsyncXfoil.sweep (or
+    AsyncXfoil.polar if sweep is False). Returns the polars in job order.
+    """
+    processes = processes or xfoil.cpu_count()
+    queue = asyncio.Queue()
+    for i, job in enumerate(jobs):
+        queue.put_nowait((i, job))
+    results = [None]*len(jobs)
+
+    async def run(client):
+        try:
+            while not queue.empty():
+                i, job = queue.get_nowait()
+                if sweep:
+                    ret = await client.sweep(**job)
+                else:
+                    ret = await client.polar(**job)
+                results[i] = xfoil.merge_polar(None, ret)
+        finally:
+            await client.close()
+
+    await asyncio.gather(*[run(AsyncXfoil()) for i in range(min(processes, len(jobs)))])
+    return results
+
+
+def run_polars(jobs, processes=None, sweep=True):
+    """ Blocking wrapper around polars() """
+    return asyncio.run(polars(jobs, processes, sweep))
+
+
+if __name__ == "__main__":
+    p = asyncio.run(polar("NACA 2215", np.arange(-30, 30, 3), 5E4, Mach=.06, gen_naca=True, sweep=True))
+    print(p['CL'])
+    jobs = [dict(airfoil="NACA 2215", alpha=np.arange(-30, 30, 1.0), Re=re, Mach=.06, gen_naca=True)
+            for re in np.geomspace(3e4, 2e6, 8)]
+    for p in run_polars(jobs):
+        print(len(p['alpha']))